@@ -30,21 +30,16 @@ import typing
 from requests import get
 
 
-def get_wikidata_item_tree_item_idsSPARQL(root_items: typing.Iterable[int],
-                                          forward_properties: typing.Optional[typing.Iterable[int]]=None,
-                                          backward_properties: typing.Optional[typing.Iterable[int]]=None)\
-        -> typing.List[int]:
-    """Return ids of WikiData items, which are in the tree spanned by the given root items and claims relating them
-        to other items.
+SPARQL_URL = 'https://query.wikidata.org/bigdata/namespace/wdq/sparql'
 
-    :param root_items: iterable[int] One or multiple item entities that are the root elements of the tree
-    :param forward_properties: iterable[int] | None property-claims to follow forward; that is, if root item R has
-        a claim P:I, and P is in the list, the search will branch recursively to item I as well.
-    :param backward_properties: iterable[int] | None property-claims to follow in reverse; that is, if (for a root
-        item R) an item I has a claim P:R, and P is in the list, the search will branch recursively to item I as well.
-    :return: iterable[int]: List with ids of WikiData items in the tree
-    """
 
+def get_wikidata_item_tree_query(root_items: typing.Iterable[int],
+                                 forward_properties: typing.Optional[typing.Iterable[int]]=None,
+                                 backward_properties: typing.Optional[typing.Iterable[int]]=None) -> str:
+    """Builds the SPARQL query of get_wikidata_item_tree_item_idsSPARQL
+
+    :return: query <class 'string'>
+    """
     query = '''PREFIX wikibase: <http://wikiba.se/ontology#>
             PREFIX wd: <http://www.wikidata.org/entity/>
             PREFIX wdt: <http://www.wikidata.org/prop/direct/>
@@ -59,19 +54,47 @@ def get_wikidata_item_tree_item_idsSPARQL(root_items: typing.Iterable[int],
                     ?WD_id (wdt:P%s)* wd:Q%s .
                     }'''%(','.join(map(str, backward_properties)), ','.join(map(str, root_items)))
     #print(query)
+    return query
+
 
-    url = 'https://query.wikidata.org/bigdata/namespace/wdq/sparql'
+def get_wikidata_item_ids(data: typing.Dict[str, object]) -> typing.List[int]:
+    """Reads the item ids of a SPARQL json result (variable WD_id)
+
+    :param data: json result <class 'dict'>
+    :return: list with the ids (list of int)
+    """
+    ids = []
+    for item in data['results']['bindings']:
+        this_id=item["WD_id"]["value"].split("/")[-1].lstrip("Q")
+        try:
+            this_id = int(this_id)
+            ids.append(this_id)
+        except ValueError:
+            print("ERROR\tWikidata Processor:get_wikidata_item_tree_item_idsSPARQL\tCould not convert data to an integer.", this_id)
+    return ids
+
+
+def get_wikidata_item_tree_item_idsSPARQL(root_items: typing.Iterable[int],
+                                          forward_properties: typing.Optional[typing.Iterable[int]]=None,
+                                          backward_properties: typing.Optional[typing.Iterable[int]]=None)\
+        -> typing.List[int]:
+    """Return ids of WikiData items, which are in the tree spanned by the given root items and claims relating them
+        to other items.
+
+    :param root_items: iterable[int] One or multiple item entities that are the root elements of the tree
+    :param forward_properties: iterable[int] | None property-claims to follow forward; that is, if root item R has
+        a claim P:I, and P is in the list, the search will branch recursively to item I as well.
+    :param backward_properties: iterable[int] | None property-claims to follow in reverse; that is, if (for a root
+        item R) an item I has a claim P:R, and P is in the list, the search will branch recursively to item I as well.
+    :return: iterable[int]: List with ids of WikiData items in the tree
+    """
+    query = get_wikidata_item_tree_query(root_items, forward_properties, backward_properties)
+    url = SPARQL_URL
 
     ids = []
     try:
         data = get(url, params={'query': query, 'format': 'json'}).json()
-        for item in data['results']['bindings']:
-            this_id=item["WD_id"]["value"].split("/")[-1].lstrip("Q")
-            try:
-                this_id = int(this_id)
-                ids.append(this_id)
-            except ValueError:
-                print("ERROR\tWikidata Processor:get_wikidata_item_tree_item_idsSPARQL\tCould not convert data to an integer.", this_id)
+        ids = get_wikidata_item_ids(data)
     except Exception as e:
         print(f"ERROR\tException occurred while trying to get data (url: {url} query {query})\nException: {e}")
     return ids
\ No newline at end of file
@@ -0,0 +1,636 @@
+#! /usr/bin/env python3
+# This Python file uses the following encoding: utf-8
+
+#############################################################################
+#  NECKAr: asyncio driver mode                                              #
+#    async API of the stages for asyncio applications, on the async        #
+#    MongoDB driver motor and on aiohttp for the SPARQL queries:            #
+#      async with AsyncDriver(config) as driver:                            #
+#          await ingest(driver, config)                                     #
+#          await classify(driver, config)                                   #
+#          await create_LODlists(driver, config)                            #
+#    the stage code of the sync entry points (NECKAr_main.search,          #
+#    create_LOD_lists.create_LODlist, ...) runs unchanged in executor       #
+#    threads on BlockingStore, a store facade handing the reads and writes #
+#    to the event loop:                                                     #
+#      - each cursor is read by a task keeping up to prefetch batches       #
+#        queued ahead, the BSON batches are decoded in the executor thread  #
+#      - a bulk write waits for its own result, so the retries and the     #
+#        quarantine of NECKAr_bulk.BulkWriter see its error; the bulk       #
+#        writers of a store write up to write_concurrency batches at once   #
+#    so the outputs are the same as those of the sync entry points and the #
+#    event loop is never blocked by the extraction.                         #
+#    needs [Database] backend mongo and the packages motor and aiohttp      #
+#############################################################################
+
+import argparse
+import asyncio
+import concurrent.futures
+import configparser
+import itertools
+import time
+import typing
+import aiohttp
+import bson
+import pymongo
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import InsertOne, ReplaceOne, UpdateMany
+import NECKAr_main
+import NECKAr_bulk as bulk
+import NECKAr_classindex as classindex
+import NECKAr_membership as membership
+import NECKAr_metrics as metrics
+import NECKAr_profiling as profiling
+import NECKAr_taxonomy as taxonomy
+import WD2DB
+import create_LOD_lists
+from NECKAr_WikidataAPI import SPARQL_URL, get_wikidata_item_ids, get_wikidata_item_tree_query
+from NECKAr_metrics import METRICS, record_fetch
+from NECKAr_storage import IN_CHUNK_SIZE, MongoStore, P31_PATH, first_selected, instance_projection, join_pipeline, \
+    partition_class_ids, read_credentials
+
+# marks the end of a cursor
+_END = object()
+STAGES = ["ingest", "classify", "lod"]
+
+
+def print_info(info):
+    print("INFO\tNECKAr ASYNC:\t", info)
+
+
+def read_async_options(config: configparser.ConfigParser) -> typing.Dict[str, int]:
+    """Reads the section Async of the configuration file NECKAr.cfg
+
+    :param config: ConfigParser Object
+    :return: options <class 'dict'>
+    """
+    return {"workers": config.getint('Async', 'workers', fallback=4),
+            "prefetch": config.getint('Async', 'prefetch', fallback=4),
+            "batch_size": config.getint('Async', 'batch_size', fallback=1000),
+            "write_concurrency": config.getint('Async', 'write_concurrency', fallback=4),
+            "sparql_concurrency": config.getint('Async', 'sparql_concurrency', fallback=4)}
+
+
+class AsyncMongoStore(object):
+    """Store backed by a motor collection, the async counterpart of NECKAr_storage.MongoStore (same methods as
+    coroutines and async generators)
+
+    :param collection: motor collection
+    :param key: field identifying an entry <class 'string'>
+    """
+
+    def __init__(self, collection, key: str = "id"):
+        self.collection = collection
+        self.key = key
+        self.name = collection.name
+        self.database_name = collection.database.name
+
+    async def scan_pages(self, where=None, exists=None, exists_any=None, projection=None, page_size=1000, limit=0):
+        """Streams all matching documents in pages ordered by _id (see MongoStore.scan_pages)"""
+        drop_id = projection is not None and not projection.get("_id", 1)
+        if drop_id:
+            projection = dict(projection)
+            del projection["_id"]
+        last_id = None
+        count = 0
+        while not limit or count < limit:
+            size = min(page_size, limit - count) if limit else page_size
+            query = MongoStore._query(where, exists, exists_any)
+            if last_id is not None:
+                query["_id"] = {"$gt": last_id}
+            start = time.perf_counter()
+            page = await self.collection.find(query, projection).sort("_id", pymongo.ASCENDING).limit(size) \
+                .to_list(None)
+            record_fetch(self.name, time.perf_counter() - start, None, None, len(page))
+            if not page:
+                return
+            count += len(page)
+            last_id = page[-1]["_id"]
+            if drop_id:
+                for doc in page:
+                    del doc["_id"]
+            yield page
+
+    async def find_instance_batches(self, class_ids: typing.List[int], projection=None, batch_size: int = 1000):
+        """Streams all items that are an instance (P31) of one of the given classes as raw BSON batches, decoding is
+        left to the caller (see MongoStore.find_instances)
+
+        :param class_ids: numeric ids of the classes (list of int)
+        :param projection: projection <class 'dict'> | None
+        :param batch_size: number of items per batch <class 'int'>
+        :return: async generator of (BSON batch, fetch seconds)
+        """
+        condition = class_ids[0] if len(class_ids) == 1 else {"$in": list(class_ids)}
+        cursor = self.collection.find_raw_batches({"$and": [{"type": "item"}, {P31_PATH: condition}]}, projection,
+                                                  no_cursor_timeout=True, batch_size=batch_size)
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    batch = await cursor.next()
+                except StopAsyncIteration:
+                    return
+                yield batch, time.perf_counter() - start
+        finally:
+            await cursor.close()
+
+    async def join_pages(self, membership_store: "AsyncMongoStore", class_root: int, projection=None,
+                         page_size: int = 1000):
+        """Streams the classes materialized under class_root in the membership store, each joined with one of its
+        items, in pages (see MongoStore.join_instances)
+
+        :param membership_store: membership store of the same database <class 'AsyncMongoStore'>
+        :param class_root: root of the selection <class 'int'>
+        :param projection: projection of the items <class 'dict'> | None
+        :param page_size: number of documents per page <class 'int'>
+        :return: async generator of lists of {"q_id": class id, "item": item} documents
+        """
+        if not isinstance(membership_store, AsyncMongoStore) or \
+                membership_store.database_name != self.database_name:
+            raise ValueError("join needs both collections in the same MongoDB database")
+        cursor = membership_store.collection.aggregate(join_pipeline(self.name, class_root, projection),
+                                                       allowDiskUse=True, batchSize=page_size)
+        while True:
+            start = time.perf_counter()
+            page = await cursor.to_list(page_size)
+            record_fetch(self.name, time.perf_counter() - start, None, None, len(page))
+            if not page:
+                return
+            yield page
+
+    async def lookup_pages(self, other: "AsyncMongoStore", as_field: str, exists=None, projection=None,
+                           page_size=1000, limit=0):
+        """Streams the matching documents in pages ordered by _id, each joined with the documents of another store
+        of the same database (see MongoStore.lookup_pages)"""
+        if not isinstance(other, AsyncMongoStore) or other.database_name != self.database_name:
+            raise ValueError("lookup needs both collections in the same MongoDB database")
+        last_id = None
+        count = 0
+        while not limit or count < limit:
+            size = min(page_size, limit - count) if limit else page_size
+            query = MongoStore._query(None, exists)
+            if last_id is not None:
+                query["_id"] = {"$gt": last_id}
+            pipeline = [{"$match": query}, {"$sort": {"_id": 1}}, {"$limit": size},
+                        {"$lookup": {"from": other.name, "localField": self.key, "foreignField": other.key,
+                                     "as": as_field}}]
+            if projection:
+                pipeline.append({"$project": projection})
+            page = await self.collection.aggregate(pipeline, allowDiskUse=True).to_list(None)
+            if not page:
+                return
+            count += len(page)
+            last_id = page[-1]["_id"]
+            yield page
+
+    async def get(self, value, projection=None):
+        return await self.collection.find_one({self.key: value}, projection)
+
+    async def get_many(self, values: typing.List[object], projection=None) \
+            -> typing.Dict[object, typing.Dict[str, object]]:
+        if projection is not None and not projection.get(self.key):
+            projection = dict(projection, **{self.key: 1})
+        docs = await self.collection.find({self.key: {"$in": list(values)}}, projection).to_list(None)
+        return {doc[self.key]: doc for doc in docs}
+
+    async def insert_many(self, docs: typing.List[typing.Dict[str, object]]):
+        if docs:
+            with METRICS.timer("bulk_write_seconds", store=self.name, op="insert"):
+                await self.collection.bulk_write([InsertOne(doc) for doc in docs], ordered=False)
+            METRICS.inc("bulk_docs_total", len(docs), store=self.name, op="insert")
+
+    async def replace_many(self, docs: typing.List[typing.Dict[str, object]]):
+        if docs:
+            with METRICS.timer("bulk_write_seconds", store=self.name, op="replace"):
+                await self.collection.bulk_write([ReplaceOne({self.key: doc[self.key]}, doc, upsert=True)
+                                                  for doc in docs], ordered=False)
+            METRICS.inc("bulk_docs_total", len(docs), store=self.name, op="replace")
+
+    async def update_many(self, updates: typing.Dict[object, typing.Dict[str, object]]):
+        if updates:
+            await self.collection.bulk_write([UpdateMany({self.key: value}, {"$set": fields})
+                                              for value, fields in updates.items()], ordered=False)
+
+    async def delete(self, where=None) -> int:
+        return (await self.collection.delete_many(where or {})).deleted_count
+
+    async def delete_many(self, values: typing.List[object], where=None) -> int:
+        values = list(values)
+        deleted = 0
+        for start in range(0, len(values), IN_CHUNK_SIZE):
+            query = dict(where or {}, **{self.key: {"$in": values[start:start + IN_CHUNK_SIZE]}})
+            deleted += (await self.collection.delete_many(query)).deleted_count
+        return deleted
+
+    async def count(self, where=None) -> int:
+        return await self.collection.count_documents(where or {})
+
+    async def ensure_index(self, fields: typing.List[str], partial_exists: typing.Optional[str] = None,
+                           name: typing.Optional[str] = None):
+        options = {}
+        if partial_exists:
+            options["partialFilterExpression"] = {partial_exists: {"$exists": True}}
+        if name:
+            options["name"] = name
+        await self.collection.create_index([(field, pymongo.ASCENDING) for field in fields], **options)
+
+
+class AsyncWrites(object):
+    """Bulk writes running as tasks on the event loop, at most concurrency at a time; an error of a write is raised
+    by the next submit or by join
+
+    :param concurrency: number of writes in flight <class 'int'>
+    """
+
+    def __init__(self, concurrency: int = 4):
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._tasks = set()
+        self.error = None
+
+    def _done(self, task: asyncio.Task):
+        self._semaphore.release()
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self.error = self.error or task.exception()
+
+    async def submit(self, coroutine: typing.Awaitable):
+        """Starts a write, waits while concurrency writes are in flight"""
+        if self.error is not None:
+            coroutine.close()
+            raise self.error
+        await self._semaphore.acquire()
+        task = asyncio.ensure_future(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._done)
+
+    async def join(self):
+        """Waits for all writes in flight"""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self.error is not None:
+            raise self.error
+
+
+class BlockingStore(object):
+    """Store interface of NECKAr_storage for the stage code running in an executor thread, the operations run on
+    the event loop (must not be used from the thread of the loop)
+
+    :param store: store <class 'AsyncMongoStore'>
+    :param loop: event loop of the store
+    :param prefetch: number of cursor batches or pages read ahead <class 'int'>
+    :param batch_size: number of items per cursor batch of find_instances <class 'int'>
+    :param write_concurrency: number of batches the bulk writers of the store write at the same time <class 'int'>
+    """
+
+    def __init__(self, store: AsyncMongoStore, loop: asyncio.AbstractEventLoop, prefetch: int = 4,
+                 batch_size: int = 1000, write_concurrency: int = 4):
+        self.store = store
+        self.loop = loop
+        self.prefetch = prefetch
+        self.batch_size = batch_size
+        self.key = store.key
+        self.name = store.name
+        self.database_name = store.database_name
+        # concurrency of the bulk writers of the store (see NECKAr_bulk.BulkWriter)
+        self.write_concurrency = write_concurrency
+
+    def _call(self, coroutine: typing.Awaitable):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def _iterate(self, generator: typing.AsyncIterator) -> typing.Iterator:
+        """Iterates an async generator, a task on the loop keeps up to prefetch items queued ahead"""
+        queue = asyncio.Queue(self.prefetch)
+
+        async def produce():
+            try:
+                async for item in generator:
+                    await queue.put((item, None))
+                await queue.put((_END, None))
+            except Exception as e:
+                await queue.put((_END, e))
+            finally:
+                await generator.aclose()
+
+        producer = asyncio.run_coroutine_threadsafe(produce(), self.loop)
+        try:
+            while True:
+                (item, error) = self._call(queue.get())
+                if error is not None:
+                    raise error
+                if item is _END:
+                    return
+                yield item
+        finally:
+            # the loop ended early (break, error): the task stops reading the cursor
+            producer.cancel()
+
+    def scan_pages(self, where=None, exists=None, exists_any=None, projection=None, page_size=1000, limit=0):
+        return self._iterate(self.store.scan_pages(where, exists, exists_any, projection, page_size, limit))
+
+    def scan(self, where=None, exists=None, exists_any=None, projection=None, page_size=1000, limit=0):
+        for page in self.scan_pages(where, exists, exists_any, projection, page_size, limit):
+            yield from page
+
+    def find_instances(self, class_ids: typing.List[int], projection=None, chunk_size: int = IN_CHUNK_SIZE,
+                       class_root: typing.Optional[int] = None,
+                       related: typing.Optional[typing.Dict[int, typing.List[int]]] = None):
+        ranges = partition_class_ids(class_ids, chunk_size)
+        if len(ranges) <= 1:
+            yield from self._find_instances(class_ids, projection)
+            return
+        selected = set(class_ids)
+        for ids in ranges:
+            for item in self._find_instances(ids, instance_projection(projection)):
+                if first_selected(item, selected) >= ids[0]:
+                    yield item
+
+    def _find_instances(self, class_ids: typing.List[int], projection=None):
+        for (batch, fetch_seconds) in self._iterate(self.store.find_instance_batches(class_ids, projection,
+                                                                                     self.batch_size)):
+            start = time.perf_counter()
+            docs = bson.decode_all(batch)
+            record_fetch(self.name, fetch_seconds, time.perf_counter() - start, len(batch), len(docs))
+            yield from docs
+
+    def join_instances(self, membership_store: "BlockingStore", class_root: int, class_ids: typing.List[int],
+                       projection=None):
+        selected = set(class_ids)
+        for page in self._iterate(self.store.join_pages(getattr(membership_store, "store", membership_store),
+                                                        class_root, projection, self.batch_size)):
+            for doc in page:
+                if first_selected(doc["item"], selected) == doc["q_id"]:
+                    yield doc["item"]
+
+    def lookup_pages(self, other: "BlockingStore", as_field: str, exists=None, projection=None, page_size=1000,
+                     limit=0):
+        return self._iterate(self.store.lookup_pages(getattr(other, "store", other), as_field, exists, projection,
+                                                     page_size, limit))
+
+    def get(self, value, projection=None):
+        return self._call(self.store.get(value, projection))
+
+    def get_many(self, values: typing.List[object], projection=None) -> typing.Dict[object, typing.Dict[str, object]]:
+        return self._call(self.store.get_many(values, projection))
+
+    def insert_many(self, docs: typing.List[typing.Dict[str, object]]):
+        self._call(self.store.insert_many(docs))
+
+    def replace_many(self, docs: typing.List[typing.Dict[str, object]]):
+        self._call(self.store.replace_many(docs))
+
+    def update_many(self, updates: typing.Dict[object, typing.Dict[str, object]]):
+        self._call(self.store.update_many(updates))
+
+    def delete(self, where=None) -> int:
+        return self._call(self.store.delete(where))
+
+    def delete_many(self, values: typing.List[object], where=None) -> int:
+        return self._call(self.store.delete_many(values, where))
+
+    def count(self, where=None) -> int:
+        return self._call(self.store.count(where))
+
+    def ensure_index(self, fields: typing.List[str], partial_exists: typing.Optional[str] = None,
+                     name: typing.Optional[str] = None):
+        self._call(self.store.ensure_index(fields, partial_exists, name))
+
+
+class AsyncDriver(object):
+    """motor client and executor of the async entry points (section Database and Async of NECKAr.cfg)
+
+    :param config: ConfigParser Object
+    """
+
+    def __init__(self, config: configparser.ConfigParser):
+        backend = config.get('Database', 'backend', fallback='mongo')
+        if backend != "mongo":
+            raise ValueError("the asyncio driver mode needs the storage backend mongo, not " + backend)
+        self.client = AsyncIOMotorClient(config.get('Database', 'host'), config.getint('Database', 'port'),
+                                         **read_credentials(config))
+        self.options = read_async_options(config)
+        self.executor = concurrent.futures.ThreadPoolExecutor(self.options["workers"],
+                                                              thread_name_prefix="NECKAr async")
+
+    async def __aenter__(self) -> "AsyncDriver":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.client.close()
+
+    def store(self, db_name: str, collection_name: str, key: str = "id") -> AsyncMongoStore:
+        return AsyncMongoStore(self.client[db_name][collection_name], key)
+
+    def blocking(self, store: AsyncMongoStore) -> BlockingStore:
+        """:return: facade of the store for the stage code in the executor (call from the event loop)"""
+        return BlockingStore(store, asyncio.get_running_loop(), self.options["prefetch"], self.options["batch_size"],
+                             self.options["write_concurrency"])
+
+    async def run(self, function: typing.Callable, *args, **kwargs):
+        """Runs stage code of the sync entry points in the executor"""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, lambda: function(*args, **kwargs))
+
+
+async def ingest(driver: AsyncDriver, config: configparser.ConfigParser, drop: bool = False) -> int:
+    """Loads the dump of NECKAr.cfg into the dump store and creates the indices (see WD2DB.ingest); the dump is
+    decoded in the executor while up to write_concurrency bulk inserts are in flight
+
+    :param driver: <class 'AsyncDriver'>
+    :param config: ConfigParser Object
+    :param drop: if True the dump store is emptied first <class 'bool'>
+    :return: number of inserted entities <class 'int'>
+    """
+    batch_size = config.getint('Dump', 'insert_batch_size', fallback=1000)
+    db_name, collection_name = config.get('Database', 'db_dump'), config.get('Database', 'collection_dump')
+    if drop:
+        await driver.client[db_name].drop_collection(collection_name)
+    collection = driver.store(db_name, collection_name)
+    items = WD2DB.iter_items(WD2DB.get_archive_file(config))
+    builder = classindex.IndexBuilder() if classindex.read_class_index_options(config)["enabled"] else None
+
+    def read():
+        batch = list(itertools.islice(items, batch_size))
+        if builder is not None:
+            for item in batch:
+                builder.add(item)
+        return batch
+
+    loop = asyncio.get_running_loop()
+    # the bz2 stream is read by one thread
+    with concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix="NECKAr async ingest") as reader:
+        writes = AsyncWrites(driver.options["write_concurrency"])
+        count = 0
+        while True:
+            batch = await loop.run_in_executor(reader, read)
+            if not batch:
+                break
+            await writes.submit(collection.insert_many(batch))
+            count += len(batch)
+            if count % 10**4 < batch_size:
+                print_info("ingest " + str(count) + " items read")
+        await writes.join()
+    print_info("ingest " + str(count) + " items inserted, creating indices")
+    for field in WD2DB.INDEX_FIELDS:
+        await collection.ensure_index([field])
+    if builder is not None:
+        index = classindex.ClassIndex(driver.blocking(driver.store(db_name, classindex.index_name(collection_name),
+                                                                   key="key")))
+        await driver.run(index.write, builder)
+    return count
+
+
+async def fetch_subclasses(session: aiohttp.ClientSession, root: int) -> typing.List[int]:
+    """Gets the subclass tree of a root class with a SPARQL query (see
+    NECKAr_WikidataAPI.get_wikidata_item_tree_item_idsSPARQL)
+
+    :return: ids of the classes (list of int), empty if the query failed
+    """
+    query = get_wikidata_item_tree_query([root], backward_properties=[279])
+    try:
+        async with session.get(SPARQL_URL, params={'query': query, 'format': 'json'}) as response:
+            return get_wikidata_item_ids(await response.json(content_type=None))
+    except Exception as e:
+        print(f"ERROR\tException occurred while trying to get data (url: {SPARQL_URL} query {query})\nException: {e}")
+        return []
+
+
+async def fetch_taxonomy(driver: AsyncDriver, config: configparser.ConfigParser, roots: typing.Iterable[int],
+                         refresh: bool = False) -> taxonomy.Taxonomy:
+    """Gets the subclass trees of the root classes (section Taxonomy of NECKAr.cfg, see NECKAr_taxonomy.from_config);
+    source sparql: up to sparql_concurrency queries in flight, source dump: the subclass graph is read in the executor
+
+    :param driver: <class 'AsyncDriver'>
+    :param config: ConfigParser Object
+    :param roots: ids of the root classes
+    :param refresh: if True existing artifacts are ignored and overwritten <class 'bool'>
+    :return: taxonomy with the trees of all roots <class 'NECKAr_taxonomy.Taxonomy'>
+    """
+    source = config.get('Taxonomy', 'source', fallback='sparql')
+    dump = None
+    if source == "dump":
+        dump = driver.blocking(driver.store(config.get('Database', 'db_dump'),
+                                            config.get('Database', 'collection_dump')))
+    tax = taxonomy.Taxonomy(config.get('Taxonomy', 'directory', fallback='../taxonomy') or None, source, refresh,
+                            dump)
+    roots = sorted(set(roots))
+    missing = [root for root in roots if not tax.cached(root)]
+    if source == "sparql" and missing:
+        semaphore = asyncio.Semaphore(driver.options["sparql_concurrency"])
+        async with aiohttp.ClientSession() as session:
+            async def fetch(root):
+                async with semaphore:
+                    return root, await fetch_subclasses(session, root)
+            for (root, ids) in await asyncio.gather(*(fetch(root) for root in missing)):
+                tax.add(root, ids)
+    await driver.run(tax.fetch_all, roots)
+    return tax
+
+
+def search_indexed(flag: str, config: configparser.ConfigParser, output_collection, input_collection, index_store,
+                   membership_store, joined_store, tax: typing.Optional[taxonomy.Taxonomy] = None):
+    """NECKAr_main.search on the dump store with the class index ([ClassIndex]) and the class membership
+    ([Membership]), runs in the executor"""
+    input_collection = classindex.from_config(config, input_collection, index_store)
+    NECKAr_main.search(flag, config, output_collection,
+                       membership.from_config(config, input_collection, membership_store, joined_store), tax)
+
+
+def get_search_flags(config: configparser.ConfigParser) -> typing.List[str]:
+    """:return: the [Search_Flags] flags switched on, in the order of NECKAr_main.SEARCH_FLAGS <class 'list'>"""
+    return [flag for flag in NECKAr_main.SEARCH_FLAGS if config.getboolean('Search_Flags', flag, fallback=False)]
+
+
+async def classify(driver: AsyncDriver, config: configparser.ConfigParser,
+                   flags: typing.Optional[typing.List[str]] = None,
+                   tax: typing.Optional[taxonomy.Taxonomy] = None):
+    """Classifies the entities of the dump store (see NECKAr_main), up to workers classes at the same time, and runs
+    the last step (NECKAr_main.finish)
+
+    :param driver: <class 'AsyncDriver'>
+    :param config: ConfigParser Object
+    :param flags: [Search_Flags] flags <class 'list'> | None (the flags switched on in NECKAr.cfg)
+    :param tax: subclass trees <class 'NECKAr_taxonomy.Taxonomy'> | None (see fetch_taxonomy)
+    """
+    if config.get('Output', 'mode', fallback='database') != 'database':
+        raise ValueError("the asyncio driver mode writes to the database only ([Output] mode database)")
+    flags = get_search_flags(config) if flags is None else flags
+    output_collection = driver.store(config.get('Database', 'db_write'), config.get('Database', 'collection_write'))
+    input_collection = driver.store(config.get('Database', 'db_dump'), config.get('Database', 'collection_dump'))
+    index_store = driver.store(config.get('Database', 'db_dump'),
+                               classindex.index_name(config.get('Database', 'collection_dump')), key="key")
+    membership_store = driver.store(config.get('Database', 'db_dump'),
+                                    membership.membership_name(config.get('Database', 'collection_dump')), key="key")
+    joined_store = driver.store(config.get('Database', 'db_dump'),
+                                membership.join_name(config.get('Database', 'collection_dump')), key="key")
+    await output_collection.ensure_index(['id'])
+    roots = [root for flag in flags for root in NECKAr_main.SEARCH_FLAGS[flag][2]]
+    if tax is None and roots:
+        tax = await fetch_taxonomy(driver, config, roots)
+
+    async def search(flag):
+        with METRICS.timer("stage_seconds", stage="classify:" + flag):
+            await driver.run(search_indexed, flag, config, driver.blocking(output_collection),
+                             driver.blocking(input_collection), driver.blocking(index_store),
+                             driver.blocking(membership_store), driver.blocking(joined_store), tax)
+
+    await asyncio.gather(*(search(flag) for flag in flags))
+    await driver.run(NECKAr_main.finish, config, driver.blocking(output_collection), driver.blocking(input_collection))
+
+
+async def create_LODlists(driver: AsyncDriver, config: configparser.ConfigParser) \
+        -> typing.Dict[str, typing.Dict[str, float]]:
+    """Creates the LOD lists of all languages of the section LODLinks (see create_LOD_lists), up to workers
+    languages at the same time
+
+    :param driver: <class 'AsyncDriver'>
+    :param config: ConfigParser Object
+    :return: dictionary language -> statistics (see create_LOD_lists.create_LODlist) <class 'dict'>
+    """
+    db_read_name = config.get('Database', 'db_write')
+    input_collection = driver.blocking(driver.store(db_read_name, config.get('Database', 'collection_write')))
+    all_collection = driver.blocking(driver.store(config.get('Database', 'db_dump'),
+                                                  config.get('Database', 'collection_dump')))
+    options = create_LOD_lists.read_LOD_options(config)
+
+    async def create(lang, coll_name):
+        output_coll = driver.blocking(driver.store(db_read_name, coll_name, key="WD_id"))
+        return lang, await driver.run(create_LOD_lists.create_LODlist, input_collection, output_coll,
+                                      all_collection, lang, **options)
+
+    return dict(await asyncio.gather(*(create(lang, coll_name) for lang, coll_name in config.items("LODLinks"))))
+
+
+async def run(config: configparser.ConfigParser, stages: typing.Iterable[str] = STAGES, drop: bool = False):
+    """Runs the stages in the order ingest, classify (with the taxonomy), lod
+
+    :param config: ConfigParser Object
+    :param stages: stages to run, see STAGES <class 'list'>
+    :param drop: if True the dump store is emptied before the ingest <class 'bool'>
+    """
+    async with AsyncDriver(config) as driver:
+        if "ingest" in stages:
+            await ingest(driver, config, drop)
+        if "classify" in stages:
+            await classify(driver, config)
+        if "lod" in stages:
+            for lang, stats in (await create_LODlists(driver, config)).items():
+                print_info("STATS " + lang + ": " + str(stats["entities"]) + " entities, " +
+                           "%.2f" % stats["seconds"] + "s, " + "%.1f" % stats["rate"] + " entities/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="NECKAr in asyncio driver mode (motor, aiohttp)")
+    parser.add_argument("--config", default="../NECKAr.cfg", help="configuration file")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES, help="stages to run")
+    parser.add_argument("--drop", action="store_true", help="empty the dump store before the ingest")
+    args = parser.parse_args()
+
+    config = configparser.ConfigParser()
+    config.read(args.config)
+    metrics.start(config)
+    profiling.start(config)
+    bulk.configure(config)
+    asyncio.run(run(config, args.stages, args.drop))
@@ -0,0 +1,378 @@
+#! /usr/bin/env python3
+# This Python file uses the following encoding: utf-8
+
+#############################################################################
+#  NECKAr: benchmark suite                                                  #
+#    micro benchmarks: every getter of NECKAr_get_functions,                #
+#      write_common_fields and get_poi on fixed fixture entities (seeded    #
+#      synthetic entities, see NECKAr_synthetic), best of several repeats   #
+#    macro benchmarks: ingest, taxonomy, classification per class and the   #
+#      LOD lists on a synthetic sample dump, run against a local storage    #
+#      stand-in (embedded SQLite backend, see NECKAr_storage), best of      #
+#      several runs                                                         #
+#    the results are written as json and compared with a stored baseline,   #
+#    benchmarks slower than the baseline by more than the threshold and     #
+#    by more than the spread of their repeats are reported as regressions   #
+#    (exit status 1); getters faster than the floor (1us per call) and      #
+#    macro benchmarks shorter than the macro floor (0.5s) are compared as   #
+#    if they took the floor                                                 #
+#                                                                           #
+#    python3 NECKAr_benchmark.py [--micro | --macro] [--save-baseline]      #
+#############################################################################
+
+import argparse
+import configparser
+import datetime
+import hashlib
+import inspect
+import json
+import os
+import platform
+import random
+import sys
+import time
+import typing
+import NECKAr_get_functions as get_functions
+import NECKAr_synthetic as synthetic
+import NECKAr_taxonomy as taxonomy
+import NECKAr_write_functions as write_functions
+
+FIXTURE_SEED = 20170321
+FIXTURE_ENTITIES = 200
+
+
+def print_info(info):
+    print("INFO\tNECKAr BENCHMARK:\t", info)
+
+
+######################################################################################################
+# fixtures
+######################################################################################################
+
+def fixture_profile(entities: int = FIXTURE_ENTITIES) -> synthetic.Profile:
+    """Profile of the fixture entities, fixed so the micro benchmarks always measure the same input (the claims are
+    capped, the heavy tail is a macro benchmark topic)"""
+    return synthetic.Profile(entities=entities, seed=FIXTURE_SEED, max_claims=200, subclass_depth=2,
+                             subclass_branching=3)
+
+
+def get_fixtures(entities: int = FIXTURE_ENTITIES) -> typing.Tuple[typing.List[dict], typing.Dict[int, list]]:
+    """:return: fixture entities and the class graph they were generated with"""
+    profile = fixture_profile(entities)
+    parents = synthetic.build_class_graph(profile)
+    generator = synthetic.EntityGenerator(profile, parents)
+    rng = random.Random(FIXTURE_SEED)
+    return [generator.entity(rng, number) for number in range(1, entities + 1) if number not in parents], parents
+
+
+def fixture_taxonomy(parents: typing.Dict[int, typing.List[int]]) -> taxonomy.Taxonomy:
+    """:return: taxonomy with the subclass trees of the class graph (in memory, nothing is fetched)"""
+    tax = taxonomy.Taxonomy()
+    for root in synthetic.get_root_classes():
+        tax.trees[root] = synthetic.get_subclasses(parents, root)
+    return tax
+
+
+def fixture_digest(fixtures: typing.List[dict]) -> str:
+    """:return: sha256 digest of the fixture entities, results are only comparable if the digests are equal"""
+    digest = hashlib.sha256()
+    for entity in fixtures:
+        digest.update(json.dumps(entity, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+######################################################################################################
+# micro benchmarks
+######################################################################################################
+
+def get_micro_benchmarks(poi_subclasses: typing.Dict[str, typing.List[int]]) \
+        -> typing.Dict[str, typing.Callable[[dict], object]]:
+    """Collects a call for every public getter of NECKAr_get_functions (getters with further required parameters
+    need an entry here, otherwise ValueError is raised so a new getter is never left out silently)
+
+    :param poi_subclasses: keyword arguments of get_poi (see NECKAr_main.get_location_subclasses)
+    :return: dictionary benchmark name -> function entity -> result
+    """
+    special = {"get_label": lambda entity: get_functions.get_label(entity, entity["id"]),
+               "get_generic_id_prop": lambda entity: get_functions.get_generic_id_prop(entity, "P17"),
+               "get_datelife": lambda entity: get_functions.get_datelife(entity, "P569"),
+               "get_poi": lambda entity: get_functions.get_poi(entity, **poi_subclasses)}
+    benchmarks = {}
+    for name, function in inspect.getmembers(get_functions, inspect.isfunction):
+        if not name.startswith("get_") or function.__module__ != get_functions.__name__:
+            continue
+        if name in special:
+            benchmarks[name] = special[name]
+            continue
+        required = [parameter for parameter in inspect.signature(function).parameters.values()
+                    if parameter.default is inspect.Parameter.empty]
+        if len(required) != 1:
+            raise ValueError("no benchmark arguments for " + name)
+        benchmarks[name] = function
+    benchmarks["write_common_fields"] = write_functions.write_common_fields
+    benchmarks["write_common_fields_lod_ids"] = lambda entity: write_functions.write_common_fields(entity, True)
+    return benchmarks
+
+
+def time_function(function: typing.Callable[[dict], object], fixtures: typing.List[dict], repeat: int = 7,
+                  min_time: float = 0.2) -> typing.Tuple[float, int, float]:
+    """Measures a function on all fixtures like timeit: the fixture set is run in loops of a calibrated number of
+    passes (at least min_time seconds), the best of repeat loops is taken
+
+    :return: seconds per call (best loop), number of calls per loop and the spread of the loops ((slowest - best) /
+        best)
+    """
+    passes = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(passes):
+            for entity in fixtures:
+                function(entity)
+        duration = time.perf_counter() - start
+        if duration >= min_time:
+            break
+        passes *= 2 if duration <= 0 else max(2, min(10, int(min_time / duration) + 1))
+    durations = [duration]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(passes):
+            for entity in fixtures:
+                function(entity)
+        durations.append(time.perf_counter() - start)
+    best = min(durations)
+    calls = passes * len(fixtures)
+    return best / calls, calls, (max(durations) - best) / best if best > 0 else 0.0
+
+
+def run_micro(repeat: int = 7, min_time: float = 0.2) -> typing.Tuple[typing.Dict[str, dict], str]:
+    """Runs the micro benchmarks
+
+    :param repeat: number of measured loops per benchmark, the best one counts <class 'int'>
+    :param min_time: minimum duration of one loop in seconds <class 'float'>
+    :return: results (name -> {"seconds": seconds per call, "spread": spread of the loops, ...}) and the fixture
+        digest
+    """
+    import NECKAr_main
+    fixtures, parents = get_fixtures()
+    poi_subclasses = NECKAr_main.get_location_subclasses(fixture_taxonomy(parents))
+    poi_subclasses.pop("geolocation")
+    results = {}
+    for name, function in sorted(get_micro_benchmarks(poi_subclasses).items()):
+        try:
+            function(fixtures[0])
+        except NotImplementedError:
+            print_info("micro " + name + " skipped: not implemented")
+            continue
+        seconds, calls, spread = time_function(function, fixtures, repeat, min_time)
+        results["micro:" + name] = {"seconds": seconds, "calls": calls, "spread": spread, "unit": "s/call"}
+        print_info("micro " + name + ": " + "%.3f" % (seconds * 1e6) + " us/call (spread " + "%.0f" % (spread * 100) +
+                   "%)")
+    sys.stdout.flush()
+    return results, fixture_digest(fixtures)
+
+
+######################################################################################################
+# macro benchmarks
+######################################################################################################
+
+def macro_config(config: configparser.ConfigParser, directory: str, dump: str) -> configparser.ConfigParser:
+    """:return: copy of the configuration that runs everything on the sample dump in the benchmark directory"""
+    bench_config = configparser.ConfigParser()
+    bench_config.read_dict(config)
+    overrides = {"Database": {"backend": config.get('Benchmark', 'backend', fallback='sqlite'),
+                              "sqlite_directory": os.path.join(directory, "db")},
+                 "Dump": {"sample_archive_file_100": dump},
+                 "Taxonomy": {"source": "dump", "directory": os.path.join(directory, "taxonomy")},
+                 "Output": {"mode": "database"},
+                 "Enrichment": {"labels": "False"}}
+    for section, options in overrides.items():
+        if not bench_config.has_section(section):
+            bench_config.add_section(section)
+        for option, value in options.items():
+            bench_config.set(section, option, value)
+    if not bench_config.has_section('Search_Flags'):
+        bench_config.add_section('Search_Flags')
+    return bench_config
+
+
+def run_macro(config: configparser.ConfigParser) -> typing.Dict[str, dict]:
+    """Runs the macro benchmarks on a synthetic sample dump ([Benchmark] macro_entities, generated once per size);
+    the suite is run [Benchmark] macro_repeat times (each round replaces the output of the previous one), the best run
+    of each stage counts
+
+    :param config: ConfigParser Object
+    :return: results (name -> {"seconds": best duration, "spread": spread of the runs, "items": ...,
+        "rate": items per second})
+    """
+    import WD2DB
+    import NECKAr_main
+    import create_LOD_lists
+    directory = config.get('Benchmark', 'directory', fallback='../benchmark')
+    entities = config.getint('Benchmark', 'macro_entities', fallback=20000)
+    repeat = max(1, config.getint('Benchmark', 'macro_repeat', fallback=3))
+    profile = synthetic.Profile(entities=entities, seed=FIXTURE_SEED)
+    dump = os.path.join(directory, "sample_" + str(entities) + "_" + str(profile.seed) + ".json.bz2")
+    if not os.path.exists(dump):
+        synthetic.generate_dump(profile, dump, chunk_size=max(1000, entities // (os.cpu_count() or 1)))
+    bench_config = macro_config(config, directory, dump)
+    roots = sorted({root for ne_class, find, flag_roots in NECKAr_main.SEARCH_FLAGS.values() for root in flag_roots})
+    runs = {}
+
+    def measure(name, function, count=None):
+        start = time.perf_counter()
+        items = function()
+        duration = time.perf_counter() - start
+        runs.setdefault(name, []).append((duration, count() if count else items))
+
+    def fetch_taxonomy():
+        tax = taxonomy.from_config(bench_config, refresh=True)
+        tax.fetch_all(roots)
+        return sum(len(tax.subclasses(root)) for root in roots)
+
+    # the runs of a stage are spread over the whole suite (rounds of all stages), so a slow period of the machine
+    # does not slow down all runs of one stage
+    for _ in range(repeat):
+        measure("ingest", lambda: WD2DB.ingest(bench_config, drop=True))
+        measure("taxonomy", fetch_taxonomy)
+
+        input_collection, output_collection = NECKAr_main.read_config(bench_config)
+        output_collection.delete()
+        output_collection.ensure_index(['id'])
+        tax = taxonomy.from_config(bench_config)
+        for flag, (ne_class, find, flag_roots) in NECKAr_main.SEARCH_FLAGS.items():
+            measure("classify:" + flag, lambda: NECKAr_main.search(flag, bench_config, output_collection,
+                                                                    input_collection, tax),
+                    lambda: output_collection.count({"neClass": ne_class}))
+
+        lod_input, output_list, all_collection = create_LOD_lists.read_config(bench_config)
+        for lang, output_coll in output_list.items():
+            measure("lod:" + lang, lambda: create_LOD_lists.create_LODlist(
+                lod_input, output_coll, all_collection, lang,
+                **create_LOD_lists.read_LOD_options(bench_config))["entities"])
+
+    results = {}
+    for name, measured in runs.items():
+        durations = [duration for duration, items in measured]
+        duration = min(durations)
+        items = measured[-1][1]
+        spread = (max(durations) - duration) / duration if duration > 0 else 0.0
+        results["macro:" + name] = {"seconds": duration, "spread": spread, "runs": len(durations), "items": items,
+                                    "rate": items / duration if items and duration > 0 else 0.0, "unit": "s"}
+        print_info("macro " + name + ": " + "%.3f" % duration + "s (spread " + "%.0f" % (spread * 100) + "%), " +
+                   str(items) + " items (" + "%.1f" % results["macro:" + name]["rate"] + " items/s)")
+    sys.stdout.flush()
+    return results
+
+
+######################################################################################################
+# results and baseline
+######################################################################################################
+
+def compare(results: typing.Dict[str, object], baseline: typing.Dict[str, object], threshold: float = 0.2,
+            macro_threshold: float = 0.3, floor: float = 1e-6, macro_floor: float = 0.5) \
+        -> typing.List[typing.Dict[str, object]]:
+    """Compares the durations of the results with the baseline. A benchmark is a regression if its slowdown exceeds
+    the threshold and the noise, the larger spread of its repeats in the baseline and in this run.
+
+    :param results: results of this run (see run) <class 'dict'>
+    :param baseline: stored results <class 'dict'>
+    :param threshold: allowed slowdown of the micro benchmarks, e.g. 0.2 = 20% <class 'float'>
+    :param macro_threshold: allowed slowdown of the macro benchmarks <class 'float'>
+    :param floor: micro benchmarks faster than floor seconds per call are compared as if they took floor seconds, so
+        the timer resolution of sub-microsecond getters is no regression <class 'float'>
+    :param macro_floor: macro benchmarks shorter than macro_floor seconds are compared as if they took macro_floor
+        seconds, so the scheduling noise of the stages of small classes is no regression <class 'float'>
+    :return: regressions (name, baseline seconds, seconds, ratio) <class 'list'>
+    """
+    if baseline.get("fixtures") and results.get("fixtures") and baseline["fixtures"] != results["fixtures"]:
+        print_info("fixture entities differ from the baseline, micro benchmarks are not comparable")
+    regressions = []
+    for name, result in sorted(results["benchmarks"].items()):
+        base = baseline.get("benchmarks", {}).get(name)
+        if not base or not base["seconds"]:
+            continue
+        if name.startswith("micro:") and baseline.get("fixtures") != results.get("fixtures"):
+            continue
+        reference = max(base["seconds"], macro_floor if name.startswith("macro:") else floor)
+        ratio = 1 + (result["seconds"] - base["seconds"]) / reference
+        noise = max(base.get("spread", 0.0), result.get("spread", 0.0))
+        limit = 1 + max(macro_threshold if name.startswith("macro:") else threshold, noise)
+        if ratio > limit:
+            regressions.append({"name": name, "baseline": base["seconds"], "seconds": result["seconds"],
+                                "ratio": ratio})
+            print_info("REGRESSION " + name + ": " + "%.3g" % base["seconds"] + "s -> " + "%.3g" % result["seconds"] +
+                       "s (" + "%+.0f" % ((ratio - 1) * 100) + "%)")
+        elif ratio < 1 / limit:
+            print_info("faster " + name + ": " + "%+.0f" % ((ratio - 1) * 100) + "%")
+    return regressions
+
+
+def run(config: configparser.ConfigParser, micro: bool = True, macro: bool = True) -> typing.Dict[str, object]:
+    """Runs the benchmark suite
+
+    :param config: ConfigParser Object
+    :param micro: run the micro benchmarks <class 'bool'>
+    :param macro: run the macro benchmarks <class 'bool'>
+    :return: results {"created", "python", "platform", "fixtures", "benchmarks": name -> result} <class 'dict'>
+    """
+    results = {"created": datetime.datetime.now().isoformat(timespec="seconds"),
+               "python": platform.python_version(), "platform": platform.platform(), "fixtures": None,
+               "benchmarks": {}}
+    if micro:
+        micro_results, results["fixtures"] = run_micro(config.getint('Benchmark', 'repeat', fallback=7),
+                                                       config.getfloat('Benchmark', 'min_time', fallback=0.2))
+        results["benchmarks"].update(micro_results)
+    if macro:
+        results["benchmarks"].update(run_macro(config))
+    return results
+
+
+def write_json(path: str, data: typing.Dict[str, object]):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as json_file:
+        json.dump(data, json_file, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+if __name__ == "__main__":
+    """runs the benchmark suite and compares it with the baseline, the parameters are set in NECKAr.cfg
+    (section Benchmark)"""
+
+    parser = argparse.ArgumentParser(description="NECKAr benchmark suite")
+    parser.add_argument("--config", default="../NECKAr.cfg", help="configuration file")
+    parser.add_argument("--micro", action="store_true", help="only the micro benchmarks")
+    parser.add_argument("--macro", action="store_true", help="only the macro benchmarks")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--threshold", type=float, help="allowed slowdown of the micro benchmarks, e.g. 0.2")
+    args = parser.parse_args()
+
+    config = configparser.ConfigParser()
+    config.read(args.config)
+    results = run(config, micro=args.micro or not args.macro, macro=args.macro or not args.micro)
+    write_json(config.get('Benchmark', 'results_file', fallback='../benchmark/results.json'), results)
+
+    baseline_file = config.get('Benchmark', 'baseline_file', fallback='../benchmark_baseline.json')
+    if args.save_baseline:
+        if os.path.exists(baseline_file):
+            # a partial run (--micro or --macro) only replaces its own benchmarks
+            with open(baseline_file, encoding="utf-8") as json_file:
+                baseline = json.load(json_file)
+            results["benchmarks"] = dict(baseline["benchmarks"], **results["benchmarks"])
+            results["fixtures"] = results["fixtures"] or baseline.get("fixtures")
+        write_json(baseline_file, results)
+        print_info("baseline written to " + baseline_file)
+    elif os.path.exists(baseline_file):
+        with open(baseline_file, encoding="utf-8") as json_file:
+            baseline = json.load(json_file)
+        regressions = compare(results, baseline,
+                              args.threshold if args.threshold is not None else
+                              config.getfloat('Benchmark', 'threshold', fallback=0.2),
+                              config.getfloat('Benchmark', 'macro_threshold', fallback=0.3),
+                              config.getfloat('Benchmark', 'floor', fallback=1e-6),
+                              config.getfloat('Benchmark', 'macro_floor', fallback=0.5))
+        if regressions:
+            print_info(str(len(regressions)) + " regressions")
+            sys.exit(1)
+        print_info("no regressions against " + baseline_file)
+    else:
+        print_info("no baseline " + baseline_file + ", run with --save-baseline to store one")
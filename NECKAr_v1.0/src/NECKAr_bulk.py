@@ -0,0 +1,301 @@
+#! /usr/bin/env python3
+# This Python file uses the following encoding: utf-8
+
+#############################################################################
+#  NECKAr: buffered bulk writer                                             #
+#    collects entries and writes them with one bulk request per batch:     #
+#      - adaptive batch size: a batch grows or shrinks so that one bulk    #
+#        request takes about target_seconds, and its estimated size        #
+#        (json of sampled entries) stays below max_bytes                    #
+#      - transient errors (connection, timeouts, locked database) are      #
+#        retried with exponential backoff                                   #
+#      - entries the store rejects (poison entries) are isolated and       #
+#        written to the quarantine store together with the error, the      #
+#        other entries of the batch are written                             #
+#      - up to concurrency batches are written at the same time            #
+#    the defaults of all writers are set from the section Bulk of           #
+#    NECKAr.cfg by configure, called by the entry points                    #
+#############################################################################
+
+import configparser
+import datetime
+import json
+import random
+import sys
+import threading
+import time
+import typing
+from concurrent.futures import ThreadPoolExecutor
+import NECKAr_storage as storage
+from NECKAr_metrics import METRICS
+
+DEFAULT_OPTIONS = {"batch_size": 1000, "adaptive": True, "min_batch": 100, "max_batch": 10000, "target_seconds": 0.5,
+                   "max_bytes": 8 * 1024 * 1024, "size_sample": 10, "retries": 5, "backoff": 0.5, "max_backoff": 30.0,
+                   "concurrency": 1, "quarantine": None}
+# defaults of the process (see configure)
+_OPTIONS = {}
+
+
+def print_info(info):
+    print("INFO\tNECKAr:\t", info)
+
+
+class BulkWriter(object):
+    """Buffered bulk writer for a store (see NECKAr_storage)
+
+    modes:
+        insert: entries are inserted (the caller is responsible for removing old entries)
+        replace: entries replace the entry with the same key (store.key) or are inserted (upsert), reruns are
+            idempotent
+
+    options (defaults: configure, DEFAULT_OPTIONS):
+        adaptive: adapt the batch size to the latency of the bulk requests <class 'bool'>
+        min_batch, max_batch: bounds of the adaptive batch size <class 'int'>
+        target_seconds: aimed duration of one bulk request <class 'float'>
+        max_bytes: maximum estimated size of a batch <class 'int'>
+        size_sample: the size of every size_sample-th entry is measured <class 'int'>
+        retries: number of retries of a transient error <class 'int'>
+        backoff, max_backoff: seconds before the first retry (doubled for each further retry) and their maximum
+            <class 'float'>
+        concurrency: number of batches written at the same time <class 'int'> (default of a store with the
+            attribute write_concurrency, e.g. NECKAr_async.BlockingStore: its value)
+        quarantine: store of the rejected entries | None (a rejected entry stops the run)
+
+    :param collection: store the entries are written to
+    :param name: name used in the progress output, e.g. 'PER' or 'en' <class 'string'>
+    :param batch_size: number of entries written with one bulk request (initial size if adaptive) <class 'int'> |
+        None (default of the options)
+    :param mode: 'insert' or 'replace' <class 'string'>
+    """
+
+    def __init__(self, collection, name: str, batch_size: typing.Optional[int] = None, mode: str = "insert",
+                 **options):
+        if mode not in ("insert", "replace"):
+            raise ValueError("unknown write mode: " + str(mode))
+        unknown = set(options) - set(DEFAULT_OPTIONS)
+        if unknown:
+            raise ValueError("unknown bulk writer options: " + ", ".join(sorted(unknown)))
+        if "concurrency" not in options and hasattr(collection, "write_concurrency"):
+            options["concurrency"] = collection.write_concurrency
+        options = dict(DEFAULT_OPTIONS, **dict(_OPTIONS, **options))
+        self.collection = collection
+        self.name = name
+        self.batch_size = batch_size or options["batch_size"]
+        self.mode = mode
+        self.adaptive = options["adaptive"]
+        self.min_batch = min(options["min_batch"], self.batch_size)
+        self.max_batch = max(options["max_batch"], self.batch_size)
+        self.target_seconds = options["target_seconds"]
+        self.max_bytes = options["max_bytes"]
+        self.size_sample = max(1, options["size_sample"])
+        self.retries = options["retries"]
+        self.backoff = options["backoff"]
+        self.max_backoff = options["max_backoff"]
+        self.quarantine = options["quarantine"]
+        # e.g. the shards of NECKAr_export.JSONLSink are written by one thread
+        self.concurrency = options["concurrency"] if getattr(collection, "thread_safe", True) else 1
+        self.entries = []
+        self.written = 0
+        self.quarantined = 0
+        # estimated json size of an entry
+        self.entry_size = None
+        self._sampled = 0
+        self._lock = threading.Lock()
+        self._executor = None
+        self._futures = []
+        if self.concurrency > 1:
+            self._executor = ThreadPoolExecutor(self.concurrency, thread_name_prefix="NECKAr bulk " + name)
+            self._slots = threading.BoundedSemaphore(self.concurrency)
+        self.start = time.perf_counter()
+
+    def prepare(self):
+        """Prepares the collection for a (re)run: mode insert removes all entries, mode replace creates an index on
+        the key
+        """
+        if self.mode == "insert":
+            self.collection.delete()
+            print_info(self.name + "\tremoved old entries")
+        else:
+            self.collection.ensure_index([self.collection.key])
+
+    def write(self, entry: typing.Dict[str, object]):
+        """Adds an entry to the buffer, the buffer is written when batch_size entries or max_bytes are collected
+
+        :param entry: entry <class 'dict'>
+        """
+        self.entries.append(entry)
+        if self._sampled % self.size_sample == 0:
+            size = len(json.dumps(entry, default=str))
+            self.entry_size = size if self.entry_size is None else 0.9 * self.entry_size + 0.1 * size
+        self._sampled += 1
+        if len(self.entries) >= self.batch_size or len(self.entries) * self.entry_size >= self.max_bytes:
+            self.flush()
+
+    def flush(self):
+        """Writes all buffered entries with one bulk request (in a writer thread if concurrency > 1)"""
+        if not self.entries:
+            return
+        (entries, self.entries) = (self.entries, [])
+        if self._executor is None:
+            self._write(entries)
+            return
+        self._check()
+        self._slots.acquire()
+        future = self._executor.submit(self._write, entries)
+        future.add_done_callback(lambda done: self._slots.release())
+        self._futures.append(future)
+
+    def _check(self):
+        """Raises the error of a finished writer thread"""
+        for future in [future for future in self._futures if future.done()]:
+            self._futures.remove(future)
+            future.result()
+
+    def _write(self, entries: typing.List[typing.Dict[str, object]]):
+        count = self._write_batch(entries)
+        with self._lock:
+            self.written += count
+            written = self.written
+        METRICS.inc("written_total", count, writer=self.name)
+        print_info(self.name + " " + str(written) + " entries written (" + "%.1f" % self.rate() +
+                   " entries/s, batch size " + str(self.batch_size) + ")")
+        sys.stdout.flush()
+
+    def _bulk(self, entries: typing.List[typing.Dict[str, object]]):
+        if self.mode == "insert":
+            self.collection.insert_many(entries)
+        else:
+            self.collection.replace_many(entries)
+
+    def _write_batch(self, entries: typing.List[typing.Dict[str, object]]) -> int:
+        """Writes a batch, retries transient errors and quarantines rejected entries
+
+        :return: number of written entries <class 'int'>
+        """
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                self._bulk(entries)
+            except Exception as e:
+                if not storage.is_transient(e):
+                    return self._isolate(entries, e, attempt)
+                if attempt >= self.retries:
+                    print_info(self.name + "\tbulk write failed after " + str(attempt) + " retries: " + str(e))
+                    raise
+                delay = min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+                attempt += 1
+                METRICS.inc("bulk_retries_total", writer=self.name)
+                print_info(self.name + "\ttransient error, retry " + str(attempt) + " in " + "%.1f" % delay + "s: " +
+                           str(e))
+                time.sleep(delay)
+                continue
+            self._adapt(len(entries), time.perf_counter() - start)
+            return len(entries)
+
+    def _isolate(self, entries: typing.List[typing.Dict[str, object]], error: Exception, attempt: int) -> int:
+        """Finds the entries of a failed batch the store rejected: from the error if the store tells them, otherwise
+        by writing the halves of the batch separately. The rejected entries are quarantined.
+
+        :return: number of written entries <class 'int'>
+        """
+        rejected = storage.get_write_errors(error)
+        if rejected is not None and attempt:
+            # after a retry, duplicate keys are entries the interrupted attempt had written
+            rejected = {index: rejection for index, rejection in rejected.items()
+                        if rejection[0] != storage.DUPLICATE_KEY}
+        if rejected == {}:
+            return len(entries)
+        if self.quarantine is None:
+            print_info(self.name + "\tbulk write failed: " + str(getattr(error, "details", error)))
+            raise error
+        if rejected is not None:
+            self._quarantine([(entries[index], message) for index, (code, message) in sorted(rejected.items())])
+            return len(entries) - len(rejected)
+        if len(entries) == 1:
+            self._quarantine([(entries[0], type(error).__name__ + ": " + str(error))])
+            return 0
+        half = len(entries) // 2
+        return self._write_batch(entries[:half]) + self._write_batch(entries[half:])
+
+    def _quarantine(self, rejected: typing.List[typing.Tuple[typing.Dict[str, object], str]]):
+        """Writes rejected entries with their error to the quarantine store"""
+        now = datetime.datetime.utcnow().isoformat()
+        self.quarantine.insert_many([{"id": entry.get(self.collection.key), "writer": self.name,
+                                      "store": getattr(self.collection, "name", None), "error": message,
+                                      "time": now, "entry": json.dumps(entry, default=str)}
+                                     for (entry, message) in rejected])
+        with self._lock:
+            self.quarantined += len(rejected)
+        METRICS.inc("bulk_quarantined_total", len(rejected), writer=self.name)
+        for (entry, message) in rejected:
+            print_info(self.name + "\t" + str(entry.get(self.collection.key)) + " quarantined: " + message)
+
+    def _adapt(self, count: int, seconds: float):
+        """Moves the batch size towards the size a bulk request of target_seconds would have (at most doubling or
+        halving it), only full batches are measured"""
+        if not self.adaptive or seconds <= 0 or count < self.batch_size // 2:
+            return
+        with self._lock:
+            size = count * self.target_seconds / seconds
+            size = min(max(size, self.batch_size / 2), self.batch_size * 2)
+            self.batch_size = int(min(self.max_batch, max(self.min_batch, (self.batch_size + size) / 2)))
+
+    def rate(self) -> float:
+        """:return: entries written per second since the writer was created <class 'float'>"""
+        duration = time.perf_counter() - self.start
+        return self.written / duration if duration > 0 else 0.0
+
+    def close(self) -> int:
+        """Writes the remaining entries and waits for the writer threads
+
+        :return: number of written entries <class 'int'>
+        """
+        self.flush()
+        if self._executor is not None:
+            try:
+                for future in self._futures:
+                    future.result()
+            finally:
+                self._futures = []
+                self._executor.shutdown(wait=True)
+                self._executor = None
+        if self.quarantined:
+            print_info(self.name + "\t" + str(self.quarantined) + " entries quarantined")
+        return self.written
+
+
+def read_bulk_options(config: configparser.ConfigParser) -> typing.Dict[str, object]:
+    """Reads the section Bulk of the configuration file NECKAr.cfg (without the quarantine store)
+
+    :param config: ConfigParser Object
+    :return: options of BulkWriter <class 'dict'>
+    """
+    return {"batch_size": config.getint('Bulk', 'batch_size', fallback=1000),
+            "adaptive": config.getboolean('Bulk', 'adaptive', fallback=True),
+            "min_batch": config.getint('Bulk', 'min_batch', fallback=100),
+            "max_batch": config.getint('Bulk', 'max_batch', fallback=10000),
+            "target_seconds": config.getfloat('Bulk', 'target_seconds', fallback=0.5),
+            "max_bytes": config.getint('Bulk', 'max_bytes', fallback=8 * 1024 * 1024),
+            "size_sample": config.getint('Bulk', 'size_sample', fallback=10),
+            "retries": config.getint('Bulk', 'retries', fallback=5),
+            "backoff": config.getfloat('Bulk', 'backoff', fallback=0.5),
+            "max_backoff": config.getfloat('Bulk', 'max_backoff', fallback=30.0),
+            "concurrency": config.getint('Bulk', 'concurrency', fallback=1)}
+
+
+def configure(config: configparser.ConfigParser) -> typing.Dict[str, object]:
+    """Sets the default options of the bulk writers of the process from the section Bulk of NECKAr.cfg; the
+    quarantine store, if set, is a collection of the write database. Called by the entry points.
+
+    :param config: ConfigParser Object
+    :return: options <class 'dict'>
+    """
+    global _OPTIONS
+    options = read_bulk_options(config)
+    quarantine = config.get('Bulk', 'quarantine', fallback='')
+    if quarantine:
+        options["quarantine"] = storage.from_config(config).store(config.get('Database', 'db_write'), quarantine,
+                                                                  authenticate=True)
+    _OPTIONS = options
+    return options
@@ -0,0 +1,203 @@
+#! /usr/bin/env python3
+# This Python file uses the following encoding: utf-8
+
+#############################################################################
+#  NECKAr: inverted P31 class index                                         #
+#    class id -> sorted numeric ids of the items that are an instance (P31) #
+#    of the class, built by the loader (WD2DB) in the side collection       #
+#    <collection_dump>__p31index, one document per chunk of CHUNK_SIZE ids: #
+#      {"key": "Q515:0", "class_id": 515, "chunk": 0, "chunks": 1,          #
+#       "count": 1234, "ids": [...]}                                        #
+#    a selection over many classes (e.g. the subclasses of geographic       #
+#    location) is computed as the union of the id lists, and the items are  #
+#    fetched by id in sorted batches, instead of a $in query with tens of   #
+#    thousands of values on the P31 multikey index                          #
+#############################################################################
+
+import array
+import collections
+import configparser
+import time
+import typing
+import NECKAr_storage as storage
+from NECKAr_bulk import BulkWriter
+from NECKAr_metrics import METRICS, record_fetch
+
+# number of entity ids per index document
+CHUNK_SIZE = 10000
+
+
+def print_info(info):
+    print("INFO\tNECKAr:\t", info)
+
+
+def index_name(collection_name: str) -> str:
+    """:return: name of the index collection of a dump collection <class 'string'>"""
+    return collection_name + "__p31index"
+
+
+def chunk_key(class_id: int, chunk: int) -> str:
+    """:return: key of an index document, e.g. 'Q515:0' <class 'string'>"""
+    return "Q" + str(class_id) + ":" + str(chunk)
+
+
+class IndexBuilder(object):
+    """Collects the P31 values of the items while the dump is loaded (4 bytes per P31 value)"""
+
+    def __init__(self):
+        self.members = collections.defaultdict(lambda: array.array("I"))
+        self.items = 0
+
+    def add(self, item: typing.Dict[str, object]):
+        """Adds the P31 values of an entity (other entities than items are ignored)
+
+        :param item: entity object <class 'dict'>
+        """
+        if item.get("type") != "item":
+            return
+        number = int(item["id"][1:])
+        for class_id in set(storage.get_instance_of_ids(item)):
+            self.members[class_id].append(number)
+        self.items += 1
+
+    def documents(self) -> typing.Iterator[typing.Dict[str, object]]:
+        """:return: generator of the index documents, ordered by class and chunk"""
+        for class_id in sorted(self.members):
+            ids = sorted(set(self.members[class_id]))
+            chunks = (len(ids) + CHUNK_SIZE - 1) // CHUNK_SIZE
+            for chunk in range(chunks):
+                yield {"key": chunk_key(class_id, chunk), "class_id": class_id, "chunk": chunk, "chunks": chunks,
+                       "count": len(ids), "ids": ids[chunk * CHUNK_SIZE:(chunk + 1) * CHUNK_SIZE]}
+
+
+class ClassIndex(object):
+    """Inverted P31 index stored in a side store (see the module description)
+
+    :param store: index store, key 'key'
+    :param fetch_batch: number of items fetched with one query <class 'int'>
+    """
+
+    def __init__(self, store, fetch_batch: int = 1000):
+        self.store = store
+        self.fetch_batch = fetch_batch
+
+    def write(self, builder: IndexBuilder) -> int:
+        """Replaces the index by the one of the builder
+
+        :return: number of classes <class 'int'>
+        """
+        self.store.delete()
+        writer = BulkWriter(self.store, "P31INDEX")
+        for doc in builder.documents():
+            writer.write(doc)
+        writer.close()
+        self.store.ensure_index(["key"])
+        print_info("P31INDEX " + str(len(builder.members)) + " classes of " + str(builder.items) + " items indexed")
+        return len(builder.members)
+
+    def exists(self) -> bool:
+        """:return: True if the index was built <class 'bool'>"""
+        return self.store.count() > 0
+
+    def members(self, class_ids: typing.Iterable[int]) -> typing.List[int]:
+        """:return: sorted numeric ids of the items that are an instance of at least one of the classes (list of
+            int)"""
+        with METRICS.timer("class_index_seconds", store=self.store.name):
+            docs = list(self.store.get_many([chunk_key(class_id, 0) for class_id in set(class_ids)]).values())
+            keys = [chunk_key(doc["class_id"], chunk) for doc in docs for chunk in range(1, doc["chunks"])]
+            if keys:
+                docs += self.store.get_many(keys).values()
+            if len(docs) == 1:
+                return docs[0]["ids"]
+            ids = set()
+            for doc in docs:
+                ids.update(doc["ids"])
+            return sorted(ids)
+
+    def find_instances(self, store, class_ids: typing.List[int], projection=None) \
+            -> typing.Iterator[typing.Dict[str, object]]:
+        """Streams the items of store that are an instance (P31) of one of the given classes, ordered by id
+
+        :param store: dump store the index was built from
+        :param class_ids: numeric ids of the classes (list of int)
+        :param projection: projection <class 'dict'> | None
+        :return: generator of items
+        """
+        return self.fetch(store, self.members(class_ids), projection)
+
+    def fetch(self, store, ids: typing.List[int], projection=None) -> typing.Iterator[typing.Dict[str, object]]:
+        """Streams the items of store with the given numeric ids, fetch_batch items per query
+
+        :param store: dump store
+        :param ids: numeric ids of the items (list of int)
+        :param projection: projection <class 'dict'> | None
+        :return: generator of items
+        """
+        for start in range(0, len(ids), self.fetch_batch):
+            keys = ["Q" + str(number) for number in ids[start:start + self.fetch_batch]]
+            fetch_start = time.perf_counter()
+            docs = store.get_many(keys, projection)
+            record_fetch(store.name, time.perf_counter() - fetch_start, None, None, len(docs))
+            for key in keys:
+                if key in docs:
+                    yield docs[key]
+
+
+class IndexedStore(object):
+    """Dump store whose find_instances uses the class index for selections of at least min_classes classes, all
+    other operations are those of the store
+
+    :param store: dump store
+    :param index: index of the store <class 'ClassIndex'>
+    :param min_classes: minimum number of classes of a selection that uses the index <class 'int'>
+    """
+
+    def __init__(self, store, index: ClassIndex, min_classes: int = 100):
+        self.store = store
+        self.index = index
+        self.min_classes = min_classes
+
+    def __getattr__(self, name):
+        return getattr(self.store, name)
+
+    def find_instances(self, class_ids: typing.List[int], projection=None, chunk_size: int = storage.IN_CHUNK_SIZE,
+                       class_root: typing.Optional[int] = None,
+                       related: typing.Optional[typing.Dict[int, typing.List[int]]] = None):
+        if len(class_ids) < self.min_classes:
+            return self.store.find_instances(class_ids, projection, chunk_size, class_root, related=related)
+        return self.index.find_instances(self.store, class_ids, projection)
+
+
+def read_class_index_options(config: configparser.ConfigParser) -> typing.Dict[str, object]:
+    """Reads the section ClassIndex of the configuration file NECKAr.cfg
+
+    :param config: ConfigParser Object
+    :return: options <class 'dict'>
+    """
+    return {"enabled": config.getboolean('ClassIndex', 'enabled', fallback=False),
+            "min_classes": config.getint('ClassIndex', 'min_classes', fallback=100),
+            "fetch_batch": config.getint('ClassIndex', 'fetch_batch', fallback=1000)}
+
+
+def index_store(config: configparser.ConfigParser):
+    """:return: index store of the dump store of the configuration file NECKAr.cfg"""
+    return storage.from_config(config).store(config.get('Database', 'db_dump'),
+                                             index_name(config.get('Database', 'collection_dump')), key="key")
+
+
+def from_config(config: configparser.ConfigParser, input_collection, store=None):
+    """Uses the class index for the selections of the dump store if it is enabled (section ClassIndex) and built
+
+    :param config: ConfigParser Object
+    :param input_collection: dump store
+    :param store: index store | None (see index_store)
+    :return: <class 'IndexedStore'> | input_collection
+    """
+    options = read_class_index_options(config)
+    if not options["enabled"]:
+        return input_collection
+    index = ClassIndex(store if store is not None else index_store(config), options["fetch_batch"])
+    if not index.exists():
+        print_info("P31INDEX not built, the classes are selected on P31 (load the dump again to build it)")
+        return input_collection
+    return IndexedStore(input_collection, index, options["min_classes"])
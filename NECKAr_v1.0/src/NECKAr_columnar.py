@@ -0,0 +1,310 @@
+#! /usr/bin/env python3
+# This Python file uses the following encoding: utf-8
+
+#############################################################################
+#  NECKAr: columnar snapshot                                                #
+#    exports a few scalar fields of the classified entities as a chunked,   #
+#    columnar binary snapshot, so analytics only read the columns they     #
+#    need instead of scanning the whole output:                            #
+#      snapshot/schema.json             columns, types and chunk sizes      #
+#      snapshot/chunk_00000/<col>.bin   one little endian typed array per   #
+#                                       column and chunk                    #
+#      snapshot/dictionaries/<col>.json values of the string columns        #
+#    column types:                                                          #
+#      qid:    Q-id as int64 (Q42 -> 42, 0: missing)                        #
+#      int:    int64 (-2**63: missing)                                      #
+#      string: uint32 code into the dictionary of the column (0: missing)  #
+#      point:  two float64 columns <col>.long and <col>.lat (nan: missing)  #
+#    the column files can be memory-mapped (see ColumnarSnapshot, or with   #
+#    numpy: numpy.memmap(path, dtype="<i8", mode="r"))                      #
+#    the snapshot is built from the classifier output (output collection   #
+#    or JSONL shards), the dump is not read                                 #
+#############################################################################
+
+import array
+import configparser
+import json
+import math
+import mmap
+import os
+import shutil
+import sys
+import typing
+
+# default columns of the snapshot: field -> type
+COLUMNS = {"id": "qid",
+           "neClass": "string",
+           "date_birth": "string",
+           "date_death": "string",
+           "gender": "string",
+           "coordinate": "point",
+           "population": "int"}
+
+NULL_INT = -2 ** 63
+_UINT32 = "I" if array.array("I").itemsize == 4 else "L"
+# column type -> (array typecode, numpy dtype)
+TYPECODES = {"qid": ("q", "<i8"), "int": ("q", "<i8"), "string": (_UINT32, "<u4"), "float": ("d", "<f8")}
+
+SCHEMA = "schema.json"
+
+
+def print_info(info):
+    print("INFO\tNECKAr:\t", info)
+
+
+def get_physical_columns(columns: typing.Dict[str, str]) -> typing.Dict[str, str]:
+    """:return: dictionary column name -> stored type, point columns are split into <col>.long and <col>.lat"""
+    physical = {}
+    for name, column_type in columns.items():
+        if column_type == "point":
+            physical[name + ".long"] = "float"
+            physical[name + ".lat"] = "float"
+        elif column_type in TYPECODES:
+            physical[name] = column_type
+        else:
+            raise ValueError("unknown column type " + str(column_type) + " of column " + name)
+    return physical
+
+
+def to_qid(value) -> int:
+    """Q42 | 42 -> 42, anything else -> 0"""
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value[1:].isdigit():
+        return int(value[1:])
+    return 0
+
+
+class SnapshotWriter(object):
+    """Writes entities column by column, a chunk is written every chunk_size entities
+
+    :param directory: directory of the snapshot, an existing snapshot is replaced <class 'string'>
+    :param columns: dictionary field -> column type (see COLUMNS) <class 'dict'>
+    :param chunk_size: number of entities per chunk <class 'int'>
+    """
+
+    def __init__(self, directory: str, columns: typing.Optional[typing.Dict[str, str]] = None,
+                 chunk_size: int = 1000000):
+        self.directory = directory
+        self.columns = dict(columns or COLUMNS)
+        self.physical = get_physical_columns(self.columns)
+        self.chunk_size = chunk_size
+        self.chunks = []
+        # string column -> (value -> code, values), code 0 is reserved for missing values
+        self.dictionaries = {name: ({}, [None]) for name, column_type in self.columns.items()
+                             if column_type == "string"}
+        self.tmp_directory = directory + ".tmp"
+        if os.path.exists(self.tmp_directory):
+            shutil.rmtree(self.tmp_directory)
+        os.makedirs(os.path.join(self.tmp_directory, "dictionaries"))
+        self._new_chunk()
+
+    def _new_chunk(self):
+        self.buffers = {name: array.array(TYPECODES[column_type][0]) for name, column_type in self.physical.items()}
+        self.rows = 0
+
+    def _encode(self, name: str, value) -> int:
+        if value is None:
+            return 0
+        if not isinstance(value, str):
+            value = json.dumps(value) if isinstance(value, (list, dict)) else str(value)
+        codes, values = self.dictionaries[name]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(values)
+            values.append(value)
+        return code
+
+    def write(self, entity: typing.Dict[str, object]):
+        for name, column_type in self.columns.items():
+            value = entity.get(name)
+            if column_type == "point":
+                point = value if isinstance(value, (list, tuple)) and len(value) == 2 else (math.nan, math.nan)
+                self.buffers[name + ".long"].append(float(point[0]))
+                self.buffers[name + ".lat"].append(float(point[1]))
+            elif column_type == "qid":
+                self.buffers[name].append(to_qid(value))
+            elif column_type == "int":
+                self.buffers[name].append(value if isinstance(value, int) else NULL_INT)
+            elif column_type == "float":
+                self.buffers[name].append(float(value) if isinstance(value, (int, float)) else math.nan)
+            else:
+                self.buffers[name].append(self._encode(name, value))
+        self.rows += 1
+        if self.rows >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Writes the buffered entities as a new chunk"""
+        if not self.rows:
+            return
+        chunk = "chunk_" + "%05d" % len(self.chunks)
+        os.makedirs(os.path.join(self.tmp_directory, chunk))
+        for name, buffer in self.buffers.items():
+            if sys.byteorder == "big":
+                buffer.byteswap()
+            with open(os.path.join(self.tmp_directory, chunk, name + ".bin"), "wb") as column_file:
+                buffer.tofile(column_file)
+        self.chunks.append({"name": chunk, "rows": self.rows})
+        self._new_chunk()
+
+    def close(self) -> typing.Dict[str, object]:
+        """Writes the last chunk, the dictionaries and the schema and moves the snapshot to its directory
+
+        :return: schema <class 'dict'>
+        """
+        self.flush()
+        for name, (codes, values) in self.dictionaries.items():
+            with open(os.path.join(self.tmp_directory, "dictionaries", name + ".json"), "w",
+                      encoding="utf-8") as dictionary_file:
+                json.dump(values, dictionary_file, ensure_ascii=False)
+        schema = {"columns": self.columns,
+                  "physical_columns": {name: {"type": column_type, "dtype": TYPECODES[column_type][1]}
+                                       for name, column_type in self.physical.items()},
+                  "chunks": self.chunks,
+                  "rows": sum(chunk["rows"] for chunk in self.chunks)}
+        with open(os.path.join(self.tmp_directory, SCHEMA), "w", encoding="utf-8") as schema_file:
+            json.dump(schema, schema_file, indent=1)
+        if os.path.exists(self.directory):
+            shutil.rmtree(self.directory)
+        os.replace(self.tmp_directory, self.directory)
+        return schema
+
+
+def export_snapshot(entities: typing.Iterable[typing.Dict[str, object]], directory: str,
+                    columns: typing.Optional[typing.Dict[str, str]] = None,
+                    chunk_size: int = 1000000) -> typing.Dict[str, object]:
+    """Writes the entities as a columnar snapshot
+
+    :param entities: classified entities, e.g. output_collection.scan(projection=...) or
+        NECKAr_export.iter_entities(directory)
+    :param directory: directory of the snapshot <class 'string'>
+    :param columns: dictionary field -> column type <class 'dict'> | None (COLUMNS)
+    :param chunk_size: number of entities per chunk <class 'int'>
+    :return: schema <class 'dict'>
+    """
+    writer = SnapshotWriter(directory, columns, chunk_size)
+    for entity in entities:
+        writer.write(entity)
+    schema = writer.close()
+    print_info("SNAPSHOT " + str(schema["rows"]) + " entities, " + str(len(schema["chunks"])) + " chunks, " +
+               str(len(schema["physical_columns"])) + " columns written to " + directory)
+    sys.stdout.flush()
+    return schema
+
+
+class ColumnarSnapshot(object):
+    """Reader of a snapshot, the column files are memory-mapped on first access
+
+    :param directory: directory of the snapshot <class 'string'>
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        with open(os.path.join(directory, SCHEMA), encoding="utf-8") as schema_file:
+            self.schema = json.load(schema_file)
+        self.rows = self.schema["rows"]
+        self._maps = []
+        self._dictionaries = {}
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def column_chunks(self, name: str) -> typing.Iterator[memoryview]:
+        """Memory-maps the files of a column
+
+        :param name: physical column, e.g. 'population' or 'coordinate.lat' <class 'string'>
+        :return: generator of one typed memoryview per chunk
+        """
+        column_type = self.schema["physical_columns"][name]["type"]
+        for chunk in self.schema["chunks"]:
+            with open(os.path.join(self.directory, chunk["name"], name + ".bin"), "rb") as column_file:
+                mapped = mmap.mmap(column_file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps.append(mapped)
+            view = memoryview(mapped).cast(TYPECODES[column_type][0])
+            if sys.byteorder == "big":
+                view = array.array(TYPECODES[column_type][0], view)
+                view.byteswap()
+            yield view
+
+    def column(self, name: str) -> array.array:
+        """:return: all values of a physical column (codes for string columns) <class 'array.array'>"""
+        values = array.array(TYPECODES[self.schema["physical_columns"][name]["type"]][0])
+        for view in self.column_chunks(name):
+            values.extend(view)
+        return values
+
+    def dictionary(self, name: str) -> typing.List[typing.Optional[str]]:
+        """:return: values of a string column, index = code (index 0: missing) <class 'list'>"""
+        if name not in self._dictionaries:
+            with open(os.path.join(self.directory, "dictionaries", name + ".json"), encoding="utf-8") as dictionary_file:
+                self._dictionaries[name] = json.load(dictionary_file)
+        return self._dictionaries[name]
+
+    def values(self, name: str) -> typing.Iterator[object]:
+        """Streams the decoded values of a column (None for missing values, (long, lat) for point columns)
+
+        :param name: column, e.g. 'neClass' or 'coordinate' <class 'string'>
+        :return: generator of values
+        """
+        column_type = self.schema["columns"][name]
+        if column_type == "point":
+            for longs, lats in zip(self.column_chunks(name + ".long"), self.column_chunks(name + ".lat")):
+                for long, lat in zip(longs, lats):
+                    yield None if math.isnan(long) else (long, lat)
+        elif column_type == "string":
+            dictionary = self.dictionary(name)
+            for view in self.column_chunks(name):
+                for code in view:
+                    yield dictionary[code]
+        else:
+            null = {"qid": 0, "int": NULL_INT}.get(column_type)
+            for view in self.column_chunks(name):
+                for value in view:
+                    yield None if value == null or value != value else value
+
+    def close(self):
+        for mapped in self._maps:
+            try:
+                mapped.close()
+            except BufferError:
+                pass  # still referenced by a memoryview of the caller
+        self._maps = []
+
+
+def read_columns(config: configparser.ConfigParser) -> typing.Dict[str, str]:
+    """Reads the columns of the snapshot (section Columnar) of the configuration file NECKAr.cfg
+
+    :param config: ConfigParser Object
+    :return: dictionary field -> column type <class 'dict'>
+    """
+    columns = config.get('Columnar', 'columns', fallback='')
+    if not columns.strip():
+        return dict(COLUMNS)
+    res = {}
+    for column in columns.split(","):
+        name, _, column_type = column.strip().partition(":")
+        res[name.strip()] = column_type.strip() or COLUMNS.get(name.strip(), "string")
+    return res
+
+
+if __name__ == "__main__":
+    """exports the NECKAr output ([Output] mode database: output collection, jsonl: JSONL shards) as a columnar
+    snapshot, the parameters are set in NECKAr.cfg (section Columnar)"""
+
+    config = configparser.ConfigParser()
+    config.read('../NECKAr.cfg')
+    columns = read_columns(config)
+    projection = {field: 1 for field in columns}
+    projection["_id"] = 0
+
+    if config.get('Output', 'mode', fallback='database') == 'jsonl':
+        import NECKAr_export as export
+        entities = export.iter_entities(config.get('Output', 'directory', fallback='../output'))
+    else:
+        import NECKAr_main
+        output_collection = NECKAr_main.read_config(config)[1]
+        entities = output_collection.scan(projection=projection,
+                                          page_size=config.getint('Columnar', 'page_size', fallback=10000))
+    export_snapshot(entities, config.get('Columnar', 'directory', fallback='../output_columnar'), columns,
+                    config.getint('Columnar', 'chunk_size', fallback=1000000))
@@ -0,0 +1,205 @@
+#! /usr/bin/env python3
+# This Python file uses the following encoding: utf-8
+
+#############################################################################
+#  NECKAr: delta reclassification                                           #
+#    the membership collection (NECKAr_membership) keeps the subclass set   #
+#    every root class was last classified with. When the trees change       #
+#    (new taxonomy, classes excluded in [Taxonomy] exclude) the sets are    #
+#    diffed with the new ones and only the entities with a P31 value in a   #
+#    class that entered or left the set are reclassified: they are found    #
+#    with the P31 class index (NECKAr_classindex), their entries of the     #
+#    class are removed and those still selected are extracted again. The    #
+#    other entries of the class are kept. The sets of the other trees an    #
+#    extraction depends on (the location types of LOC) are diffed as well.  #
+#    a class without the sets of a previous run is classified in full.      #
+#    a false positive (e.g. Q79838 in EVE) is removed by excluding the      #
+#    class that brings it in (shown by --explain) and running the delta.    #
+#                                                                           #
+#    python3 NECKAr_delta.py [--flags organization event] [--dry-run]       #
+#                            [--explain Q79838]                             #
+#############################################################################
+
+import argparse
+import configparser
+import typing
+import NECKAr_bulk as bulk
+import NECKAr_classindex as classindex
+import NECKAr_main
+import NECKAr_membership as membership
+import NECKAr_metrics as metrics
+import NECKAr_profiling as profiling
+import NECKAr_storage as storage
+import NECKAr_taxonomy as taxonomy
+
+
+def print_info(info):
+    print("INFO\tNECKAr DELTA:\t", info)
+
+
+class DeltaSelection(membership.Selection):
+    """Items of a delta reclassification of one class (see NECKAr_main.classify), the new subclass sets are
+    materialized once the entries are written
+
+    :param items: items that are (still) selected
+    :param entity_ids: ids of all reclassified entities, e.g. 'Q79838', their entries of the class are replaced
+        <class 'list'> | None (all entries of the class are replaced)
+    :param members: membership of the dump <class 'NECKAr_membership.Membership'> | None (nothing is materialized)
+    :param sets: dictionary root -> numeric ids of its selected classes <class 'dict'>
+    """
+
+    def __init__(self, items: typing.Iterable[typing.Dict[str, object]], entity_ids: typing.Optional[typing.List[str]],
+                 members: typing.Optional[membership.Membership] = None,
+                 sets: typing.Optional[typing.Dict[int, typing.List[int]]] = None):
+        super().__init__(items, members, sets or {})
+        self.entity_ids = entity_ids
+
+
+class DeltaStore(object):
+    """Dump store whose selections with a root (find_instances(..., class_root=...)) are the delta to the subclass
+    sets materialized by the last run, those of the root and of the related roots (e.g. the location types of
+    LOC); selections without root (e.g. persons) are empty, a selection without the sets of a previous run is the
+    full selection
+
+    :param store: dump store
+    :param index: class index of the dump <class 'NECKAr_classindex.ClassIndex'>
+    :param members: membership of the dump <class 'NECKAr_membership.Membership'>
+    :param dry_run: if True the changes are only counted, nothing is reclassified <class 'bool'>
+    """
+
+    def __init__(self, store, index: classindex.ClassIndex, members: membership.Membership, dry_run: bool = False):
+        self.store = store
+        self.index = index
+        self.members = members
+        self.dry_run = dry_run
+        # class root -> {"added": ..., "removed": ..., "entities": ..., "full": ...}
+        self.changes = {}
+
+    def __getattr__(self, name):
+        return getattr(self.store, name)
+
+    def find_instances(self, class_ids: typing.List[int], projection=None, chunk_size: typing.Optional[int] = None,
+                       class_root: typing.Optional[int] = None,
+                       related: typing.Optional[typing.Dict[int, typing.List[int]]] = None):
+        if class_root is None:
+            return DeltaSelection([], [])
+        sets = dict(related or {})
+        sets[class_root] = class_ids
+        old = {root: set(self.members.members(root)) for root in sets}
+        missing = sorted(root for root in sets if not old[root])
+        if missing:
+            self.changes[class_root] = {"added": len(set(class_ids)), "removed": 0, "entities": 0, "full": True}
+            print_info("Q" + str(class_root) + ": no subclass set of a previous run for " +
+                       ", ".join("Q" + str(root) for root in missing) + ", the class is " +
+                       ("not reclassified (dry run)" if self.dry_run else "classified in full"))
+            if self.dry_run:
+                return DeltaSelection([], [])
+            return DeltaSelection(self._full(class_ids, projection, class_root), None, self.members, sets)
+        (added, removed, changed) = (0, 0, set())
+        for (root, root_ids) in sets.items():
+            new = set(root_ids)
+            added += len(new - old[root])
+            removed += len(old[root] - new)
+            changed.update(old[root] ^ new)
+        ids = self.index.members(sorted(changed)) if changed else []
+        self.changes[class_root] = {"added": added, "removed": removed, "entities": len(ids), "full": False}
+        print_info("Q" + str(class_root) + ": " + str(added) + " classes added, " + str(removed) + " classes removed" +
+                   " in " + str(len(sets)) + " subclass set(s), " + str(len(ids)) + " entities to reclassify")
+        if self.dry_run:
+            return DeltaSelection([], [])
+        return DeltaSelection(self._items(ids, class_ids, projection), ["Q" + str(i) for i in ids], self.members, sets)
+
+    def _items(self, ids: typing.List[int], class_ids: typing.List[int], projection):
+        selected = set(class_ids)
+        for item in self.index.fetch(self.store, ids, storage.instance_projection(projection)):
+            if any(class_id in selected for class_id in storage.get_instance_of_ids(item)):
+                yield item
+
+    def _full(self, class_ids: typing.List[int], projection, class_root: int):
+        for item in self.store.find_instances(class_ids, projection, class_root=class_root):
+            self.changes[class_root]["entities"] += 1
+            yield item
+
+
+def explain(input_collection, members: membership.Membership, entity_id: str) -> typing.Dict[int, typing.List[int]]:
+    """Shows why an entity is selected: its P31 values in the materialized subclass sets
+
+    :param input_collection: dump store
+    :param members: membership of the dump <class 'NECKAr_membership.Membership'>
+    :param entity_id: id of the entity, e.g. 'Q79838' <class 'string'>
+    :return: dictionary class root -> P31 values of the entity in its set <class 'dict'>
+    """
+    item = input_collection.get(entity_id)
+    if item is None:
+        print_info(entity_id + " is not in the dump store")
+        return {}
+    instance_of = set(storage.get_instance_of_ids(item))
+    res = {}
+    for root in members.roots():
+        classes = sorted(instance_of.intersection(members.members(root)))
+        if classes:
+            res[root] = classes
+            print_info(entity_id + " is selected by Q" + str(root) + " through its P31 value(s) " +
+                       ", ".join("Q" + str(class_id) for class_id in classes))
+    if not res:
+        print_info(entity_id + " is in none of the subclass sets")
+    return res
+
+
+def reclassify(config: configparser.ConfigParser, flags: typing.Optional[typing.List[str]] = None,
+               dry_run: bool = False) -> typing.Dict[int, typing.Dict[str, int]]:
+    """Delta reclassification of the [Search_Flags] flags that use subclass trees
+
+    :param config: ConfigParser Object
+    :param flags: flags <class 'list'> | None (the flags with subclass trees switched on in NECKAr.cfg)
+    :param dry_run: if True the changes are only counted <class 'bool'>
+    :return: dictionary class root -> number of added and removed classes and of reclassified entities, and
+        whether the class was classified in full <class 'dict'>
+    """
+    if config.get('Output', 'mode', fallback='database') != 'database':
+        raise ValueError("the delta reclassification needs the output in the database ([Output] mode database)")
+    db = storage.from_config(config)
+    input_collection = db.store(config.get('Database', 'db_dump'), config.get('Database', 'collection_dump'))
+    output_collection = db.store(config.get('Database', 'db_write'), config.get('Database', 'collection_write'),
+                                 authenticate=True)
+    index = classindex.ClassIndex(classindex.index_store(config),
+                                  classindex.read_class_index_options(config)["fetch_batch"])
+    if not index.exists():
+        raise ValueError("the delta reclassification needs the P31 class index ([ClassIndex], load the dump again)")
+    store = DeltaStore(input_collection, index, membership.Membership(membership.membership_store(config)), dry_run)
+    if flags is None:
+        flags = [flag for flag in NECKAr_main.SEARCH_FLAGS if config.getboolean('Search_Flags', flag)]
+    tax = taxonomy.from_config(config)
+    for flag in flags:
+        if NECKAr_main.SEARCH_FLAGS[flag][2]:
+            NECKAr_main.search(flag, config, output_collection, store, tax)
+    if not dry_run and any(change["entities"] for change in store.changes.values()):
+        NECKAr_main.finish(config, output_collection, input_collection)
+        print_info("the LOD lists are created from the output, run create_LOD_lists.py to update them")
+    return store.changes
+
+
+if __name__ == "__main__":
+    """reclassifies the entities affected by changed subclass trees, the parameters are set in NECKAr.cfg"""
+
+    parser = argparse.ArgumentParser(description="NECKAr delta reclassification")
+    parser.add_argument("--config", default="../NECKAr.cfg", help="configuration file")
+    parser.add_argument("--flags", nargs="+", choices=list(NECKAr_main.SEARCH_FLAGS),
+                        help="[Search_Flags] flags (default: the flags switched on)")
+    parser.add_argument("--dry-run", action="store_true", help="only count the changed classes and entities")
+    parser.add_argument("--explain", nargs="+", metavar="QID",
+                        help="show the P31 values that bring these entities into the subclass sets")
+    args = parser.parse_args()
+
+    config = configparser.ConfigParser()
+    config.read(args.config)
+    metrics.start(config)
+    profiling.start(config)
+    bulk.configure(config)
+    if args.explain:
+        dump = storage.from_config(config).store(config.get('Database', 'db_dump'),
+                                                 config.get('Database', 'collection_dump'))
+        for entity_id in args.explain:
+            explain(dump, membership.Membership(membership.membership_store(config)), entity_id)
+    else:
+        reclassify(config, args.flags, args.dry_run)
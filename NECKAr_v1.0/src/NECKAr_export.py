@@ -0,0 +1,327 @@
+#! /usr/bin/env python3
+# This Python file uses the following encoding: utf-8
+
+#############################################################################
+#  NECKAr: file output                                                      #
+#    writes the classified entities directly to sharded, compressed JSONL   #
+#    files (one entity per line) instead of the output collection, so no    #
+#    mongoexport is needed afterwards. Each worker writes its own shards    #
+#    per class, e.g. NECKAr_PER_w0_00000.jsonl.gz, a new shard is started   #
+#    every shard_size entities. manifest.json lists every shard with its    #
+#    number of entities, size and sha256 checksum.                          #
+#############################################################################
+
+import bz2
+import datetime
+import glob
+import gzip
+import hashlib
+import io
+import json
+import lzma
+import os
+import sys
+import typing
+
+# codec -> (file extension, function opening a compressed binary stream on a file object)
+CODECS = {
+    "gzip": (".gz", lambda fileobj: gzip.GzipFile(fileobj=fileobj, mode="wb")),
+    "bz2": (".bz2", lambda fileobj: bz2.BZ2File(fileobj, "wb")),
+    "xz": (".xz", lambda fileobj: lzma.LZMAFile(fileobj, "wb")),
+    "none": ("", lambda fileobj: fileobj),
+}
+
+# codec -> function opening a compressed file for reading (text mode)
+READERS = {"gzip": gzip.open, "bz2": bz2.open, "xz": lzma.open, "none": open}
+
+MANIFEST = "manifest.json"
+
+
+def print_info(info):
+    print("INFO\tNECKAr:\t", info)
+
+
+class _HashingFile(object):
+    """Binary file that computes the sha256 checksum and the size of everything written to it"""
+
+    def __init__(self, path: str):
+        self.file = open(path, "wb")
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data) -> int:
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.file.write(data)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class Shard(object):
+    """One compressed JSONL file, written to <path>.tmp and renamed when it is closed
+
+    :param path: path of the shard <class 'string'>
+    :param codec: 'gzip', 'bz2', 'xz' or 'none' <class 'string'>
+    """
+
+    def __init__(self, path: str, codec: str):
+        self.path = path
+        self.raw = _HashingFile(path + ".tmp")
+        self.compressed = CODECS[codec][1](self.raw)
+        self.text = io.TextIOWrapper(self.compressed, encoding="utf-8", newline="\n")
+        self.entries = 0
+
+    def write(self, entry: typing.Dict[str, object]):
+        self.text.write(json.dumps(entry, ensure_ascii=False, default=str))
+        self.text.write("\n")
+        self.entries += 1
+
+    def close(self) -> typing.Dict[str, object]:
+        """:return: manifest record of the shard <class 'dict'>"""
+        self.text.flush()
+        if self.compressed is not self.raw:
+            self.compressed.close()
+        self.raw.close()
+        os.replace(self.path + ".tmp", self.path)
+        return {"file": os.path.basename(self.path), "entries": self.entries, "bytes": self.raw.size,
+                "sha256": self.raw.sha256.hexdigest()}
+
+
+class JSONLSink(object):
+    """Output 'store' writing the entries to sharded JSONL files. It supports the operations used by
+    NECKAr_main.classify and NECKAr_bulk.BulkWriter (insert_many, delete by neClass, get of an already written id),
+    the entries can not be queried or updated afterwards. The MongoDB _id is not written.
+
+    :param directory: output directory <class 'string'>
+    :param codec: 'gzip', 'bz2', 'xz' or 'none' <class 'string'>
+    :param shard_size: maximum number of entities per shard <class 'int'>
+    :param worker: number of the worker, part of the file names so workers never share a shard <class 'int'>
+    :param prefix: prefix of the file names <class 'string'>
+    """
+    # the shards are written by one thread (see NECKAr_bulk.BulkWriter concurrency)
+    thread_safe = False
+
+    def __init__(self, directory: str, codec: str = "gzip", shard_size: int = 1000000, worker: int = 0,
+                 prefix: str = "NECKAr"):
+        if codec not in CODECS:
+            raise ValueError("unknown codec: " + str(codec))
+        self.directory = directory
+        self.codec = codec
+        self.shard_size = shard_size
+        self.worker = worker
+        self.prefix = prefix
+        self.key = "id"
+        self.name = prefix
+        os.makedirs(directory, exist_ok=True)
+        self.manifest_path = os.path.join(directory, "manifest_w" + str(worker) + ".json")
+        # shards of earlier runs are kept unless their class is deleted (see delete)
+        self.shards = []
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, encoding="utf-8") as manifest_file:
+                self.shards = json.load(manifest_file)["shards"]
+        self.open_shards = {}
+        self.shard_numbers = {}
+        # code of the neClass of all written entities indexed by their numeric id, 0: not written (see get); one
+        # byte per id instead of a dictionary entry
+        self.written = bytearray()
+        # neClass -> code, code -> neClass
+        self.class_codes = {}
+        self.class_names = [None]
+
+    def _shard_name(self, ne_class: str, number: str) -> str:
+        return self.prefix + "_" + ne_class + "_w" + str(self.worker) + "_" + number + ".jsonl" + CODECS[self.codec][0]
+
+    def _shard_path(self, ne_class: str, number: int) -> str:
+        return os.path.join(self.directory, self._shard_name(ne_class, "%05d" % number))
+
+    def _class_code(self, ne_class: str) -> int:
+        code = self.class_codes.get(ne_class)
+        if code is None:
+            if len(self.class_names) > 255:
+                raise ValueError("too many neClasses for the written table, " + ne_class + " can not be added")
+            code = self.class_codes[ne_class] = len(self.class_names)
+            self.class_names.append(ne_class)
+        return code
+
+    def _close_shard(self, ne_class: str):
+        record = self.open_shards.pop(ne_class).close()
+        record["neClass"] = ne_class
+        record["worker"] = self.worker
+        self.shards.append(record)
+
+    def insert_many(self, docs: typing.List[typing.Dict[str, object]]):
+        for doc in docs:
+            ne_class = doc["neClass"]
+            shard = self.open_shards.get(ne_class)
+            if shard is None:
+                number = self.shard_numbers.get(ne_class, 0)
+                self.shard_numbers[ne_class] = number + 1
+                shard = self.open_shards[ne_class] = Shard(self._shard_path(ne_class, number), self.codec)
+            shard.write({field: value for field, value in doc.items() if field != "_id"})
+            number = int(doc["id"][1:])
+            if number >= len(self.written):
+                # grows at least by doubling
+                self.written.extend(bytes(max(number + 1, 2 * len(self.written)) - len(self.written)))
+            self.written[number] = self._class_code(ne_class)
+            if shard.entries >= self.shard_size:
+                self._close_shard(ne_class)
+
+    def replace_many(self, docs: typing.List[typing.Dict[str, object]]):
+        raise ValueError("write mode replace is not available for file output")
+
+    def get(self, value, projection=None):
+        """:return: id and neClass of an entity written by this sink | None"""
+        number = int(value[1:])
+        code = self.written[number] if number < len(self.written) else 0
+        return {"id": value, "neClass": self.class_names[code]} if code else None
+
+    def delete(self, where=None) -> int:
+        """Removes the shards of the given class (all shards of this worker if where is None)
+
+        :param where: {"neClass": <class>} | None
+        :return: number of removed entities <class 'int'>
+        """
+        ne_class = (where or {}).get("neClass")
+        removed = 0
+        for shard_class in list(self.open_shards):
+            if ne_class is None or shard_class == ne_class:
+                self._close_shard(shard_class)
+        kept = []
+        for record in self.shards:
+            if ne_class is None or record["neClass"] == ne_class:
+                if os.path.exists(os.path.join(self.directory, record["file"])):
+                    os.remove(os.path.join(self.directory, record["file"]))
+                removed += record["entries"]
+            else:
+                kept.append(record)
+        self.shards = kept
+        # shards of interrupted runs that are not in the manifest
+        pattern = os.path.join(glob.escape(self.directory),
+                               self._shard_name(glob.escape(ne_class) if ne_class else "*", "*"))
+        for path in glob.glob(pattern) + glob.glob(pattern + ".tmp"):
+            os.remove(path)
+        if ne_class is None:
+            self.written = bytearray()
+        elif ne_class in self.class_codes:
+            table = bytearray(range(256))
+            table[self.class_codes[ne_class]] = 0
+            self.written = self.written.translate(table)
+        if ne_class is None:
+            self.shard_numbers = {}
+        else:
+            self.shard_numbers.pop(ne_class, None)
+        return removed
+
+    def count(self, where=None) -> int:
+        ne_class = (where or {}).get("neClass")
+        return sum(record["entries"] for record in self.shards if ne_class is None or record["neClass"] == ne_class) \
+            + sum(shard.entries for c, shard in self.open_shards.items() if ne_class is None or c == ne_class)
+
+    def ensure_index(self, fields, partial_exists=None, name=None):
+        pass
+
+    def close(self) -> typing.Dict[str, object]:
+        """Closes all open shards and writes the manifest of this worker
+
+        :return: manifest of this worker <class 'dict'>
+        """
+        for ne_class in list(self.open_shards):
+            self._close_shard(ne_class)
+        manifest = {"worker": self.worker, "codec": self.codec, "shard_size": self.shard_size,
+                    "shards": sorted(self.shards, key=lambda record: record["file"])}
+        with open(self.manifest_path + ".tmp", "w", encoding="utf-8") as manifest_file:
+            json.dump(manifest, manifest_file, indent=1)
+        os.replace(self.manifest_path + ".tmp", self.manifest_path)
+        return manifest
+
+
+def write_manifest(directory: str) -> typing.Dict[str, object]:
+    """Combines the manifests of all workers to manifest.json (shards and the number of entities per class)
+
+    :param directory: output directory <class 'string'>
+    :return: manifest <class 'dict'>
+    """
+    shards = []
+    codecs = set()
+    for path in sorted(glob.glob(os.path.join(directory, "manifest_w*.json"))):
+        with open(path, encoding="utf-8") as manifest_file:
+            worker_manifest = json.load(manifest_file)
+        codecs.add(worker_manifest["codec"])
+        shards.extend(worker_manifest["shards"])
+    classes = {}
+    for record in shards:
+        counts = classes.setdefault(record["neClass"], {"entries": 0, "shards": 0, "bytes": 0})
+        counts["entries"] += record["entries"]
+        counts["shards"] += 1
+        counts["bytes"] += record["bytes"]
+    manifest = {"created": datetime.datetime.now().isoformat(timespec="seconds"), "format": "jsonl",
+                "codec": codecs.pop() if len(codecs) == 1 else sorted(codecs),
+                "entries": sum(counts["entries"] for counts in classes.values()),
+                "classes": classes, "shards": sorted(shards, key=lambda record: record["file"])}
+    with open(os.path.join(directory, MANIFEST + ".tmp"), "w", encoding="utf-8") as manifest_file:
+        json.dump(manifest, manifest_file, indent=1)
+    os.replace(os.path.join(directory, MANIFEST + ".tmp"), os.path.join(directory, MANIFEST))
+    print_info("OUTPUT " + str(manifest["entries"]) + " entities in " + str(len(shards)) + " shards: " +
+               ", ".join(ne_class + " " + str(counts["entries"]) for ne_class, counts in sorted(classes.items())))
+    sys.stdout.flush()
+    return manifest
+
+
+def read_manifest(directory: str) -> typing.Dict[str, object]:
+    with open(os.path.join(directory, MANIFEST), encoding="utf-8") as manifest_file:
+        return json.load(manifest_file)
+
+
+def verify_manifest(directory: str) -> typing.List[str]:
+    """Compares size and sha256 checksum of all shards with manifest.json
+
+    :param directory: output directory <class 'string'>
+    :return: files that are missing or do not match (empty if everything is fine) <class 'list'>
+    """
+    failed = []
+    for record in read_manifest(directory)["shards"]:
+        path = os.path.join(directory, record["file"])
+        if not os.path.exists(path) or os.path.getsize(path) != record["bytes"]:
+            failed.append(record["file"])
+            continue
+        sha256 = hashlib.sha256()
+        with open(path, "rb") as shard_file:
+            for chunk in iter(lambda: shard_file.read(1 << 20), b""):
+                sha256.update(chunk)
+        if sha256.hexdigest() != record["sha256"]:
+            failed.append(record["file"])
+    return failed
+
+
+def iter_entities(directory: str, ne_classes: typing.Optional[typing.Iterable[str]] = None):
+    """Streams the entities of all shards listed in manifest.json
+
+    :param directory: output directory <class 'string'>
+    :param ne_classes: only the shards of these classes <class 'list'> | None (all)
+    :return: generator of entities <class 'dict'>
+    """
+    ne_classes = set(ne_classes) if ne_classes else None
+    manifest = read_manifest(directory)
+    for record in manifest["shards"]:
+        if ne_classes is not None and record["neClass"] not in ne_classes:
+            continue
+        codec = next((codec for codec, (extension, _) in CODECS.items()
+                      if extension and record["file"].endswith(extension)), "none")
+        with READERS[codec](os.path.join(directory, record["file"]), "rt", encoding="utf-8") as shard_file:
+            for line in shard_file:
+                yield json.loads(line)
+
+
+if __name__ == "__main__":
+    """checks the shards of an output directory against manifest.json"""
+
+    directory = sys.argv[1] if len(sys.argv) > 1 else "../output"
+    failed = verify_manifest(directory)
+    if failed:
+        print_info("OUTPUT checksum mismatch: " + ", ".join(failed))
+        sys.exit(1)
+    print_info("OUTPUT all shards match " + os.path.join(directory, MANIFEST))
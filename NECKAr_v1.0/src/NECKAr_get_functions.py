@@ -28,6 +28,9 @@ __author__ = 'jgeiss'
 #This code find all the auxillary information which is to be stored with each entity of all listed categories
 
 import typing
+import unicodedata
+
+from NECKAr_metrics import METRICS
 
 ######################################################################################################
 # Common Fields
@@ -282,30 +285,77 @@ def get_occupation(json_object: typing.Dict[str, str]) -> typing.List[str]:
                         occupation.append(props["mainsnak"]["datavalue"]["value"]["numeric-id"])
     return occupation
 
-def get_alias_list(json_object: typing.Dict[str, str]) -> typing.List[str]:
+def get_alias_list(json_object: typing.Dict[str, str], languages: typing.Optional[typing.Sequence[str]] = None,
+                   max_aliases: typing.Optional[int] = None, normalization: typing.Optional[str] = None,
+                   casefold: bool = False) -> typing.List[str]:
     """Gets aliases and other language labels of a person
+        Labels are collected before aliases. If languages is given, only these languages are used (in the given
+        order), otherwise all languages of the item are used. Duplicates are removed on the (optionally normalized and
+        case-folded) alias, the first occurrence is kept.
 
     :param json_object: entity object <class 'dict'>
+    :param languages: allow-list of language codes, e.g. ['en', 'de'] | None for all languages
+    :param max_aliases: maximum number of aliases returned per entity | None (or 0) for no limit
+    :param normalization: Unicode normalization form ('NFC', 'NFKC', 'NFD', 'NFKD') | None
+    :param casefold: if True aliases differing only in case are treated as duplicates <class 'bool'>
     :return: aliaslist (list of strings)
     """
-    aliaslist = set([])
+    aliaslist = []
+    seen = set()
+
+    def add_alias(alias):
+        if normalization:
+            alias = unicodedata.normalize(normalization, alias)
+        key = alias.casefold() if casefold else alias
+        if key not in seen:
+            seen.add(key)
+            aliaslist.append(alias)
+        return bool(max_aliases) and len(aliaslist) >= max_aliases
+
     if "labels" in json_object:
         labels = json_object["labels"]
-        for lang in labels:  #get language labels
+        for lang in (languages if languages else labels):  #get language labels
+            if lang not in labels:
+                continue
             alias = labels[lang]["value"]
             if len(alias) > 125:
                 alias = alias[:125]
-            aliaslist.add(alias)
+            if add_alias(alias):
+                return aliaslist
 
     if "aliases" in json_object:
         aliases = json_object["aliases"]  #get language aliases
-        for lang in aliases:
+        for lang in (languages if languages else aliases):
+            if lang not in aliases:
+                continue
             for aliasentry in aliases[lang]:
                 alias = aliasentry["value"]
                 if len(alias) > 124:
                     alias = alias[:124]
-                aliaslist.add(alias)
-    return list(aliaslist)
+                if add_alias(alias):
+                    return aliaslist
+    return aliaslist
+
+
+def get_alias_volume(json_object: typing.Dict[str, str]) -> typing.Tuple[int, int]:
+    """Gets the number of all labels and aliases of an item in all languages and their size in bytes (UTF-8),
+        i.e. the alias volume before any language filter, cap or dedupe is applied
+
+    :param json_object: entity object <class 'dict'>
+    :return: tuple of number of labels/aliases (int) and their size in bytes (int)
+    """
+    count = 0
+    size = 0
+    if "labels" in json_object:
+        for label in json_object["labels"].values():
+            count += 1
+            size += len(label["value"][:125].encode("utf-8"))
+    if "aliases" in json_object:
+        for aliasentries in json_object["aliases"].values():
+            for aliasentry in aliasentries:
+                count += 1
+                size += len(aliasentry["value"][:124].encode("utf-8"))
+    return count, size
 
 #################################################################################################
 #########################
@@ -452,6 +502,41 @@ def get_geonamesID(json_object):
 
 
 
+#################################################################################################
+
+#########################
+#Links to Linked Open Data
+#########################
+
+# properties holding ids in other databases and the field names they are stored in
+LOD_properties = [("P345", "IMDB_id"),
+                  ("P434", "MusicBrainzArtist_id"),
+                  ("P227", "GND_id"),
+                  ("P1566", "geonames_id"),
+                  ("P402", "OSM_id")]
+
+
+def get_LOD_ids(json_object: typing.Dict[str, object]) -> typing.Dict[str, str]:
+    """gets the ids of the entity in other databases (IMDb, MusicBrainz, GND, GeoNames, OpenStreetMap)
+        only the first claim of each property (see LOD_properties) is used, a claim without value (novalue or
+        somevalue) is counted as lod_ids_missing_total{property=...}
+
+    :param json_object: entity object <class 'dict'>
+    :return: dictionary field name -> id <class 'dict'>
+    """
+    lod_ids = {}
+    if "claims" in json_object:  # if claims are available for the item
+        claims = json_object["claims"]
+        for prop, field in LOD_properties:
+            if prop in claims:
+                mainsnak = claims[prop][0]["mainsnak"]
+                if mainsnak["snaktype"] == "value":
+                    lod_ids[field] = mainsnak["datavalue"]["value"]
+                else:
+                    METRICS.inc("lod_ids_missing_total", property=prop)
+    return lod_ids
+
+
 #################################################################################################
 
 #########################
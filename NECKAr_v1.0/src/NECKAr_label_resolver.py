@@ -0,0 +1,172 @@
+#! /usr/bin/env python3
+# This Python file uses the following encoding: utf-8
+
+#############################################################################
+#  NECKAr: label resolution for referenced entities                        #
+#    fields like occupation, founder or in_country only store the numeric  #
+#    Q-ids of the referenced entities. This optional enrichment stage      #
+#    resolves them to labels (one $in query per batch, backed by an LRU    #
+#    cache) and writes them next to the ids, e.g. occupation_label         #
+#############################################################################
+
+import collections
+import sys
+import typing
+import NECKAr_get_functions as get_functions
+
+# fields of the output collection holding Q-ids of other entities
+LABEL_FIELDS = ["occupation", "founder", "ceo", "in_country", "hq_location", "official_language", "event_location"]
+
+# languages that are fetched from the dump to build a label (same preference as get_functions.get_label)
+LABEL_LANGUAGES = ["en", "en-gb", "en-ca", "de"]
+
+
+def print_info(info):
+    print("INFO\tNECKAr:\t", info)
+
+
+class LabelCache(object):
+    """Bounded LRU cache Wikidata id -> label
+
+    :param maxsize: maximum number of cached labels <class 'int'>
+    """
+
+    def __init__(self, maxsize: int = 100000):
+        self.maxsize = maxsize
+        self.labels = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, wdid: str) -> bool:
+        return wdid in self.labels
+
+    def get(self, wdid: str) -> typing.Optional[str]:
+        if wdid in self.labels:
+            self.hits += 1
+            self.labels.move_to_end(wdid)
+            return self.labels[wdid]
+        self.misses += 1
+        return None
+
+    def put(self, wdid: str, label: str):
+        self.labels[wdid] = label
+        self.labels.move_to_end(wdid)
+        if len(self.labels) > self.maxsize:
+            self.labels.popitem(last=False)
+
+
+def to_wdid(value: typing.Union[int, str]) -> str:
+    """Converts a numeric id (e.g. 5) or an id string (e.g. 'Q5') to the Wikidata id string
+
+    :param value: numeric id <class 'int'> | id <class 'string'>
+    :return: id <class 'string'>
+    """
+    if isinstance(value, int):
+        return "Q" + str(value)
+    return value
+
+
+def get_referenced_ids(entry: typing.Dict[str, object],
+                       fields: typing.Iterable[str] = LABEL_FIELDS) -> typing.Set[str]:
+    """Gets all Wikidata ids referenced in the given fields of an output entry
+
+    :param entry: output entry <class 'dict'>
+    :param fields: fields holding ids
+    :return: set of ids <class 'set'>
+    """
+    ids = set()
+    for field in fields:
+        value = entry.get(field)
+        if value is None:
+            continue
+        if isinstance(value, list):
+            ids.update(to_wdid(v) for v in value)
+        else:
+            ids.add(to_wdid(value))
+    return ids
+
+
+def resolve_labels(wdids: typing.Iterable[str], input_collection, cache: LabelCache) -> typing.Dict[str, str]:
+    """Resolves Wikidata ids to labels, ids missing in the cache are fetched with a single $in query
+
+    :param wdids: Wikidata ids <class 'string'>
+    :param input_collection: store of the Wikidata dump
+    :param cache: label cache <class 'LabelCache'>
+    :return: dictionary id -> label (the id itself if the entity has no label or is not in the dump)
+    """
+    labels = {}
+    missing = []
+    for wdid in wdids:
+        label = cache.get(wdid)
+        if label is None:
+            missing.append(wdid)
+        else:
+            labels[wdid] = label
+    if missing:
+        projection = {"id": 1, "_id": 0}
+        for lang in LABEL_LANGUAGES:
+            projection["labels." + lang] = 1
+        for wdid, doc in input_collection.get_many(missing, projection).items():
+            labels[wdid] = get_functions.get_label(doc, wdid)
+        for wdid in missing:
+            label = labels.setdefault(wdid, wdid)
+            cache.put(wdid, label)
+    return labels
+
+
+def enrich_batch(batch: typing.List[typing.Dict[str, object]], output_collection, input_collection,
+                 cache: LabelCache, fields: typing.Iterable[str] = LABEL_FIELDS) -> int:
+    """Writes labels next to the ids of all entries of a batch (e.g. occupation -> occupation_label)
+
+    :param batch: list of output entries, each with id and the fields to be resolved
+    :param output_collection: store the entries are updated in
+    :param input_collection: store of the Wikidata dump
+    :param cache: label cache <class 'LabelCache'>
+    :param fields: fields holding ids
+    :return: number of updated entries <class 'int'>
+    """
+    wdids = set()
+    for entry in batch:
+        wdids.update(get_referenced_ids(entry, fields))
+    labels = resolve_labels(wdids, input_collection, cache)
+
+    updates = {}
+    for entry in batch:
+        update = {}
+        for field in fields:
+            value = entry.get(field)
+            if value is None:
+                continue
+            if isinstance(value, list):
+                update[field + "_label"] = [labels[to_wdid(v)] for v in value]
+            else:
+                update[field + "_label"] = labels[to_wdid(value)]
+        if update:
+            updates[entry["id"]] = update
+    output_collection.update_many(updates)
+    return len(updates)
+
+
+def enrich_labels(output_collection, input_collection, batch_size: int = 1000, cache_size: int = 100000,
+                  fields: typing.Iterable[str] = LABEL_FIELDS):
+    """Enrichment stage: resolves the ids of all referenced entities in the output collection to labels
+
+    :param output_collection: store with the classified entities
+    :param input_collection: store of the Wikidata dump
+    :param batch_size: number of entries resolved with one query <class 'int'>
+    :param cache_size: maximum number of cached labels <class 'int'>
+    :param fields: fields holding ids
+    :return: nothing, writes the labels directly to the output store
+    """
+    fields = list(fields)
+    cache = LabelCache(cache_size)
+    print_info("Resolve labels of referenced entities...")
+    projection = {field: 1 for field in fields}
+    projection["id"] = 1
+    updated = 0
+    for batch in output_collection.scan_pages(exists_any=fields, projection=projection, page_size=batch_size):
+        updated += enrich_batch(batch, output_collection, input_collection, cache, fields)
+        print_info("LABEL " + str(updated) + " entries enriched")
+        sys.stdout.flush()
+    print_info("LABEL " + str(updated) + " entries enriched, cache hits: " + str(cache.hits) + " misses: " +
+               str(cache.misses))
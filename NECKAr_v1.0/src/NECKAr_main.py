@@ -33,13 +33,27 @@ __author__ = 'jgeiss'
 ### Importing modules
 import inspect
 import sys
+import time
+import collections
 import configparser
-from pymongo import *
-from pymongo import errors
+import contextlib
+import functools
+import typing
 import NECKAr_get_functions as get_functions
-from NECKAr_WikidataAPI import get_wikidata_item_tree_item_idsSPARQL
 # from  NECKAr_wikidata_processor import WikiDataProcessor
 import NECKAr_write_functions as write_functions
+import NECKAr_label_resolver as label_resolver
+import NECKAr_bulk as bulk
+import NECKAr_classindex as classindex
+import NECKAr_membership as membership
+import NECKAr_metrics as metrics
+import NECKAr_pipeline
+import NECKAr_profiling as profiling
+import NECKAr_storage as storage
+import NECKAr_export as export
+import NECKAr_taxonomy as taxonomy
+from NECKAr_bulk import BulkWriter
+from NECKAr_metrics import METRICS
 
 LABELS_TO_WIKIDATA_INT_IDS = {
     'ANG': ['Q315'],
@@ -69,547 +83,548 @@ def read_config(config: configparser.ConfigParser):
     """Reads the configuration file NECKAr.cfg
 
     :param config: ConfigParser Object
-    :return: input and output collection
+    :return: input and output store (see NECKAr_storage)
     """
-
-    host = config.get('Database', 'host')
-    port = config.getint('Database', 'port')
-
-    auth = config.getboolean('Database', 'auth')
-    user = config.get('Database', 'user')
-    password = config.get('Database', 'password')
-
-    try:
-        client = MongoClient(host, port)
-    except errors.ConnectionFailure:
-        print("Connection to the database cannot be made. Please check the config file")
-
-    db_read_name = config.get('Database', 'db_dump')
-    db_write_name = config.get('Database', 'db_write')
-    db_in = client[db_read_name]  # Database from where information is extracted
-    db_out = client[db_write_name]  # Database in which information is written
-    if auth:
-        db_out.authenticate(user, password)
-
-    input_collection_name = config.get('Database', 'collection_dump')
-    input_collection = db_in[input_collection_name]
-    output_collection_name = config.get('Database', 'collection_write')
-    output_collection = db_out[output_collection_name]
+    db = storage.from_config(config)
+    input_collection = db.store(config.get('Database', 'db_dump'), config.get('Database', 'collection_dump'))
+    # selections over many classes use the P31 class index ([ClassIndex])
+    input_collection = classindex.from_config(config, input_collection)
+    # selections with a root class are materialized and joined with the dump ([Membership])
+    input_collection = membership.from_config(config, input_collection)
+    output_collection = db.store(config.get('Database', 'db_write'), config.get('Database', 'collection_write'),
+                                 authenticate=True)
     print("Config File read in")
     return input_collection, output_collection
 
 
-def find_persons(output_collection, input_collection):
+def read_output(config: configparser.ConfigParser, output_collection, worker: int = 0):
+    """Reads the output options (section Output) of the configuration file NECKAr.cfg
+
+    :param config: ConfigParser Object
+    :param output_collection: output store, used in mode database
+    :param worker: number of the worker writing to the sink (mode jsonl) <class 'int'>
+    :return: output store | <class 'NECKAr_export.JSONLSink'> (mode jsonl)
+    """
+    mode = config.get('Output', 'mode', fallback='database')
+    if mode == 'database':
+        return output_collection
+    if mode != 'jsonl':
+        raise ValueError("unknown output mode: " + mode)
+    return export.JSONLSink(config.get('Output', 'directory', fallback='../output'),
+                            codec=config.get('Output', 'codec', fallback='gzip'),
+                            shard_size=config.getint('Output', 'shard_size', fallback=1000000), worker=worker)
+
+
+def read_alias_options(config: configparser.ConfigParser) -> typing.Dict[str, object]:
+    """Reads the alias options (section Aliases) of the configuration file NECKAr.cfg
+
+    :param config: ConfigParser Object
+    :return: keyword arguments for get_functions.get_alias_list <class 'dict'>
+    """
+    languages = config.get('Aliases', 'languages', fallback='')
+    normalization = config.get('Aliases', 'normalization', fallback='').strip().upper()
+    if normalization and normalization not in ("NFC", "NFKC", "NFD", "NFKD"):
+        raise ValueError("unknown alias normalization: " + normalization + " (NFC, NFKC, NFD or NFKD)")
+    return {"languages": [lang.strip() for lang in languages.split(",") if lang.strip()] or None,
+            "max_aliases": config.getint('Aliases', 'max_aliases', fallback=0) or None,
+            "normalization": normalization or None,
+            "casefold": config.getboolean('Aliases', 'casefold', fallback=False)}
+
+
+def classify(ne_class: str, output_collection, items: typing.Iterable[typing.Dict[str, object]],
+             extract: typing.Callable[[typing.Dict[str, object]], typing.Dict[str, object]],
+             pipeline: typing.Optional[typing.Dict[str, int]] = None) -> int:
+    """Classification loop of one class: removes the old entries of the class, extracts an entry for every item
+    and writes the entries in bulk
+
+    :param ne_class: neClass, e.g. 'PER' <class 'string'>
+    :param output_collection: output store
+    :param items: items of the class (e.g. from input_collection.find_instances); if they have the attribute
+        entity_ids (see NECKAr_delta.DeltaSelection) only the entries of these entities are removed and the items
+        replace them; if they have the method commit (see NECKAr_membership.Selection) it is called once all entries
+        are written
+    :param extract: function item -> entry
+    :param pipeline: keyword arguments of NECKAr_pipeline.Pipeline: the cursor is read in a fetch thread and the
+        entries are written in a writer thread | None (serial loop)
+    :return: number of written entries <class 'int'>
+    """
+    entity_ids = getattr(items, "entity_ids", None)
+    if entity_ids is None:
+        print_info(ne_class + "\tRemove all entries")
+        output_collection.delete({"neClass": ne_class})
+    else:
+        print_info(ne_class + "\tRemove the entries of " + str(len(entity_ids)) + " reclassified entities")
+        output_collection.delete_many(entity_ids, {"neClass": ne_class})
+    print_info(ne_class + "\tBeginning of loop")
+    writer = BulkWriter(output_collection, ne_class)
+    pipe = NECKAr_pipeline.Pipeline(ne_class, **pipeline) if pipeline is not None else None
+    with profiling.section(ne_class=ne_class):
+        with pipe.writer(writer.write) if pipe else contextlib.nullcontext(writer.write) as write:
+            for item in profiling.profile_items(pipe.prefetch(items) if pipe else items):
+                start = time.perf_counter()
+                entry = extract(item)
+                METRICS.observe("extract_seconds", time.perf_counter() - start, neClass=ne_class)
+                doc = output_collection.get(entry["id"])
+                if (not doc or doc["neClass"] != ne_class):
+                    write(entry)
+        count = writer.close()
+    if hasattr(items, "commit"):
+        # e.g. the subclass sets become the base of the next delta only if the class is classified
+        items.commit()
+    if pipe:
+        pipe.report()
+    print_info(ne_class + "\t" + str(count) + " entries written")
+    sys.stdout.flush()
+    return count
+
+
+def extract_person(item, alias_options: typing.Dict[str, object], lod_ids: bool = False,
+                   alias_volume: typing.Optional[typing.Dict[str, int]] = None):
+    """Extracts the entry of a person
+
+    :param item: entity object <class 'dict'>
+    :param alias_options: keyword arguments for get_functions.get_alias_list
+    :param lod_ids: if True the ids in other databases are stored with the entity
+    :param alias_volume: counters of the alias volume before/after filtering, updated in place <class 'dict'> | None
+    :return: entry <class 'dict'>
+    """
+    entry = write_functions.write_common_fields(item, lod_ids)
+    entry["neClass"] = "PER"
+
+    # date of birth
+    dob = get_functions.get_datebirth(item)
+    if dob:
+        entry["date_birth"] = dob
+    # date of death
+    dod = get_functions.get_datedeath(item)
+    if dod:
+        entry["date_death"] = dod
+    # gender
+    gender = get_functions.get_gender(item)
+    if gender:
+        entry["gender"] = gender
+    # occupation
+    occupation = get_functions.get_occupation(item)
+    if len(occupation) > 0:
+        entry["occupation"] = occupation
+    # aliases, alternative names
+    alias = get_functions.get_alias_list(item, **alias_options)
+    if len(alias) > 0:
+        entry["alias"] = alias
+    if alias_volume is not None:
+        (count, size) = get_functions.get_alias_volume(item)
+        alias_volume["count_all"] += count
+        alias_volume["bytes_all"] += size
+        alias_volume["count_kept"] += len(alias)
+        alias_volume["bytes_kept"] += sum(len(a.encode("utf-8")) for a in alias)
+    return entry
+
+
+def find_persons(output_collection, input_collection, alias_options: typing.Optional[typing.Dict[str, object]] = None,
+                 lod_ids: bool = False, pipeline: typing.Optional[typing.Dict[str, int]] = None):
     """Finds person in Wikidata dump and stores them together with additional information in the output collection
 
     :param output_collection:
     :param input_collection:
-    :return: nothing, writes objects directly to MongoDB
+    :param alias_options: keyword arguments for get_functions.get_alias_list (see read_alias_options) | None
+    :param lod_ids: if True the ids in other databases are stored with each entity (see [LOD] lookup_mode)
+    :param pipeline: options of the threaded pipeline (see NECKAr_pipeline.read_pipeline_options) | None
+        (serial loop)
+    :return: nothing, writes objects directly to the output store
     """
-
-    per_insert = 0
-    insert_count = 0
-    bulk = output_collection.initialize_unordered_bulk_op()
+    if alias_options is None:
+        alias_options = {}
+    alias_volume = {"count_all": 0, "bytes_all": 0, "count_kept": 0, "bytes_kept": 0}
     print_info("Find persons...")
-    print_info("Remove all persons entries")
-    output_collection.remove({"neClass": "PER"})
-    print_info("--- DONE")
-    person_cursor = input_collection.find(
-        {"$and": [{"type": "item"}, {"claims.P31.mainsnak.datavalue.value.numeric-id": 5}]})
-    print_info("Beginning of person-loop")
-    for item in person_cursor:
-        entry = write_functions.write_common_fields(item)
-        entry["neClass"] = "PER"
-
-        # date of birth
-        dob = get_functions.get_datebirth(item)
-        if dob:
-            entry["date_birth"] = dob
-        # date of death
-        dod = get_functions.get_datedeath(item)
-        if dod:
-            entry["date_death"] = dod
-        # gender
-        gender = get_functions.get_gender(item)
-        if gender:
-            entry["gender"] = gender
-        # occupation
-        occupation = get_functions.get_occupation(item)
-        if len(occupation) > 0:
-            entry["occupation"] = occupation
-        # aliases, alternative names
-        alias = get_functions.get_alias_list(item)
-        if len(alias) > 0:
-            entry["alias"] = alias
-
-        wdid = entry["id"]
-        doc = output_collection.find_one({"id": wdid})
-        if (not doc or doc["neClass"] != "PER"):
-            insert_count += 1
-            bulk.insert(entry)
-        if insert_count == 1000:
-            per_insert += 1
-            print_info("PER " + str(per_insert * 1000) + "persons written")
-            sys.stdout.flush()
-            bulk.execute()
-            bulk = output_collection.initialize_unordered_bulk_op()
-            insert_count = 0
-    if insert_count > 0:
-        bulk.execute()
-
-
-def find_locations(output_collection, input_collection):
+    classify("PER", output_collection, input_collection.find_instances([5]),
+             functools.partial(extract_person, alias_options=alias_options, lod_ids=lod_ids,
+                               alias_volume=alias_volume), pipeline=pipeline)
+    print_info("PER alias volume before: " + str(alias_volume["count_all"]) + " aliases, " +
+               str(alias_volume["bytes_all"]) + " bytes")
+    print_info("PER alias volume after: " + str(alias_volume["count_kept"]) + " aliases, " +
+               str(alias_volume["bytes_kept"]) + " bytes")
+
+
+def get_location_subclasses(tax: taxonomy.Taxonomy) -> typing.Dict[str, typing.List[int]]:
+    """Gets the subclass trees needed to classify locations and their location types
+
+    :param tax: taxonomy <class 'NECKAr_taxonomy.Taxonomy'>
+    :return: dictionary name -> list of subclass ids, names are 'geolocation' and the parameters of get_poi
+    """
+    subclasses = {}
+    geolocation_subclass = tax.subclasses(taxonomy.GEOLOCATION)
+    food_subclass = tax.subclasses(taxonomy.FOOD)
+    subclasses["geolocation"] = list(set(geolocation_subclass) - set(food_subclass))
+    print_info("LOC\t" + str(len(subclasses["geolocation"])) + str(type(subclasses["geolocation"])))
+
+    subclasses["settlement_subclass"] = tax.subclasses(taxonomy.SETTLEMENT)
+
+    country_subclass = tax.subclasses(taxonomy.COUNTRY)
+    sovereignstate_subclass = tax.subclasses(taxonomy.SOVEREIGN_STATE)
+    ccountry_subclass = tax.subclasses(taxonomy.CONSTITUENT_COUNTRY)
+    subclasses["country_subclass"] = country_subclass + sovereignstate_subclass + ccountry_subclass
+
+    subclasses["sea_subclass"] = tax.subclasses(taxonomy.SEA)
+    subclasses["state_subclass"] = tax.subclasses(taxonomy.STATE)
+    subclasses["city_subclass"] = tax.subclasses(taxonomy.CITY)
+    subclasses["river_subclass"] = tax.subclasses(taxonomy.RIVER)
+    subclasses["mountain_subclass"] = tax.subclasses(taxonomy.MOUNTAIN)
+    subclasses["mountainr_subclass"] = tax.subclasses(taxonomy.MOUNTAIN_RANGE)
+    # POI_subclass= WikiDataProcessor.get_wikidata_item_tree_item_idsSPARQL([XXX], backward_properties=[279])
+    subclasses["hgte_subclass"] = tax.subclasses(taxonomy.HGTE)
+    return subclasses
+
+
+def extract_location(item, poi_subclasses: typing.Dict[str, typing.List[int]], lod_ids: bool = False):
+    """Extracts the entry of a location
+
+    :param item: entity object <class 'dict'>
+    :param poi_subclasses: keyword arguments for get_functions.get_poi (subclass lists of the location types)
+    :param lod_ids: if True the ids in other databases are stored with the entity
+    :return: entry <class 'dict'>
+    """
+    entry = write_functions.write_common_fields(item, lod_ids)
+    entry["neClass"] = "LOC"
+
+    (incountry, incontinent) = get_functions.get_location_inside(item)
+    if len(incountry) != 0:
+        entry["in_country"] = incountry
+    if len(incontinent) != 0:
+        entry["in_continent"] = incountry
+
+    loc_type = get_functions.get_poi(item, **poi_subclasses)
+    if len(loc_type) != 0:
+        entry["location_type"] = loc_type
+
+    coordinate = get_functions.get_coordinate(item)
+    if coordinate:
+        # { type: "Point", coordinates: [ 40, 5 ] }
+        entry["coordinate"] = coordinate
+
+    population = get_functions.get_population(item)
+    if population:
+        entry["population"] = population
+
+    # is part of LOD Link list
+    # GN_ID = get_functions.get_geonamesID(item)
+    # if GN_ID:
+    #     entry["geonamesID"] = GN_ID
+    return entry
+
+
+def find_locations(output_collection, input_collection, lod_ids: bool = False,
+                   tax: typing.Optional[taxonomy.Taxonomy] = None,
+                   pipeline: typing.Optional[typing.Dict[str, int]] = None):
     """
     Finds locations in Wikidata dump and stores them together with additional information in the output collection
 
     :param output_collection:
     :param input_collection:
-    :return: nothing, writes objects directly to MongoDB
+    :param lod_ids: if True the ids in other databases are stored with each entity (see [LOD] lookup_mode)
+    :param tax: subclass trees <class 'NECKAr_taxonomy.Taxonomy'> | None (SPARQL, not cached)
+    :param pipeline: options of the threaded pipeline (see NECKAr_pipeline.read_pipeline_options) | None
+        (serial loop)
+    :return: nothing, writes objects directly to the output store
     """
     # Location Specific
-    loc_insert = 0
-    insert_count = 0
-    bulk = output_collection.initialize_unordered_bulk_op()
-    output_collection.remove({"neClass": "LOC"})
-    print_info("LOC\tremoved old locations")
-
-    geolocation_subclass = get_wikidata_item_tree_item_idsSPARQL([2221906], backward_properties=[279])
-    food_subclass = get_wikidata_item_tree_item_idsSPARQL([2095], backward_properties=[279])
-    geolocation_subclass = list(set(geolocation_subclass) - set(food_subclass))
-    print_info("LOC\t" + str(len(geolocation_subclass)) + str(type(geolocation_subclass)))
-
-    settlement_subclass = get_wikidata_item_tree_item_idsSPARQL([486972], backward_properties=[279])
-
-    country_subclass = get_wikidata_item_tree_item_idsSPARQL([6256], backward_properties=[279])
-    sovereignstate_subclass = get_wikidata_item_tree_item_idsSPARQL([3624078], backward_properties=[279])
-    ccountry_subclass = get_wikidata_item_tree_item_idsSPARQL([1763527], backward_properties=[279])
-    country_subclass += sovereignstate_subclass + ccountry_subclass
-
-    sea_subclass = get_wikidata_item_tree_item_idsSPARQL([165], backward_properties=[279])
-    state_subclass = get_wikidata_item_tree_item_idsSPARQL([7275], backward_properties=[279])
-    city_subclass = get_wikidata_item_tree_item_idsSPARQL([515], backward_properties=[279])
-    river_subclass = get_wikidata_item_tree_item_idsSPARQL([4022], backward_properties=[279])
-    mountain_subclass = get_wikidata_item_tree_item_idsSPARQL([8502], backward_properties=[279])
-    mountainr_subclass = get_wikidata_item_tree_item_idsSPARQL([1437459], backward_properties=[279])
-    # POI_subclass= WikiDataProcessor.get_wikidata_item_tree_item_idsSPARQL([XXX], backward_properties=[279])
-    hgte_subclass = get_wikidata_item_tree_item_idsSPARQL([15642541], backward_properties=[279])
-
+    tax = tax or taxonomy.Taxonomy()
+    poi_subclasses = get_location_subclasses(tax)
+    geolocation_subclass = poi_subclasses.pop("geolocation")
+    # the location types depend on the other trees, the delta reclassification diffs them too
+    related = {root: tax.subclasses(root) for root in taxonomy.LOCATION_ROOTS if root != taxonomy.GEOLOCATION}
     print_info("LOC\tLocation subclasses found")
+    classify("LOC", output_collection,
+             input_collection.find_instances(geolocation_subclass, class_root=taxonomy.GEOLOCATION, related=related),
+             functools.partial(extract_location, poi_subclasses=poi_subclasses, lod_ids=lod_ids), pipeline=pipeline)
+
+
+def extract_organization(item, lod_ids: bool = False):
+    """Extracts the entry of an organization
 
-    location_cursor = input_collection.find({"$and": [ \
-        {"type": "item"}, \
-        {"claims.P31.mainsnak.datavalue.value.numeric-id": {"$in": geolocation_subclass}}] \
-        }, no_cursor_timeout=True)
-    print_info("LOC\tLocations found")
-
-    print_info("LOC\tBeginning of location-loop")
-    for item in location_cursor:
-        entry = write_functions.write_common_fields(item)
-        entry["neClass"] = "LOC"
-
-        (incountry, incontinent) = get_functions.get_location_inside(item)
-        if len(incountry) != 0:
-            entry["in_country"] = incountry
-        if len(incontinent) != 0:
-            entry["in_continent"] = incountry
-
-        loc_type = get_functions.get_poi(item, country_subclass, settlement_subclass, city_subclass, sea_subclass,
-                                         river_subclass, mountain_subclass, mountainr_subclass, state_subclass,
-                                         hgte_subclass)
-        if len(loc_type) != 0:
-            entry["location_type"] = loc_type
-
-        coordinate = get_functions.get_coordinate(item)
-        if coordinate:
-            # { type: "Point", coordinates: [ 40, 5 ] }
-            entry["coordinate"] = coordinate
-
-        population = get_functions.get_population(item)
-        if population:
-            entry["population"] = population
-
-        # is part of LOD Link list
-        # GN_ID = get_functions.get_geonamesID(item)
-        # if GN_ID:
-        #     entry["geonamesID"] = GN_ID
-
-        wdid = entry["id"]
-        doc = output_collection.find_one({"id": wdid})
-        if (not doc or doc["neClass"] != "LOC"):
-            insert_count += 1
-            bulk.insert(entry)
-            if insert_count == 1000:
-                loc_insert += 1
-                print_info("LOC\t" + str(loc_insert * 1000) + "locations written")
-                sys.stdout.flush()
-
-                try:
-                    bulk.execute()
-                except errors.BulkWriteError as bwe:
-                    print(bwe.details)
-                    # you can also take this component and do more analysis
-                    # werrors = bwe.details['writeErrors']
-                    raise
-                bulk = output_collection.initialize_unordered_bulk_op()
-                insert_count = 0
-    location_cursor.close()
-    if insert_count > 0:
-        bulk.execute()
-
-
-def find_organizations(output_collection, input_collection):
+    :param item: entity object <class 'dict'>
+    :param lod_ids: if True the ids in other databases are stored with the entity
+    :return: entry <class 'dict'>
+    """
+    entry = write_functions.write_common_fields(item, lod_ids)
+    entry["neClass"] = "ORG"
+
+    olang = get_functions.get_official_language(item)
+    if len(olang) != 0:
+        entry["official_language"] = olang
+
+    inception = get_functions.get_inception(item)
+    if inception:
+        entry["inception"] = inception
+
+    hq = get_functions.get_hq_location(item)
+    if hq:
+        entry["hq_location"] = hq
+
+    web = get_functions.get_official_website(item)
+    if web:
+        entry["official_website"] = web
+
+    founder = get_functions.get_founder(item)
+    if len(founder) != 0:
+        entry["founder"] = founder
+
+    ceo = get_functions.get_ceo(item)
+    if len(ceo) != 0:
+        entry["ceo"] = ceo
+
+    country_org = get_functions.get_country(item)
+    if len(country_org) != 0:
+        entry["country"] = country_org
+
+    instanceof = get_functions.get_instance_of(item)
+    if len(instanceof) != 0:
+        entry["instance_of"] = instanceof
+    return entry
+
+
+def find_organizations(output_collection, input_collection, lod_ids: bool = False,
+                       tax: typing.Optional[taxonomy.Taxonomy] = None,
+                       pipeline: typing.Optional[typing.Dict[str, int]] = None):
     """
     Finds organizations in Wikidata dump and stores them together with additional information in the output collection
 
     :param output_collection:
     :param input_collection:
-    :return: nothing, writes objects directly to MongoDB
+    :param lod_ids: if True the ids in other databases are stored with each entity (see [LOD] lookup_mode)
+    :param tax: subclass trees <class 'NECKAr_taxonomy.Taxonomy'> | None (SPARQL, not cached)
+    :param pipeline: options of the threaded pipeline (see NECKAr_pipeline.read_pipeline_options) | None
+        (serial loop)
+    :return: nothing, writes objects directly to the output store
     """
     # Organization Specific
-    org_insert = 0
-    insert_count = 0
-    bulk = output_collection.initialize_unordered_bulk_op()
     print_info("Beginning of Organization loop")
-    output_collection.remove({"neClass": "ORG"})
-    print_info("removed old orgs")
-    organization_subclass = get_wikidata_item_tree_item_idsSPARQL([43229], backward_properties=[279])
+    organization_subclass = (tax or taxonomy.Taxonomy()).subclasses(taxonomy.ORGANIZATION)
     # print(len(organization_subclass))
-    organization_cursor = input_collection.find({"$and": [{"type": "item"},
-                                                          {"claims.P31.mainsnak.datavalue.value.numeric-id": {
-                                                              "$in": organization_subclass}}]})
-
-    for item in organization_cursor:
-        entry = write_functions.write_common_fields(item)
-        entry["neClass"] = "ORG"
-
-        olang = get_functions.get_official_language(item)
-        if len(olang) != 0:
-            entry["official_language"] = olang
-
-        inception = get_functions.get_inception(item)
-        if inception:
-            entry["inception"] = inception
-
-        hq = get_functions.get_hq_location(item)
-        if hq:
-            entry["hq_location"] = hq
-
-        web = get_functions.get_official_website(item)
-        if web:
-            entry["official_website"] = web
-
-        founder = get_functions.get_founder(item)
-        if len(founder) != 0:
-            entry["founder"] = founder
-
-        ceo = get_functions.get_ceo(item)
-        if len(ceo) != 0:
-            entry["ceo"] = ceo
-
-        country_org = get_functions.get_country(item)
-        if len(country_org) != 0:
-            entry["country"] = country_org
-
-        instanceof = get_functions.get_instance_of(item)
-        if len(instanceof) != 0:
-            entry["instance_of"] = instanceof
-
-        wdid = entry["id"]
-        doc = output_collection.find_one({"id": wdid})
-        if (not doc or doc["neClass"] != "ORG"):
-            insert_count += 1
-            bulk.insert(entry)
-            if insert_count == 1000:
-                org_insert += 1
-                print_info("ORG " + str(org_insert * 1000) + " organizations written")
-                sys.stdout.flush()
-                bulk.execute()
-                bulk = output_collection.initialize_unordered_bulk_op()
-                insert_count = 0
-    if insert_count > 0:
-        bulk.execute()
-
-
-def find_events(output_collection, input_collection, should_get_date_of_official_opening: bool = False):
+    classify("ORG", output_collection,
+             input_collection.find_instances(organization_subclass, class_root=taxonomy.ORGANIZATION),
+             functools.partial(extract_organization, lod_ids=lod_ids), pipeline=pipeline)
+
+
+def extract_event(item, should_get_date_of_official_opening: bool = False, lod_ids: bool = False):
+    """Extracts the entry of an event
+
+    :param item: entity object <class 'dict'>
+    :param should_get_date_of_official_opening: should get date_of_official_opening (see find_events)
+    :param lod_ids: if True the ids in other databases are stored with the entity
+    :return: entry <class 'dict'>
+    """
+    entry = write_functions.write_common_fields(item, lod_ids)
+    entry["neClass"] = "EVE"
+
+    if should_get_date_of_official_opening:
+        dooo = get_functions.get_date_of_official_opening(item)
+        if dooo:
+            entry["date_of_official_opening"] = dooo
+    event_location = get_functions.get_event_location(item)
+    if event_location:
+        entry["event_location"] = event_location
+    return entry
+
+
+def find_events(output_collection, input_collection, should_get_date_of_official_opening: bool = False,
+                lod_ids: bool = False, tax: typing.Optional[taxonomy.Taxonomy] = None,
+                pipeline: typing.Optional[typing.Dict[str, int]] = None):
     """Finds events in Wikidata dump and stores them together with additional information in the output collection
 
        :param output_collection:
        :param input_collection:
        :param should_get_date_of_official_opening: should get date_of_official_opening (don't turn on unless implemented)
               <class 'bool'>
-       :return: nothing, writes objects directly to MongoDB
+       :param lod_ids: if True the ids in other databases are stored with each entity (see [LOD] lookup_mode)
+       :param tax: subclass trees <class 'NECKAr_taxonomy.Taxonomy'> | None (SPARQL, not cached)
+       :param pipeline: options of the threaded pipeline (see NECKAr_pipeline.read_pipeline_options) | None
+           (serial loop)
+       :return: nothing, writes objects directly to the output store
        """
-
-    eve_insert = 0
-    insert_count = 0
-    bulk = output_collection.initialize_unordered_bulk_op()
     print_info("Find events...")
-    print_info("Remove all events entries")
-    output_collection.remove({"neClass": "EVE"})
-    print_info("--- DONE")
-    event_subclass = get_wikidata_item_tree_item_idsSPARQL([1656682], backward_properties=[279])
-    event_cursor = input_collection.find({"$and": [{"type": "item"},
-                                                          {"claims.P31.mainsnak.datavalue.value.numeric-id": {
-                                                              "$in": event_subclass}}]})
-    print_info("Beginning of event-loop")
-    for item in event_cursor:
-        entry = write_functions.write_common_fields(item)
-        entry["neClass"] = "EVE"
-
-        if should_get_date_of_official_opening:
-            dooo = get_functions.get_date_of_official_opening(item)
-            if dooo:
-                entry["date_of_official_opening"] = dooo
-        event_location = get_functions.get_event_location(item)
-        if event_location:
-            entry["event_location"] = event_location
-
-        wdid = entry["id"]
-        doc = output_collection.find_one({"id": wdid})
-        if (not doc or doc["neClass"] != "EVE"):
-            insert_count += 1 #TODO - Q79838 gets here erroneously (it's an accordion!) https://www.wikidata.org/wiki/Q79838
-            bulk.insert(entry)
-        if insert_count == 1000:
-            eve_insert += 1
-            print_info("EVE " + str(eve_insert * 1000) + "events written")
-            sys.stdout.flush()
-            bulk.execute()
-            bulk = output_collection.initialize_unordered_bulk_op()
-            insert_count = 0
-    if insert_count > 0:
-        bulk.execute()
-
-def find_languages(output_collection, input_collection):
+    event_subclass = (tax or taxonomy.Taxonomy()).subclasses(taxonomy.EVENT)
+    #TODO - Q79838 gets here erroneously (it's an accordion!) https://www.wikidata.org/wiki/Q79838
+    # NECKAr_delta.py --explain Q79838 shows the class to put in [Taxonomy] exclude, NECKAr_delta.py removes it
+    classify("EVE", output_collection, input_collection.find_instances(event_subclass, class_root=taxonomy.EVENT),
+             functools.partial(extract_event, should_get_date_of_official_opening=should_get_date_of_official_opening,
+                               lod_ids=lod_ids), pipeline=pipeline)
+
+
+def extract_common(item, ne_class: str, lod_ids: bool = False):
+    """Extracts the entry of classes that only store the common fields (languages, brands, facilities, time
+    instances, titles and works)
+
+    :param item: entity object <class 'dict'>
+    :param ne_class: neClass <class 'string'>
+    :param lod_ids: if True the ids in other databases are stored with the entity
+    :return: entry <class 'dict'>
+    """
+    entry = write_functions.write_common_fields(item, lod_ids)
+    entry["neClass"] = ne_class
+    return entry
+
+
+def find_languages(output_collection, input_collection, lod_ids: bool = False,
+                   pipeline: typing.Optional[typing.Dict[str, int]] = None):
     """Finds languages in Wikidata dump and stores them together with additional information in the output collection
 
        :param output_collection:
        :param input_collection:
-       :return: nothing, writes objects directly to MongoDB
+       :param lod_ids: if True the ids in other databases are stored with each entity (see [LOD] lookup_mode)
+       :param pipeline: options of the threaded pipeline (see NECKAr_pipeline.read_pipeline_options) | None
+           (serial loop)
+       :return: nothing, writes objects directly to the output store
        """
-
-    ang_insert = 0
-    insert_count = 0
-    bulk = output_collection.initialize_unordered_bulk_op()
     print_info("Find languages...")
-    print_info("Remove all languages entries")
-    output_collection.remove({"neClass": "ANG"})
-    print_info("--- DONE")
-    lang_cursor = input_collection.find(
-        {"$and": [{"type": "item"}, {"claims.P31.mainsnak.datavalue.value.numeric-id": 315}]})
-    print_info("Beginning of language-loop")
-    for item in lang_cursor:
-        entry = write_functions.write_common_fields(item)
-        entry["neClass"] = "ANG"
-
-        wdid = entry["id"]
-        doc = output_collection.find_one({"id": wdid})
-        if (not doc or doc["neClass"] != "ANG"):
-            insert_count += 1
-            bulk.insert(entry)
-        if insert_count == 1000:
-            ang_insert += 1
-            print_info("ANG " + str(ang_insert * 1000) + "languages written")
-            sys.stdout.flush()
-            bulk.execute()
-            bulk = output_collection.initialize_unordered_bulk_op()
-            insert_count = 0
-    if insert_count > 0:
-        bulk.execute()
-
-def find_brands(output_collection, input_collection):
+    classify("ANG", output_collection, input_collection.find_instances([315]),
+             functools.partial(extract_common, ne_class="ANG", lod_ids=lod_ids), pipeline=pipeline)
+
+
+def find_brands(output_collection, input_collection, lod_ids: bool = False,
+                pipeline: typing.Optional[typing.Dict[str, int]] = None):
     """Finds brands in Wikidata dump and stores them together with additional information in the output collection
 
        :param output_collection:
        :param input_collection:
-       :return: nothing, writes objects directly to MongoDB
+       :param lod_ids: if True the ids in other databases are stored with each entity (see [LOD] lookup_mode)
+       :param pipeline: options of the threaded pipeline (see NECKAr_pipeline.read_pipeline_options) | None
+           (serial loop)
+       :return: nothing, writes objects directly to the output store
        """
-
-    duc_insert = 0
-    insert_count = 0
-    bulk = output_collection.initialize_unordered_bulk_op()
     print_info("Find brands...")
-    print_info("Remove all brands entries")
-    output_collection.remove({"neClass": "DUC"})
-    print_info("--- DONE")
-    brand_cursor = input_collection.find(
-        {"$and": [{"type": "item"}, {"claims.P31.mainsnak.datavalue.value.numeric-id": 431289}]})
-    print_info("Beginning of brand-loop")
-    for item in brand_cursor:
-        entry = write_functions.write_common_fields(item)
-        entry["neClass"] = "DUC"
-
-        wdid = entry["id"]
-        doc = output_collection.find_one({"id": wdid})
-        if (not doc or doc["neClass"] != "DUC"):
-            insert_count += 1
-            bulk.insert(entry)
-        if insert_count == 1000:
-            duc_insert += 1
-            print_info("DUC " + str(duc_insert * 1000) + "brands written")
-            sys.stdout.flush()
-            bulk.execute()
-            bulk = output_collection.initialize_unordered_bulk_op()
-            insert_count = 0
-    if insert_count > 0:
-        bulk.execute()
-
-def find_facilities(output_collection, input_collection):
+    classify("DUC", output_collection, input_collection.find_instances([431289]),
+             functools.partial(extract_common, ne_class="DUC", lod_ids=lod_ids), pipeline=pipeline)
+
+
+def find_facilities(output_collection, input_collection, lod_ids: bool = False,
+                    tax: typing.Optional[taxonomy.Taxonomy] = None,
+                    pipeline: typing.Optional[typing.Dict[str, int]] = None):
     """Finds facilities in Wikidata dump and stores them together with additional information in the output collection
 
        :param output_collection:
        :param input_collection:
-       :return: nothing, writes objects directly to MongoDB
+       :param lod_ids: if True the ids in other databases are stored with each entity (see [LOD] lookup_mode)
+       :param tax: subclass trees <class 'NECKAr_taxonomy.Taxonomy'> | None (SPARQL, not cached)
+       :param pipeline: options of the threaded pipeline (see NECKAr_pipeline.read_pipeline_options) | None
+           (serial loop)
+       :return: nothing, writes objects directly to the output store
        """
-
-    fac_insert = 0
-    insert_count = 0
-    bulk = output_collection.initialize_unordered_bulk_op()
     print_info("Find facilities...")
-    print_info("Remove all facilities entries")
-    output_collection.remove({"neClass": "FAC"})
-    print_info("--- DONE")
-    facility_subclass = get_wikidata_item_tree_item_idsSPARQL([13226383], backward_properties=[279])
-    facility_cursor = input_collection.find({"$and": [{"type": "item"},
-                                                          {"claims.P31.mainsnak.datavalue.value.numeric-id": {
-                                                              "$in": facility_subclass}}]})
-
-    print_info("Beginning of facility-loop")
-    for item in facility_cursor:
-        entry = write_functions.write_common_fields(item)
-        entry["neClass"] = "FAC"
-
-        wdid = entry["id"]
-        doc = output_collection.find_one({"id": wdid})
-        if (not doc or doc["neClass"] != "FAC"):
-            insert_count += 1
-            bulk.insert(entry)
-        if insert_count == 1000:
-            fac_insert += 1
-            print_info("FAC " + str(fac_insert * 1000) + "facilities written")
-            sys.stdout.flush()
-            bulk.execute()
-            bulk = output_collection.initialize_unordered_bulk_op()
-            insert_count = 0
-    if insert_count > 0:
-        bulk.execute()
-
-
-def find_time_instances(output_collection, input_collection):
+    facility_subclass = (tax or taxonomy.Taxonomy()).subclasses(taxonomy.FACILITY)
+    classify("FAC", output_collection, input_collection.find_instances(facility_subclass, class_root=taxonomy.FACILITY),
+             functools.partial(extract_common, ne_class="FAC", lod_ids=lod_ids), pipeline=pipeline)
+
+
+def find_time_instances(output_collection, input_collection, lod_ids: bool = False,
+                        tax: typing.Optional[taxonomy.Taxonomy] = None,
+                        pipeline: typing.Optional[typing.Dict[str, int]] = None):
     """Finds time instances in Wikidata dump and stores them together with additional information in the output collection
 
        :param output_collection:
        :param input_collection:
-       :return: nothing, writes objects directly to MongoDB
+       :param lod_ids: if True the ids in other databases are stored with each entity (see [LOD] lookup_mode)
+       :param tax: subclass trees <class 'NECKAr_taxonomy.Taxonomy'> | None (SPARQL, not cached)
+       :param pipeline: options of the threaded pipeline (see NECKAr_pipeline.read_pipeline_options) | None
+           (serial loop)
+       :return: nothing, writes objects directly to the output store
        """
-
-    timex_insert = 0
-    insert_count = 0
-    bulk = output_collection.initialize_unordered_bulk_op()
     print_info("Find time instances...")
-    print_info("Remove all time instances entries")
-    output_collection.remove({"neClass": "TIMEX"})
-    print_info("--- DONE")
-    time_subclass = get_wikidata_item_tree_item_idsSPARQL([11471], backward_properties=[279])
-    time_cursor = input_collection.find({"$and": [{"type": "item"},
-                                                          {"claims.P31.mainsnak.datavalue.value.numeric-id": {
-                                                              "$in": time_subclass}}]})
-
-    print_info("Beginning of time-loop")
-    for item in time_cursor:
-        entry = write_functions.write_common_fields(item)
-        entry["neClass"] = "TIMEX"
-
-        wdid = entry["id"]
-        doc = output_collection.find_one({"id": wdid})
-        if (not doc or doc["neClass"] != "TIMEX"):
-            insert_count += 1
-            bulk.insert(entry)
-        if insert_count == 1000:
-            timex_insert += 1
-            print_info("TIMEX " + str(timex_insert * 1000) + "time instances written")
-            sys.stdout.flush()
-            bulk.execute()
-            bulk = output_collection.initialize_unordered_bulk_op()
-            insert_count = 0
-    if insert_count > 0:
-        bulk.execute()
+    time_subclass = (tax or taxonomy.Taxonomy()).subclasses(taxonomy.TIME)
+    classify("TIMEX", output_collection, input_collection.find_instances(time_subclass, class_root=taxonomy.TIME),
+             functools.partial(extract_common, ne_class="TIMEX", lod_ids=lod_ids), pipeline=pipeline)
 
 ########################################################################################################################
 
-def find_titles(output_collection, input_collection):
+def find_titles(output_collection, input_collection, lod_ids: bool = False,
+                tax: typing.Optional[taxonomy.Taxonomy] = None,
+                pipeline: typing.Optional[typing.Dict[str, int]] = None):
     """Finds titles in Wikidata dump and stores them together with additional information in the output collection
 
        :param output_collection:
        :param input_collection:
-       :return: nothing, writes objects directly to MongoDB
+       :param lod_ids: if True the ids in other databases are stored with each entity (see [LOD] lookup_mode)
+       :param tax: subclass trees <class 'NECKAr_taxonomy.Taxonomy'> | None (SPARQL, not cached)
+       :param pipeline: options of the threaded pipeline (see NECKAr_pipeline.read_pipeline_options) | None
+           (serial loop)
+       :return: nothing, writes objects directly to the output store
        """
-
-    ttl_insert = 0
-    insert_count = 0
-    bulk = output_collection.initialize_unordered_bulk_op()
     print_info("Find titles...")
-    print_info("Remove all titles entries")
-    output_collection.remove({"neClass": "TTL"})
-    print_info("--- DONE")
-    title_subclass = get_wikidata_item_tree_item_idsSPARQL([214339], backward_properties=[279])
-    title_cursor = input_collection.find({"$and": [{"type": "item"},
-                                                          {"claims.P31.mainsnak.datavalue.value.numeric-id": {
-                                                              "$in": title_subclass}}]})
-    print_info("Beginning of title-loop")
-    for item in title_cursor:
-        entry = write_functions.write_common_fields(item)
-        entry["neClass"] = "TTL"
-
-        wdid = entry["id"]
-        doc = output_collection.find_one({"id": wdid})
-        if (not doc or doc["neClass"] != "TTL"):
-            insert_count += 1  #TODO - Q20532, Q63440, Q31, Q78389 (probably because it's an instance of ´prince´) are mistakenly added here
-            bulk.insert(entry)
-        if insert_count == 1000:
-            ttl_insert += 1
-            print_info("TTL " + str(ttl_insert * 1000) + "titles written")
-            sys.stdout.flush()
-            bulk.execute()
-            bulk = output_collection.initialize_unordered_bulk_op()
-            insert_count = 0
-    if insert_count > 0:
-        bulk.execute()
-def find_works(output_collection, input_collection):
+    title_subclass = (tax or taxonomy.Taxonomy()).subclasses(taxonomy.TITLE)
+    #TODO - Q20532, Q63440, Q31, Q78389 (probably because it's an instance of ´prince´) are mistakenly added here
+    # (see NECKAr_delta.py --explain and [Taxonomy] exclude)
+    classify("TTL", output_collection, input_collection.find_instances(title_subclass, class_root=taxonomy.TITLE),
+             functools.partial(extract_common, ne_class="TTL", lod_ids=lod_ids), pipeline=pipeline)
+
+
+def find_works(output_collection, input_collection, lod_ids: bool = False,
+               pipeline: typing.Optional[typing.Dict[str, int]] = None):
     """Finds works in Wikidata dump and stores them together with additional information in the output collection
 
        :param output_collection:
        :param input_collection:
-       :return: nothing, writes objects directly to MongoDB
+       :param lod_ids: if True the ids in other databases are stored with each entity (see [LOD] lookup_mode)
+       :param pipeline: options of the threaded pipeline (see NECKAr_pipeline.read_pipeline_options) | None
+           (serial loop)
+       :return: nothing, writes objects directly to the output store
        """
-
-    woa_insert = 0
-    insert_count = 0
-    bulk = output_collection.initialize_unordered_bulk_op()
     print_info("Find works...")
-    print_info("Remove all works entries")
-    output_collection.remove({"neClass": "WOA"})
-    print_info("--- DONE")
-    work_cursor = input_collection.find(
-        {"$and": [{"type": "item"}, {"claims.P31.mainsnak.datavalue.value.numeric-id": 38672}]})
-    print_info("Beginning of work-loop")
-    for item in work_cursor:
-        entry = write_functions.write_common_fields(item)
-        entry["neClass"] = "WOA"
-
-        wdid = entry["id"]
-        doc = output_collection.find_one({"id": wdid})
-        if (not doc or doc["neClass"] != "WOA"):
-            insert_count += 1 #TODO - Q38450, Q38666, Q38887 are mistakenly added here
-            bulk.insert(entry)
-        if insert_count == 1000:
-            woa_insert += 1
-            print_info("WOA " + str(woa_insert * 1000) + "works written")
-            sys.stdout.flush()
-            bulk.execute()
-            bulk = output_collection.initialize_unordered_bulk_op()
-            insert_count = 0
-    if insert_count > 0:
-        bulk.execute()
+    #TODO - Q38450, Q38666, Q38887 are mistakenly added here
+    classify("WOA", output_collection, input_collection.find_instances([38672]),
+             functools.partial(extract_common, ne_class="WOA", lod_ids=lod_ids), pipeline=pipeline)
+
+
+def finish(config: configparser.ConfigParser, output_collection, input_collection):
+    """Last step after all searches: writes the manifest of the JSONL output (output mode jsonl, the sinks have to be
+    closed) or resolves the labels of referenced entities ([Enrichment] labels)
+
+    :param config: ConfigParser Object
+    :param output_collection: output store | <class 'NECKAr_export.JSONLSink'>
+    :param input_collection: input store
+    """
+    if config.get('Output', 'mode', fallback='database') == 'jsonl':
+        export.write_manifest(config.get('Output', 'directory', fallback='../output'))
+        if config.getboolean('Enrichment', 'labels', fallback=False):
+            print_info("label enrichment skipped, it needs output mode database")
+    elif config.getboolean('Enrichment', 'labels', fallback=False):
+        label_resolver.enrich_labels(output_collection, input_collection,
+                                     batch_size=config.getint('Enrichment', 'batch_size', fallback=1000),
+                                     cache_size=config.getint('Enrichment', 'cache_size', fallback=100000))
+
+
+# [Search_Flags] flag -> (neClass, find function, root classes of the subclass trees used by the function)
+SEARCH_FLAGS = collections.OrderedDict([
+    ("person", ("PER", find_persons, [])),
+    ("location", ("LOC", find_locations, taxonomy.LOCATION_ROOTS)),
+    ("organization", ("ORG", find_organizations, [taxonomy.ORGANIZATION])),
+    ("event", ("EVE", find_events, [taxonomy.EVENT])),
+    ("language", ("ANG", find_languages, [])),
+    ("brand", ("DUC", find_brands, [])),
+    ("facility", ("FAC", find_facilities, [taxonomy.FACILITY])),
+    ("time", ("TIMEX", find_time_instances, [taxonomy.TIME])),
+    ("title", ("TTL", find_titles, [taxonomy.TITLE])),
+    ("work", ("WOA", find_works, [])),
+])
+
+
+def search(flag: str, config: configparser.ConfigParser, output_collection, input_collection,
+           tax: typing.Optional[taxonomy.Taxonomy] = None):
+    """Runs the search of one [Search_Flags] flag
+
+    :param flag: flag, e.g. 'person' (see SEARCH_FLAGS) <class 'string'>
+    :param config: ConfigParser Object
+    :param output_collection: output store
+    :param input_collection: input store
+    :param tax: subclass trees <class 'NECKAr_taxonomy.Taxonomy'> | None
+    """
+    (ne_class, find, roots) = SEARCH_FLAGS[flag]
+    # the LOD lists are created from the output only, so the ids have to be captured here
+    kwargs = {"lod_ids": config.get('LOD', 'lookup_mode', fallback='batch') == 'output',
+              "pipeline": NECKAr_pipeline.read_pipeline_options(config)}
+    if flag == "person":
+        kwargs["alias_options"] = read_alias_options(config)
+    if roots:
+        kwargs["tax"] = tax
+    find(output_collection, input_collection, **kwargs)
 
 
 if __name__ == "__main__":
@@ -620,27 +635,20 @@ if __name__ == "__main__":
 
     config = configparser.ConfigParser()
     config.read('../NECKAr.cfg')
+    metrics.start(config)
+    profiling.start(config)
+    bulk.configure(config)
 
     input_collection, output_collection = read_config(config)
-    output_collection.create_index([('id', ASCENDING)])
-
-    if config.getboolean('Search_Flags', 'person'):
-        find_persons(output_collection, input_collection)
-    if config.getboolean('Search_Flags', 'location'):
-        find_locations(output_collection, input_collection)
-    if config.getboolean('Search_Flags', 'organization'):
-        find_organizations(output_collection, input_collection)
-    if config.getboolean('Search_Flags', 'event'):
-        find_events(output_collection, input_collection)
-    if config.getboolean('Search_Flags', 'language'):
-        find_languages(output_collection, input_collection)
-    if config.getboolean('Search_Flags', 'brand'):
-        find_brands(output_collection, input_collection)
-    if config.getboolean('Search_Flags', 'facility'):
-        find_facilities(output_collection, input_collection)
-    if config.getboolean('Search_Flags', 'time'):
-        find_time_instances(output_collection, input_collection)
-    if config.getboolean('Search_Flags', 'title'):
-        find_titles(output_collection, input_collection)
-    if config.getboolean('Search_Flags', 'work'):
-        find_works(output_collection, input_collection)
\ No newline at end of file
+    output_collection.ensure_index(['id'])
+    tax = taxonomy.from_config(config)
+
+    for worker, flag in enumerate(SEARCH_FLAGS):
+        if config.getboolean('Search_Flags', flag):
+            # output mode jsonl: each class is written by its own worker (see NECKAr_runner)
+            output = read_output(config, output_collection, worker)
+            search(flag, config, output, input_collection, tax)
+            if isinstance(output, export.JSONLSink):
+                output.close()
+
+    finish(config, output_collection, input_collection)
@@ -0,0 +1,198 @@
+#! /usr/bin/env python3
+# This Python file uses the following encoding: utf-8
+
+#############################################################################
+#  NECKAr: class membership                                                 #
+#    the subclass sets the classifications select (e.g. all subclasses of   #
+#    geographic location without food) are materialized in the side         #
+#    collection <collection_dump>__membership, one document per             #
+#    (class_root, q_id):                                                    #
+#      {"key": "Q2221906:Q515", "class_root": 2221906, "q_id": 515}         #
+#    a selection of at least min_classes classes is a join of this          #
+#    collection with the dump (MongoDB: aggregation with $lookup on the P31 #
+#    values, see NECKAr_storage.join_pipeline) instead of a $in query with  #
+#    tens of thousands of values; without the join (SQLite, join = False)   #
+#    the $in queries are split into id ranges of chunk_size classes         #
+#    the sets are materialized once the class is classified (see            #
+#    NECKAr_main.classify), they are the base of the delta                  #
+#    reclassification (NECKAr_delta); the sets a run joins with are         #
+#    written to <collection_dump>__membership_join before the query         #
+#############################################################################
+
+import configparser
+import threading
+import typing
+import NECKAr_storage as storage
+from NECKAr_bulk import BulkWriter
+
+
+def print_info(info):
+    print("INFO\tNECKAr:\t", info)
+
+
+def membership_name(collection_name: str) -> str:
+    """:return: name of the membership collection of a dump collection <class 'string'>"""
+    return collection_name + "__membership"
+
+
+def join_name(collection_name: str) -> str:
+    """:return: name of the collection of the joined sets of a dump collection <class 'string'>"""
+    return collection_name + "__membership_join"
+
+
+def member_key(class_root: int, class_id: int) -> str:
+    """:return: key of a membership document, e.g. 'Q2221906:Q515' <class 'string'>"""
+    return "Q" + str(class_root) + ":Q" + str(class_id)
+
+
+class Membership(object):
+    """Membership collection (see the module description)
+
+    :param store: membership store, key 'key'
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.Lock()
+
+    def members(self, class_root: int) -> typing.List[int]:
+        """:return: sorted ids of the classes materialized under the root (list of int)"""
+        return sorted(doc["q_id"] for doc in self.store.scan(where={"class_root": class_root},
+                                                             projection={"q_id": 1}, page_size=10000))
+
+    def roots(self) -> typing.List[int]:
+        """:return: sorted ids of the roots with materialized classes (list of int)"""
+        return sorted({doc["class_root"] for doc in self.store.scan(projection={"class_root": 1}, page_size=10000)})
+
+    def materialize(self, class_root: int, class_ids: typing.List[int]) -> bool:
+        """Replaces the classes materialized under the root, if they changed
+
+        :param class_root: root of the selection <class 'int'>
+        :param class_ids: numeric ids of the selected classes (list of int)
+        :return: True if the collection was written <class 'bool'>
+        """
+        with self._lock:
+            class_ids = sorted(set(class_ids))
+            if self.members(class_root) == class_ids:
+                return False
+            self.store.delete({"class_root": class_root})
+            writer = BulkWriter(self.store, "MEMBERSHIP")
+            for class_id in class_ids:
+                writer.write({"key": member_key(class_root, class_id), "class_root": class_root, "q_id": class_id})
+            writer.close()
+            self.store.ensure_index(["class_root", "q_id"])
+            print_info("MEMBERSHIP Q" + str(class_root) + ": " + str(len(class_ids)) + " classes materialized")
+            return True
+
+
+class Selection(object):
+    """Items of a selection whose subclass sets are materialized when the class is classified (commit, called by
+    NECKAr_main.classify once all entries are written)
+
+    :param items: items
+    :param membership: membership the sets are materialized in <class 'Membership'> | None (nothing is materialized)
+    :param sets: dictionary root -> numeric ids of its selected classes <class 'dict'>
+    """
+
+    def __init__(self, items: typing.Iterable[typing.Dict[str, object]], membership: typing.Optional[Membership],
+                 sets: typing.Dict[int, typing.List[int]]):
+        self.items = items
+        self.membership = membership
+        self.sets = sets
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def commit(self):
+        """Materializes the sets, they are the base of the next delta"""
+        if self.membership is None:
+            return
+        for (root, class_ids) in sorted(self.sets.items()):
+            self.membership.materialize(root, class_ids)
+
+
+class MembershipStore(object):
+    """Dump store whose selections with a root (find_instances(..., class_root=...)) are materialized in the
+    membership collection once the class is classified and, from min_classes classes on, joined with the dump; all
+    other operations are those of the store
+
+    :param store: dump store (may use the class index, see NECKAr_classindex.IndexedStore)
+    :param membership: membership of the dump <class 'Membership'>
+    :param min_classes: minimum number of classes of a selection that is joined <class 'int'>
+    :param chunk_size: maximum number of classes of one $in query <class 'int'>
+    :param joined: sets the selections are joined with (see join_name) <class 'Membership'> | None (no join)
+    """
+
+    def __init__(self, store, membership: Membership, min_classes: int = 1000,
+                 chunk_size: int = storage.IN_CHUNK_SIZE, joined: typing.Optional[Membership] = None):
+        self.store = store
+        self.membership = membership
+        self.min_classes = min_classes
+        self.chunk_size = chunk_size
+        # SQLite selections are a join with the P31 side table anyway
+        self.joined = joined if hasattr(store, "join_instances") else None
+
+    def __getattr__(self, name):
+        return getattr(self.store, name)
+
+    def find_instances(self, class_ids: typing.List[int], projection=None, chunk_size: typing.Optional[int] = None,
+                       class_root: typing.Optional[int] = None,
+                       related: typing.Optional[typing.Dict[int, typing.List[int]]] = None):
+        """Streams all items that are an instance (P31) of one of the given classes
+
+        :param class_ids: numeric ids of the classes (list of int)
+        :param projection: projection <class 'dict'> | None
+        :param chunk_size: maximum number of classes of one $in query <class 'int'> | None (option chunk_size)
+        :param class_root: root the classes are materialized under <class 'int'> | None (not materialized)
+        :param related: subclass sets of other roots the extraction depends on, root -> numeric class ids, they are
+            materialized under their root <class 'dict'> | None
+        :return: <class 'Selection'> | generator of items (without root)
+        """
+        if class_root is None:
+            return self.store.find_instances(class_ids, projection, chunk_size or self.chunk_size, related=related)
+        sets = dict(related or {})
+        sets[class_root] = class_ids
+        if self.joined is not None and len(class_ids) >= self.min_classes:
+            self.joined.materialize(class_root, class_ids)
+            items = self.store.join_instances(self.joined.store, class_root, class_ids, projection)
+        else:
+            items = self.store.find_instances(class_ids, projection, chunk_size or self.chunk_size, related=related)
+        return Selection(items, self.membership, sets)
+
+
+def read_membership_options(config: configparser.ConfigParser) -> typing.Dict[str, object]:
+    """Reads the section Membership of the configuration file NECKAr.cfg
+
+    :param config: ConfigParser Object
+    :return: options <class 'dict'>
+    """
+    return {"enabled": config.getboolean('Membership', 'enabled', fallback=False),
+            "join": config.getboolean('Membership', 'join', fallback=True),
+            "min_classes": config.getint('Membership', 'min_classes', fallback=1000),
+            "chunk_size": config.getint('Membership', 'chunk_size', fallback=storage.IN_CHUNK_SIZE)}
+
+
+def membership_store(config: configparser.ConfigParser, name: typing.Callable[[str], str] = membership_name):
+    """:return: membership store (name join_name: store of the joined sets) of the dump store of the configuration
+        file NECKAr.cfg"""
+    return storage.from_config(config).store(config.get('Database', 'db_dump'),
+                                             name(config.get('Database', 'collection_dump')), key="key")
+
+
+def from_config(config: configparser.ConfigParser, input_collection, store=None, joined_store=None):
+    """Materializes and joins the selections of the dump store if enabled (section Membership)
+
+    :param config: ConfigParser Object
+    :param input_collection: dump store
+    :param store: membership store | None (see membership_store)
+    :param joined_store: store of the joined sets | None (see membership_store with join_name)
+    :return: <class 'MembershipStore'> | input_collection
+    """
+    options = read_membership_options(config)
+    if not options["enabled"]:
+        return input_collection
+    joined = None
+    if options["join"]:
+        joined = Membership(joined_store if joined_store is not None else membership_store(config, join_name))
+    return MembershipStore(input_collection, Membership(store if store is not None else membership_store(config)),
+                           options["min_classes"], options["chunk_size"], joined)
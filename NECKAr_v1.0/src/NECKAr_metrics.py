@@ -0,0 +1,280 @@
+#! /usr/bin/env python3
+# This Python file uses the following encoding: utf-8
+
+#############################################################################
+#  NECKAr: metrics                                                          #
+#    counters and timers of the hot paths (dump decoding, cursor fetch and  #
+#    decode, extraction, bulk writes, LOD lookups), labelled by store,      #
+#    class or language, e.g.                                                #
+#      fetch_seconds{store="wikidata_collection_dump"}                      #
+#      extract_seconds{neClass="PER"}                                       #
+#    exported periodically (section Metrics of NECKAr.cfg) as               #
+#      - a Prometheus textfile (node_exporter textfile collector), counters #
+#        as neckar_<name>, timers as summaries neckar_<name>_count/_sum     #
+#        plus neckar_<name>_max                                             #
+#      - a structured log line: INFO NECKAr METRICS: {json}, with the rates #
+#        of the counters since the last line                                #
+#    updates are a dictionary lookup under a lock, so the metrics can stay  #
+#    on in production. Timing every getter call of NECKAr_get_functions is  #
+#    opt-in and sampled (getter_sample)                                     #
+#############################################################################
+
+import atexit
+import configparser
+import contextlib
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+import typing
+
+
+def print_info(info):
+    print("INFO\tNECKAr METRICS:\t", info)
+
+
+def _key(name: str, labels: typing.Dict[str, object]) -> typing.Tuple[str, typing.Tuple[typing.Tuple[str, str], ...]]:
+    return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+
+def format_key(key) -> str:
+    """('fetch_seconds', (('store', 'x'),)) -> 'fetch_seconds{store="x"}'"""
+    name, labels = key
+    if not labels:
+        return name
+    return name + "{" + ",".join(label + '="' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+                                 for label, value in labels) + "}"
+
+
+class Metrics(object):
+    """Registry of counters and timers, safe to use from several threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        # key -> [count, sum of seconds, max seconds]
+        self.timers = {}
+        self.start = time.time()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """Increases a counter, e.g. inc("entities_total", neClass="PER")"""
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels):
+        """Adds a duration to a timer, e.g. observe("fetch_seconds", 0.01, store="dump")"""
+        key = _key(name, labels)
+        with self._lock:
+            timer = self.timers.get(key)
+            if timer is None:
+                self.timers[key] = [1, seconds, seconds]
+            else:
+                timer[0] += 1
+                timer[1] += seconds
+                if seconds > timer[2]:
+                    timer[2] = seconds
+
+    @contextlib.contextmanager
+    def timer(self, name: str, **labels):
+        """Times the block: with METRICS.timer("bulk_write_seconds", store="PER"): ..."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def timed_iter(self, iterable: typing.Iterable, name: str, **labels) -> typing.Iterator:
+        """Passes the items of an iterable through and times how long each item takes to produce (e.g. the cursor
+        fetch of a page)"""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self.observe(name, time.perf_counter() - start, **labels)
+            yield item
+
+    def snapshot(self) -> typing.Tuple[dict, dict]:
+        """:return: copies of the counters and the timers"""
+        with self._lock:
+            return dict(self.counters), {key: list(timer) for key, timer in self.timers.items()}
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.timers = {}
+            self.start = time.time()
+
+
+METRICS = Metrics()
+
+
+def record_fetch(store: str, fetch_seconds: float, decode_seconds: typing.Optional[float], size: typing.Optional[int],
+                 docs: int, metrics: Metrics = METRICS):
+    """Records one page or cursor batch read from a store: fetch (query, network) and decode (BSON, json) time,
+    bytes and documents (decode time and bytes are None if they can not be measured separately)"""
+    metrics.observe("fetch_seconds", fetch_seconds, store=store)
+    if decode_seconds is not None:
+        metrics.observe("decode_seconds", decode_seconds, store=store)
+    if size is not None:
+        metrics.inc("fetch_bytes_total", size, store=store)
+    metrics.inc("fetch_docs_total", docs, store=store)
+
+
+def prometheus_text(metrics: Metrics = METRICS, prefix: str = "neckar_") -> str:
+    """:return: the metrics in the Prometheus text exposition format <class 'string'>"""
+    counters, timers = metrics.snapshot()
+    lines = []
+    for name in sorted({key[0] for key in counters}):
+        lines.append("# TYPE " + prefix + name + " counter")
+        for key in sorted(key for key in counters if key[0] == name):
+            lines.append(format_key((prefix + name, key[1])) + " " + repr(float(counters[key])))
+    for name in sorted({key[0] for key in timers}):
+        lines.append("# TYPE " + prefix + name + " summary")
+        for key in sorted(key for key in timers if key[0] == name):
+            lines.append(format_key((prefix + name + "_count", key[1])) + " " + str(timers[key][0]))
+            lines.append(format_key((prefix + name + "_sum", key[1])) + " " + repr(timers[key][1]))
+        lines.append("# TYPE " + prefix + name + "_max gauge")
+        for key in sorted(key for key in timers if key[0] == name):
+            lines.append(format_key((prefix + name + "_max", key[1])) + " " + repr(timers[key][2]))
+    lines.append("# TYPE " + prefix + "start_time_seconds gauge")
+    lines.append(prefix + "start_time_seconds " + repr(metrics.start))
+    return "\n".join(lines) + "\n"
+
+
+def write_textfile(path: str, metrics: Metrics = METRICS):
+    """Writes the metrics for the node_exporter textfile collector (written to <path>.tmp and renamed, so the
+    collector never reads a partial file)"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as textfile:
+        textfile.write(prometheus_text(metrics))
+    os.replace(path + ".tmp", path)
+
+
+class Reporter(object):
+    """Background thread writing the log line and the textfile every interval seconds
+
+    :param metrics: registry <class 'Metrics'>
+    :param interval: seconds between two reports <class 'float'>
+    :param textfile: path of the Prometheus textfile <class 'string'> | None (no textfile)
+    :param log: write the structured log line <class 'bool'>
+    """
+
+    def __init__(self, metrics: Metrics = METRICS, interval: float = 60.0, textfile: typing.Optional[str] = None,
+                 log: bool = True):
+        self.metrics = metrics
+        self.interval = interval
+        self.textfile = textfile
+        self.log = log
+        self._last_counters = {}
+        self._last_time = time.perf_counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def log_record(self) -> typing.Dict[str, object]:
+        """:return: record of the log line: counters, their rates since the last record and the timers"""
+        counters, timers = self.metrics.snapshot()
+        now = time.perf_counter()
+        elapsed = now - self._last_time
+        rates = {format_key(key): round((value - self._last_counters.get(key, 0)) / elapsed, 3)
+                 for key, value in counters.items() if elapsed > 0}
+        self._last_counters = counters
+        self._last_time = now
+        return {"time": round(time.time(), 3), "uptime": round(time.time() - self.metrics.start, 3),
+                "counters": {format_key(key): value for key, value in sorted(counters.items())},
+                "rates": dict(sorted(rates.items())),
+                "timers": {format_key(key): {"count": count, "mean_ms": round(total / count * 1000, 4),
+                                             "max_ms": round(maximum * 1000, 4)}
+                           for key, (count, total, maximum) in sorted(timers.items())}}
+
+    def report(self):
+        if self.log:
+            print_info(json.dumps(self.log_record(), separators=(",", ":")))
+        if self.textfile:
+            write_textfile(self.textfile, self.metrics)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.report()
+            except OSError as e:
+                print_info("report failed: " + str(e))
+
+    def start(self) -> "Reporter":
+        self._thread = threading.Thread(target=self._run, name="NECKAr metrics", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops the thread and writes a last report"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.report()
+
+
+def instrument_getters(sample: int, metrics: Metrics = METRICS) -> typing.List[str]:
+    """Wraps the getters of NECKAr_get_functions: every call is counted (getter_calls_total), every sample-th call is
+    timed (getter_seconds)
+
+    :param sample: time every sample-th call of a getter <class 'int'>
+    :return: names of the wrapped getters <class 'list'>
+    """
+    import NECKAr_get_functions as get_functions
+    wrapped = []
+    for name, function in inspect.getmembers(get_functions, inspect.isfunction):
+        if not name.startswith("get_") or function.__module__ != get_functions.__name__ or \
+                getattr(function, "__wrapped__", None):
+            continue
+
+        def wrap(function=function, name=name):
+            calls = [0]
+
+            @functools.wraps(function)
+            def getter(*args, **kwargs):
+                calls[0] += 1
+                if calls[0] % sample:
+                    return function(*args, **kwargs)
+                metrics.inc("getter_calls_total", sample, getter=name)
+                start = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    metrics.observe("getter_seconds", time.perf_counter() - start, getter=name)
+            return getter
+
+        setattr(get_functions, name, wrap())
+        wrapped.append(name)
+    return wrapped
+
+
+_REPORTER = None
+
+
+def start(config: configparser.ConfigParser) -> typing.Optional[Reporter]:
+    """Starts the reporting of the configuration file NECKAr.cfg (section Metrics), the last report is written at
+    exit. Called by the entry points; without reporting the counters are still collected.
+
+    :param config: ConfigParser Object
+    :return: reporter <class 'Reporter'> | None (disabled)
+    """
+    global _REPORTER
+    if not config.getboolean('Metrics', 'enabled', fallback=True) or _REPORTER is not None:
+        return _REPORTER
+    sample = config.getint('Metrics', 'getter_sample', fallback=0)
+    if sample > 0:
+        instrument_getters(sample)
+    _REPORTER = Reporter(METRICS, config.getfloat('Metrics', 'interval', fallback=60.0),
+                         config.get('Metrics', 'textfile', fallback='') or None,
+                         config.getboolean('Metrics', 'log', fallback=True)).start()
+    atexit.register(_REPORTER.stop)
+    return _REPORTER
+
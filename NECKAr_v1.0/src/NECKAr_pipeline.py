@@ -0,0 +1,236 @@
+#! /usr/bin/env python3
+# This Python file uses the following encoding: utf-8
+
+#############################################################################
+#  NECKAr: threaded pipeline                                                #
+#    overlaps the cursor, the extraction and the bulk writes of a loop:    #
+#      fetch thread    reads the cursor in chunks (network, decoding)       #
+#      calling thread  extraction (the loop body)                           #
+#      writer thread   bulk writes                                          #
+#    the stages are connected by bounded queues of chunks, so a slow stage  #
+#    blocks the one before it (backpressure) and at most                    #
+#    2 * (queue_size + 2) chunks are in memory. After the loop the          #
+#    utilization (busy time / wall time) of every stage is reported, the   #
+#    stage with the highest utilization is the bottleneck.                  #
+#                                                                           #
+#      pipe = Pipeline("PER")                                               #
+#      with pipe.writer(bulk_writer.write) as write:                        #
+#          for item in pipe.prefetch(cursor):                               #
+#              write(extract(item))                                          #
+#      pipe.report()                                                         #
+#############################################################################
+
+import configparser
+import contextlib
+import itertools
+import queue
+import sys
+import threading
+import time
+import typing
+import NECKAr_profiling as profiling
+from NECKAr_metrics import METRICS
+
+# marks the end of a queue
+_END = object()
+STAGES = ["fetch", "extract", "write"]
+
+
+def print_info(info):
+    print("INFO\tNECKAr:\t", info)
+
+
+class Pipeline(object):
+    """Producer/consumer pipeline of one loop (see the module description)
+
+    :param name: name used in the report and the metrics, e.g. 'PER' <class 'string'>
+    :param queue_size: maximum number of chunks waiting in each queue <class 'int'>
+    :param chunk_size: number of items per chunk <class 'int'>
+    """
+
+    def __init__(self, name: str, queue_size: int = 8, chunk_size: int = 100):
+        self.name = name
+        self.queue_size = queue_size
+        self.chunk_size = chunk_size
+        self.busy = dict.fromkeys(STAGES, 0.0)
+        # time the calling thread waited for the fetch thread (starved) or the writer thread (blocked)
+        self.waited = 0.0
+        self.items = dict.fromkeys(STAGES, 0)
+        self.start = None
+        self.end = None
+        self.error = None
+        self._stop = threading.Event()
+        self._threads = []
+
+    def _started(self):
+        if self.start is None:
+            self.start = time.perf_counter()
+
+    def _thread(self, target, name: str) -> threading.Thread:
+        # the threads belong to the profiling section (stage, class) of the caller
+        fields = profiling.context_fields()
+
+        def run():
+            try:
+                with profiling.section(**fields):
+                    target()
+            except BaseException as e:
+                self.error = self.error or e
+                self._stop.set()
+        thread = threading.Thread(target=run, name="NECKAr " + self.name + " " + name, daemon=True)
+        self._threads.append(thread)
+        thread.start()
+        return thread
+
+    def _put(self, target_queue: queue.Queue, chunk) -> bool:
+        """Puts a chunk into a bounded queue, waits while it is full
+
+        :return: False if the pipeline was stopped meanwhile
+        """
+        while not self._stop.is_set():
+            try:
+                target_queue.put(chunk, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, source_queue: queue.Queue):
+        """:return: the next chunk of a queue (_END if the pipeline was stopped), raises the error of a failed
+        stage"""
+        while True:
+            try:
+                return source_queue.get(timeout=0.1)
+            except queue.Empty:
+                if self.error is not None:
+                    raise self.error
+                if self._stop.is_set():
+                    return _END
+
+    def prefetch(self, items: typing.Iterable) -> typing.Iterator:
+        """Reads the items in the fetch thread
+
+        :param items: iterable, e.g. a cursor (it is only used by the fetch thread)
+        :return: generator of the items for the calling thread (the extraction stage)
+        """
+        self._started()
+        fetched = queue.Queue(self.queue_size)
+
+        def fetch():
+            iterator = iter(items)
+            try:
+                while not self._stop.is_set():
+                    start = time.perf_counter()
+                    chunk = list(itertools.islice(iterator, self.chunk_size))
+                    self.busy["fetch"] += time.perf_counter() - start
+                    self.items["fetch"] += len(chunk)
+                    if not chunk or not self._put(fetched, chunk):
+                        break
+            finally:
+                # e.g. the temporary tables of SQLite cursors are removed by the thread that created them
+                if hasattr(iterator, "close"):
+                    iterator.close()
+                self._put(fetched, _END)
+
+        thread = self._thread(fetch, "fetch")
+        try:
+            while True:
+                start = time.perf_counter()
+                chunk = self._get(fetched)
+                self.waited += time.perf_counter() - start
+                if chunk is _END:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                self.items["extract"] += len(chunk)
+                yield from chunk
+        finally:
+            if thread.is_alive():
+                # the loop ended early (error, break): the fetch thread stops at its next chunk
+                self._stop.set()
+            thread.join()
+
+    @contextlib.contextmanager
+    def writer(self, write: typing.Callable[[object], object]):
+        """Runs write (e.g. BulkWriter.write) in the writer thread
+
+        :param write: function called for every written entry
+        :return: context manager yielding the function the loop calls instead of write
+        """
+        self._started()
+        pending = queue.Queue(self.queue_size)
+        buffer = []
+
+        def consume():
+            while True:
+                chunk = self._get(pending)
+                if chunk is _END:
+                    return
+                start = time.perf_counter()
+                for entry in chunk:
+                    write(entry)
+                self.busy["write"] += time.perf_counter() - start
+                self.items["write"] += len(chunk)
+
+        def put(chunk):
+            start = time.perf_counter()
+            if not self._put(pending, chunk):
+                raise self.error or RuntimeError("pipeline " + self.name + " stopped")
+            self.waited += time.perf_counter() - start
+
+        def enqueue(entry):
+            buffer.append(entry)
+            if len(buffer) >= self.chunk_size:
+                put(list(buffer))
+                buffer.clear()
+
+        thread = self._thread(consume, "write")
+        try:
+            yield enqueue
+            if buffer:
+                put(list(buffer))
+            put(_END)
+            thread.join()
+            if self.error is not None:
+                raise self.error
+        finally:
+            self._stop.set()
+            for pipeline_thread in self._threads:
+                pipeline_thread.join()
+            self.end = time.perf_counter()
+
+    def utilization(self) -> typing.Dict[str, float]:
+        """:return: dictionary stage -> busy time / wall time <class 'dict'>"""
+        wall = (self.end or time.perf_counter()) - (self.start or time.perf_counter())
+        if wall <= 0:
+            return dict.fromkeys(STAGES, 0.0)
+        busy = dict(self.busy, extract=max(0.0, wall - self.waited))
+        return {stage: min(1.0, busy[stage] / wall) for stage in STAGES}
+
+    def report(self) -> typing.Dict[str, float]:
+        """Prints the utilization of the stages and adds the busy times to the metrics
+
+        :return: utilization <class 'dict'>
+        """
+        utilization = self.utilization()
+        wall = (self.end or time.perf_counter()) - (self.start or time.perf_counter())
+        for stage, value in utilization.items():
+            METRICS.inc("pipeline_busy_seconds_total", value * wall, pipeline=self.name, stage=stage)
+        bottleneck = max(utilization, key=utilization.get)
+        print_info(self.name + "\tpipeline " + "%.2f" % wall + "s, utilization " +
+                   ", ".join(stage + " " + "%.0f" % (value * 100) + "%" for stage, value in utilization.items()) +
+                   " (bottleneck: " + bottleneck + ")")
+        sys.stdout.flush()
+        return utilization
+
+
+def read_pipeline_options(config: configparser.ConfigParser) -> typing.Optional[typing.Dict[str, int]]:
+    """Reads the section Pipeline of the configuration file NECKAr.cfg
+
+    :param config: ConfigParser Object
+    :return: keyword arguments for Pipeline <class 'dict'> | None (pipeline disabled, serial loops)
+    """
+    if not config.getboolean('Pipeline', 'enabled', fallback=False):
+        return None
+    return {"queue_size": config.getint('Pipeline', 'queue_size', fallback=8),
+            "chunk_size": config.getint('Pipeline', 'chunk_size', fallback=100)}
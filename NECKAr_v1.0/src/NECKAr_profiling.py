@@ -0,0 +1,263 @@
+#! /usr/bin/env python3
+# This Python file uses the following encoding: utf-8
+
+#############################################################################
+#  NECKAr: profiling                                                        #
+#    shows where the time of a stage goes (store, BSON/json decoding,      #
+#    get_functions), switched on per stage and per class in the section    #
+#    Profiling of NECKAr.cfg:                                               #
+#      deterministic: cProfile over the first sample_entities entities of  #
+#        a loop (ingest, classification of a class, LOD list), including   #
+#        the cursor fetch between the entities                              #
+#        -> <directory>/<stage>[_<class>].prof (pstats)                      #
+#      sampling: a thread takes the stacks of all threads working in a     #
+#        profiled stage every sample_interval seconds over the whole run   #
+#        -> <directory>/<stage>[_<class>].folded (one stack per line with   #
+#           its count, e.g. for flamegraph.pl)                              #
+#    at exit the top functions of every profile are written to              #
+#    <directory>/summary.txt                                                 #
+#############################################################################
+
+import atexit
+import cProfile
+import collections
+import configparser
+import contextlib
+import io
+import os
+import pstats
+import sys
+import threading
+import typing
+
+
+def print_info(info):
+    print("INFO\tNECKAr PROFILING:\t", info)
+
+
+class Profiling(object):
+    """Profiling of the stages and classes selected in the configuration
+
+    :param directory: directory of the profile files <class 'string'>
+    :param stages: stages (names or prefixes, e.g. 'classify') that are profiled <class 'list'> | None (all)
+    :param classes: classes (neClass) that are profiled, stages without class are not restricted <class 'list'> |
+        None (all)
+    :param sample_entities: number of entities profiled deterministically per loop (0: off) <class 'int'>
+    :param sample_interval: seconds between two stack samples (0: off) <class 'float'>
+    :param top: number of functions per profile in the summary <class 'int'>
+    :param default_stage: stage of the threads outside of a section, e.g. the name of the script <class 'string'>
+    """
+
+    def __init__(self, directory: str, stages: typing.Optional[typing.List[str]] = None,
+                 classes: typing.Optional[typing.List[str]] = None, sample_entities: int = 1000,
+                 sample_interval: float = 0.01, top: int = 25, default_stage: str = "main"):
+        self.directory = directory
+        self.stages = stages
+        self.classes = classes
+        self.sample_entities = sample_entities
+        self.sample_interval = sample_interval
+        self.top = top
+        self.default_stage = default_stage
+        self._lock = threading.Lock()
+        # thread id -> {"stage": ..., "ne_class": ...} of the threads in a section
+        self.contexts = {}
+        # label -> Counter of folded stacks
+        self.stacks = collections.defaultdict(collections.Counter)
+        self.profiles = []
+        self._stop = threading.Event()
+        self._thread = None
+        os.makedirs(directory, exist_ok=True)
+
+    def context(self) -> typing.Dict[str, str]:
+        return self.contexts.get(threading.get_ident(), {"stage": self.default_stage})
+
+    @staticmethod
+    def label(context: typing.Dict[str, str]) -> str:
+        """:return: name of the profile of a context, e.g. 'classify:person_PER' <class 'string'>"""
+        return context["stage"] + ("_" + context["ne_class"] if context.get("ne_class") else "")
+
+    def selected(self, context: typing.Dict[str, str]) -> bool:
+        if self.stages and not any(context["stage"] == stage or context["stage"].startswith(stage + ":")
+                                   for stage in self.stages):
+            return False
+        return not (self.classes and context.get("ne_class") and context["ne_class"] not in self.classes)
+
+    @contextlib.contextmanager
+    def section(self, **fields):
+        """Marks the current thread as working in a stage or on a class, e.g. section(stage="ingest") or
+        section(ne_class="PER"); nested sections add their fields"""
+        thread_id = threading.get_ident()
+        previous = self.contexts.get(thread_id)
+        self.contexts[thread_id] = dict(previous or {"stage": self.default_stage}, **fields)
+        try:
+            yield
+        finally:
+            if previous is None:
+                del self.contexts[thread_id]
+            else:
+                self.contexts[thread_id] = previous
+
+    def profile_items(self, items: typing.Iterable, name: str = "") -> typing.Iterator:
+        """Passes the items through; if the current section is selected, cProfile runs from the first item until
+        sample_entities items were processed by the caller (one profile per loop)
+
+        :param items: iterable, e.g. a cursor
+        :param name: name added to the profile file, e.g. the language of a LOD list <class 'string'>
+        """
+        context = self.context()
+        if not self.sample_entities or not self.selected(context):
+            yield from items
+            return
+        label = self.label(context) + ("_" + name if name else "")
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as e:
+            # only one profiler can be active at a time in newer Python versions
+            print_info(label + " not profiled: " + str(e))
+            yield from items
+            return
+        items = iter(items)
+        count = 0
+        try:
+            for item in items:
+                if count == self.sample_entities:
+                    profiler.disable()
+                    self._save_profile(profiler, label, count)
+                    profiler = None
+                    yield item
+                    yield from items
+                    return
+                count += 1
+                yield item
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                self._save_profile(profiler, label, count)
+
+    def _save_profile(self, profiler: cProfile.Profile, label: str, entities: int):
+        path = os.path.join(self.directory, label.replace("/", "_") + ".prof")
+        profiler.dump_stats(path)
+        with self._lock:
+            self.profiles.append((label, path, entities))
+        print_info(label + ": " + str(entities) + " entities profiled, " + path)
+
+    def _sample(self):
+        frames = sys._current_frames()
+        for thread_id, context in list(self.contexts.items()):
+            frame = frames.get(thread_id)
+            if frame is None or thread_id == threading.get_ident() or not self.selected(context):
+                continue
+            stack = []
+            while frame is not None and len(stack) < 200:
+                code = frame.f_code
+                stack.append(os.path.basename(code.co_filename) + ":" + code.co_name)
+                frame = frame.f_back
+            self.stacks[self.label(context)][";".join(reversed(stack))] += 1
+
+    def _run(self):
+        while not self._stop.wait(self.sample_interval):
+            self._sample()
+
+    def start(self) -> "Profiling":
+        if self.sample_interval > 0:
+            self._thread = threading.Thread(target=self._run, name="NECKAr profiling", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> str:
+        """Stops the sampling and writes the folded stacks and the summary
+
+        :return: summary <class 'string'>
+        """
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        out = io.StringIO()
+        for label, stacks in sorted(self.stacks.items()):
+            with open(os.path.join(self.directory, label + ".folded"), "w", encoding="utf-8") as folded_file:
+                for stack, count in stacks.most_common():
+                    folded_file.write(stack + " " + str(count) + "\n")
+            out.write(summarize_stacks(label, stacks, self.sample_interval, self.top))
+        for label, path, entities in self.profiles:
+            out.write("=== " + label + ": cProfile of " + str(entities) + " entities (" + path + ")\n")
+            stats = pstats.Stats(path, stream=out)
+            stats.sort_stats("tottime").print_stats(self.top)
+        summary = out.getvalue()
+        if summary:
+            with open(os.path.join(self.directory, "summary.txt"), "w", encoding="utf-8") as summary_file:
+                summary_file.write(summary)
+            print_info("summary written to " + os.path.join(self.directory, "summary.txt"))
+        return summary
+
+
+def summarize_stacks(label: str, stacks: typing.Counter, interval: float, top: int = 25) -> str:
+    """Top functions of the stack samples of one profile: self (the function was running) and total (the function
+    was on the stack)
+
+    :return: summary <class 'string'>
+    """
+    total = sum(stacks.values())
+    own = collections.Counter()
+    inclusive = collections.Counter()
+    for stack, count in stacks.items():
+        functions = stack.split(";")
+        own[functions[-1]] += count
+        for function in set(functions):
+            inclusive[function] += count
+    lines = ["=== " + label + ": " + str(total) + " stack samples (about " + "%.1f" % (total * interval) + "s)",
+             "%7s %7s  %s" % ("self%", "total%", "function")]
+    for function, count in own.most_common(top):
+        lines.append("%6.1f%% %6.1f%%  %s" % (100.0 * count / total, 100.0 * inclusive[function] / total, function))
+    return "\n".join(lines) + "\n\n"
+
+
+_PROFILING = None
+
+
+def start(config: configparser.ConfigParser, default_stage: typing.Optional[str] = None) -> typing.Optional[Profiling]:
+    """Starts the profiling of the configuration file NECKAr.cfg (section Profiling), the files are written at exit.
+    Called by the entry points.
+
+    :param config: ConfigParser Object
+    :param default_stage: stage of the threads outside of a section <class 'string'> | None (name of the script)
+    :return: profiling <class 'Profiling'> | None (disabled)
+    """
+    global _PROFILING
+    if not config.getboolean('Profiling', 'enabled', fallback=False) or _PROFILING is not None:
+        return _PROFILING
+    stages = [stage.strip() for stage in config.get('Profiling', 'stages', fallback='').split(",") if stage.strip()]
+    classes = [ne_class.strip() for ne_class in config.get('Profiling', 'classes', fallback='').split(",")
+               if ne_class.strip()]
+    _PROFILING = Profiling(config.get('Profiling', 'directory', fallback='../profiles'), stages or None,
+                           classes or None, config.getint('Profiling', 'sample_entities', fallback=1000),
+                           config.getfloat('Profiling', 'sample_interval', fallback=0.01),
+                           config.getint('Profiling', 'top', fallback=25),
+                           default_stage or os.path.splitext(os.path.basename(sys.argv[0]))[0] or "main").start()
+    atexit.register(_PROFILING.stop)
+    return _PROFILING
+
+
+def section(**fields):
+    """Marks the current thread as working in a stage or on a class (no-op if profiling is off), e.g.
+    with profiling.section(stage="ingest"): ..."""
+    if _PROFILING is None:
+        return contextlib.nullcontext()
+    return _PROFILING.section(**fields)
+
+
+def context_fields() -> typing.Dict[str, str]:
+    """:return: fields of the section of the current thread, to continue it in another thread with
+    section(**fields) <class 'dict'>"""
+    if _PROFILING is None:
+        return {}
+    return dict(_PROFILING.contexts.get(threading.get_ident(), {}))
+
+
+def profile_items(items: typing.Iterable, name: str = "") -> typing.Iterable:
+    """Profiles the first entities of a loop if profiling is on (see Profiling.profile_items), otherwise the items
+    are returned unchanged"""
+    if _PROFILING is None:
+        return items
+    return _PROFILING.profile_items(items, name)
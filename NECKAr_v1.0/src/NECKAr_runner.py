@@ -0,0 +1,349 @@
+#! /usr/bin/env python3
+# This Python file uses the following encoding: utf-8
+
+#############################################################################
+#  NECKAr: stage runner                                                     #
+#    runs the NECKAr stages as a DAG instead of one script after another:  #
+#      ingest              load the dump (WD2DB)                            #
+#      taxonomy            fetch the subclass trees (NECKAr_taxonomy)       #
+#      classify:<flag>     one stage per [Search_Flags] flag (NECKAr_main)  #
+#      finish              JSONL manifest / label enrichment                #
+#      lod:<lang>          one stage per [LODLinks] language                #
+#    every stage has a fingerprint over its config sections, its input     #
+#    files, the source code it runs and the results of the stages it       #
+#    depends on. A stage whose fingerprint did not change since its last   #
+#    successful run is skipped; stages whose dependencies are done run     #
+#    concurrently (e.g. the classes and the LOD languages).                 #
+#                                                                           #
+#    python3 NECKAr_runner.py [--only classify lod] [--force taxonomy]     #
+#                             [--dry-run] [--workers 4]                     #
+#############################################################################
+
+import argparse
+import concurrent.futures
+import configparser
+import datetime
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+import typing
+import traceback
+import NECKAr_bulk as bulk
+import NECKAr_metrics as metrics
+import NECKAr_profiling as profiling
+
+SRC_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+
+def print_info(info):
+    print("INFO\tNECKAr RUNNER:\t", info)
+
+
+def file_digest(path: str) -> str:
+    """:return: sha256 of the content of a file, 'missing' if it does not exist <class 'string'>"""
+    if not os.path.exists(path):
+        return "missing"
+    digest = hashlib.sha256()
+    with open(path, "rb") as digest_file:
+        for chunk in iter(lambda: digest_file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def input_digest(path: str) -> str:
+    """Cheap fingerprint of a (large) input file: size and modification time
+
+    :return: '<size>:<mtime>', 'missing' if it does not exist <class 'string'>
+    """
+    if not os.path.exists(path):
+        return "missing"
+    stat = os.stat(path)
+    return str(stat.st_size) + ":" + str(int(stat.st_mtime))
+
+
+class Stage(object):
+    """Node of the stage DAG
+
+    :param name: name, e.g. 'classify:person' <class 'string'>
+    :param run: function without arguments running the stage, it may return a digest of its result (otherwise each
+        run gets a new result, so a rerun, e.g. with --force, runs the dependent stages again)
+    :param deps: names of the stages this stage depends on <class 'list'>
+    :param sections: sections of NECKAr.cfg that are part of the fingerprint <class 'list'>
+    :param options: (section, option) pairs of NECKAr.cfg that are part of the fingerprint <class 'list'>
+    :param code: source files (relative to src/) that are part of the fingerprint <class 'list'>
+    :param files: input files whose size and modification time are part of the fingerprint <class 'list'>
+    :param extra: anything else that is part of the fingerprint (json serializable)
+    """
+
+    def __init__(self, name: str, run: typing.Callable[[], typing.Optional[str]], deps=(), sections=(), options=(),
+                 code=(), files=(), extra=None):
+        self.name = name
+        self.run = run
+        self.deps = list(deps)
+        self.sections = list(sections)
+        self.options = list(options)
+        self.code = list(code)
+        self.files = list(files)
+        self.extra = extra
+
+
+class Runner(object):
+    """Runs a stage DAG, the fingerprints and results of successful runs are kept in a json state file
+
+    :param config: ConfigParser Object
+    :param stages: stages, dependencies have to be part of the list <class 'list'>
+    :param state_file: path of the state file <class 'string'>
+    :param workers: maximum number of concurrently running stages <class 'int'>
+    """
+
+    def __init__(self, config: configparser.ConfigParser, stages: typing.List[Stage], state_file: str,
+                 workers: int = 4):
+        self.config = config
+        self.stages = index_stages(stages)
+        self.state_file = state_file
+        self.workers = workers
+        self.state = {}
+        if os.path.exists(state_file):
+            with open(state_file, encoding="utf-8") as state_file_object:
+                self.state = json.load(state_file_object)
+        self._lock = threading.Lock()
+        self._code_digests = {}
+        for stage in stages:
+            for dep in stage.deps:
+                if dep not in self.stages:
+                    raise ValueError("stage " + stage.name + " depends on unknown stage " + dep)
+
+    def _code_digest(self, path: str) -> str:
+        if path not in self._code_digests:
+            self._code_digests[path] = file_digest(os.path.join(SRC_DIRECTORY, path))
+        return self._code_digests[path]
+
+    def result(self, name: str, fingerprints: typing.Dict[str, str]) -> str:
+        """:return: result digest of a stage (of its last successful run, otherwise its current fingerprint)"""
+        state = self.state.get(name)
+        if state and state["fingerprint"] == fingerprints[name]:
+            return state["result"]
+        return fingerprints[name]
+
+    def fingerprint(self, stage: Stage, fingerprints: typing.Dict[str, str]) -> str:
+        """Fingerprint of a stage, all dependencies have to be fingerprinted (or run) before
+
+        :param stage: stage <class 'Stage'>
+        :param fingerprints: fingerprints of the other stages <class 'dict'>
+        :return: sha256 <class 'string'>
+        """
+        sections = {section: dict(self.config.items(section)) if self.config.has_section(section) else {}
+                    for section in stage.sections}
+        options = {section + "." + option: self.config.get(section, option, fallback=None)
+                   for section, option in stage.options}
+        content = {"stage": stage.name,
+                   "sections": sections,
+                   "options": options,
+                   "code": {path: self._code_digest(path) for path in stage.code},
+                   "files": {path: input_digest(path) for path in stage.files},
+                   "deps": {dep: self.result(dep, fingerprints) for dep in stage.deps},
+                   "extra": stage.extra}
+        return hashlib.sha256(json.dumps(content, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _save_state(self):
+        with open(self.state_file + ".tmp", "w", encoding="utf-8") as state_file_object:
+            json.dump(self.state, state_file_object, indent=1, sort_keys=True)
+        os.replace(self.state_file + ".tmp", self.state_file)
+
+    def _run_stage(self, stage: Stage, fingerprint: str):
+        print_info("STAGE " + stage.name + " started")
+        sys.stdout.flush()
+        start = time.perf_counter()
+        with profiling.section(stage=stage.name):
+            result = stage.run()
+        duration = time.perf_counter() - start
+        metrics.METRICS.observe("stage_seconds", duration, stage=stage.name)
+        finished = datetime.datetime.now()
+        if result is None:
+            # the stage rewrote its output: the dependent stages have to run again
+            result = hashlib.sha256((fingerprint + ":" + finished.isoformat()).encode("utf-8")).hexdigest()
+        with self._lock:
+            self.state[stage.name] = {"fingerprint": fingerprint, "result": result,
+                                      "finished": finished.isoformat(timespec="seconds"),
+                                      "seconds": round(duration, 3)}
+            self._save_state()
+        print_info("STAGE " + stage.name + " done in " + "%.2f" % duration + "s")
+        sys.stdout.flush()
+
+    def run(self, only: typing.Optional[typing.List[str]] = None, force: typing.Optional[typing.List[str]] = None,
+            dry_run: bool = False) -> typing.Dict[str, str]:
+        """Runs all stages whose fingerprint changed
+
+        :param only: run only the stages with one of these names or name prefixes (e.g. 'classify'), the other
+            stages are treated as done <class 'list'> | None (all)
+        :param force: run these stages (names or prefixes, 'all') even if their fingerprint did not change
+            <class 'list'> | None
+        :param dry_run: only report which stages would run <class 'bool'>
+        :return: dictionary stage -> status ('skipped', 'done', 'would run', 'failed', 'blocked') <class 'dict'>
+        """
+        def matches(name, patterns):
+            return any(p == "all" or name == p or name.startswith(p + ":") for p in patterns or [])
+
+        fingerprints = {}
+        status = {}
+        pending = dict(self.stages)
+        running = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while pending or running:
+                scheduled = len(pending)
+                for name, stage in list(pending.items()):
+                    if any(dep in pending or dep in running.values() for dep in stage.deps):
+                        continue
+                    del pending[name]
+                    if any(status[dep] in ("failed", "blocked") for dep in stage.deps):
+                        status[name] = "blocked"
+                        print_info("STAGE " + name + " blocked by a failed dependency")
+                        continue
+                    fingerprints[name] = self.fingerprint(stage, fingerprints)
+                    unchanged = self.state.get(name, {}).get("fingerprint") == fingerprints[name]
+                    if (only is not None and not matches(name, only)) or (unchanged and not matches(name, force)):
+                        status[name] = "skipped"
+                        print_info("STAGE " + name + " skipped" + (" (unchanged)" if unchanged else ""))
+                    elif dry_run:
+                        status[name] = "would run"
+                        print_info("STAGE " + name + " would run")
+                    else:
+                        running[executor.submit(self._run_stage, stage, fingerprints[name])] = name
+                if not running:
+                    if pending and len(pending) == scheduled:
+                        raise ValueError("cyclic dependencies between the stages " + ", ".join(pending))
+                    continue
+                done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        future.result()
+                        status[name] = "done"
+                    except Exception:
+                        status[name] = "failed"
+                        print_info("STAGE " + name + " failed\n" + traceback.format_exc())
+        return status
+
+
+def index_stages(stages: typing.List[Stage]) -> typing.Dict[str, Stage]:
+    res = {}
+    for stage in stages:
+        if stage.name in res:
+            raise ValueError("duplicate stage " + stage.name)
+        res[stage.name] = stage
+    return res
+
+
+######################################################################################################
+# NECKAr stages
+######################################################################################################
+
+STORAGE_CODE = ["NECKAr_storage.py", "NECKAr_bulk.py", "NECKAr_classindex.py"]
+CLASSIFY_CODE = ["NECKAr_main.py", "NECKAr_get_functions.py", "NECKAr_write_functions.py", "NECKAr_export.py",
+                 "NECKAr_membership.py"] + STORAGE_CODE
+
+
+def build_stages(config: configparser.ConfigParser) -> typing.List[Stage]:
+    """Builds the NECKAr stage DAG of the configuration file NECKAr.cfg
+
+    :param config: ConfigParser Object
+    :return: list of stages
+    """
+    import WD2DB
+    import NECKAr_main
+    import NECKAr_taxonomy as taxonomy
+    import create_LOD_lists
+
+    def ingest():
+        WD2DB.ingest(config, drop=True)
+
+    stages = [Stage("ingest", ingest,
+                    sections=["Database", "ClassIndex"],
+                    options=[("Dump", "sample_archive_file_100"), ("Dump", "insert_batch_size")],
+                    code=["WD2DB.py"] + STORAGE_CODE,
+                    files=[WD2DB.get_archive_file(config)])]
+
+    flags = [flag for flag in NECKAr_main.SEARCH_FLAGS if config.getboolean('Search_Flags', flag)]
+    roots = sorted({root for flag in flags for root in NECKAr_main.SEARCH_FLAGS[flag][2]})
+    if roots:
+        # source dump reads the subclass claims of the loaded dump
+        stages.append(Stage("taxonomy", lambda: taxonomy.from_config(config, refresh=True).fetch_all(roots),
+                            deps=["ingest"] if config.get('Taxonomy', 'source', fallback='sparql') == 'dump' else [],
+                            sections=["Taxonomy"], code=["NECKAr_taxonomy.py", "NECKAr_WikidataAPI.py"],
+                            extra=roots))
+
+    def classify(flag):
+        # the workers of the JSONL output are numbered by the position of the flag, so each class always writes
+        # (and removes) its own shards
+        worker = list(NECKAr_main.SEARCH_FLAGS).index(flag)
+
+        def run():
+            input_collection, output_collection = NECKAr_main.read_config(config)
+            output_collection = NECKAr_main.read_output(config, output_collection, worker)
+            output_collection.ensure_index(['id'])
+            NECKAr_main.search(flag, config, output_collection, input_collection, taxonomy.from_config(config))
+            if hasattr(output_collection, "close"):
+                output_collection.close()
+        return run
+
+    for flag in flags:
+        stages.append(Stage("classify:" + flag, classify(flag),
+                            deps=["ingest"] + (["taxonomy"] if NECKAr_main.SEARCH_FLAGS[flag][2] else []),
+                            sections=["Database", "Output"] + (["Aliases"] if flag == "person" else []),
+                            options=[("LOD", "lookup_mode")],
+                            code=CLASSIFY_CODE + (["NECKAr_taxonomy.py"] if NECKAr_main.SEARCH_FLAGS[flag][2] else [])))
+    classify_stages = ["classify:" + flag for flag in flags]
+
+    def finish():
+        input_collection, output_collection = NECKAr_main.read_config(config)
+        NECKAr_main.finish(config, output_collection, input_collection)
+
+    stages.append(Stage("finish", finish, deps=classify_stages, sections=["Database", "Output", "Enrichment"],
+                        code=["NECKAr_main.py", "NECKAr_label_resolver.py", "NECKAr_export.py"] + STORAGE_CODE))
+
+    if config.get('Output', 'mode', fallback='database') == 'jsonl':
+        print_info("LOD stages skipped, they need output mode database")
+        return stages
+
+    def lod(lang):
+        def run():
+            input_collection, output_list, all_collection = create_LOD_lists.read_config(config)
+            create_LOD_lists.create_LODlist(input_collection, output_list[lang], all_collection, lang,
+                                            **create_LOD_lists.read_LOD_options(config))
+        return run
+
+    for lang, coll_name in config.items("LODLinks"):
+        stages.append(Stage("lod:" + lang, lod(lang), deps=classify_stages,
+                            sections=["Database"],
+                            options=[("LOD", option) for option in ["lookup_mode", "batch_size", "write_mode",
+                                                                    "write_batch_size"]] + [("LODLinks", lang)],
+                            code=["create_LOD_lists.py", "NECKAr_get_functions.py"] + STORAGE_CODE))
+    return stages
+
+
+if __name__ == "__main__":
+    """runs the NECKAr stages, the parameters are set in NECKAr.cfg (section Runner)"""
+
+    parser = argparse.ArgumentParser(description="NECKAr stage runner")
+    parser.add_argument("--config", default="../NECKAr.cfg", help="configuration file")
+    parser.add_argument("--only", nargs="+", help="run only these stages (names or prefixes, e.g. classify lod)")
+    parser.add_argument("--force", nargs="+", help="rerun these stages even if unchanged (names, prefixes or all)")
+    parser.add_argument("--dry-run", action="store_true", help="only show which stages would run")
+    parser.add_argument("--workers", type=int, help="maximum number of concurrently running stages")
+    args = parser.parse_args()
+
+    config = configparser.ConfigParser()
+    config.read(args.config)
+    metrics.start(config)
+    profiling.start(config)
+    bulk.configure(config)
+    runner = Runner(config, build_stages(config),
+                    config.get('Runner', 'state_file', fallback='../runner_state.json'),
+                    args.workers or config.getint('Runner', 'workers', fallback=4))
+    status = runner.run(args.only, args.force, args.dry_run)
+    print_info("SUMMARY " + ", ".join(name + " " + stage_status for name, stage_status in status.items()))
+    if any(stage_status in ("failed", "blocked") for stage_status in status.values()):
+        sys.exit(1)
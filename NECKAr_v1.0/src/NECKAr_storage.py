@@ -0,0 +1,768 @@
+#! /usr/bin/env python3
+# This Python file uses the following encoding: utf-8
+
+#############################################################################
+#  NECKAr: storage backends                                                 #
+#    all stages access the dump, the output and the LOD lists through a    #
+#    store (one per collection) with the same small set of operations:     #
+#    scans with projection, point and batch lookups and bulk writes.       #
+#    backends:                                                              #
+#      mongo:  MongoDB server (pymongo)                                     #
+#      sqlite: embedded single-node engine, one SQLite file per database   #
+#    the backend is selected with [Database] backend in NECKAr.cfg          #
+#    run this file to compare the two backends (see benchmark)              #
+#############################################################################
+
+import configparser
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+import typing
+import uuid
+import bson
+import pymongo
+from pymongo import errors, InsertOne, ReplaceOne, UpdateMany
+from NECKAr_metrics import METRICS, record_fetch
+
+P31_PATH = "claims.P31.mainsnak.datavalue.value.numeric-id"
+# maximum number of class ids of one $in query, longer selections are split into id ranges
+IN_CHUNK_SIZE = 10000
+
+
+def print_info(info):
+    print("INFO\tNECKAr:\t", info)
+
+
+def project(doc: typing.Dict[str, object], projection: typing.Optional[typing.Dict[str, int]]) \
+        -> typing.Dict[str, object]:
+    """Applies a MongoDB style inclusion projection (dotted paths, _id is included unless excluded) to a document
+
+    :param doc: document <class 'dict'>
+    :param projection: projection, e.g. {"id": 1, "claims.P345": 1} <class 'dict'> | None
+    :return: projected document <class 'dict'>
+    """
+    if not projection:
+        return doc
+    res = {}
+    paths = [path for path, value in projection.items() if value and path != "_id"]
+    if projection.get("_id", 1) and "_id" in doc:
+        res["_id"] = doc["_id"]
+    for path in paths:
+        source = doc
+        target = res
+        parts = path.split(".")
+        for part in parts[:-1]:
+            if not isinstance(source, dict) or part not in source:
+                source = None
+                break
+            source = source[part]
+            target = target.setdefault(part, {})
+        if isinstance(source, dict) and parts[-1] in source:
+            target[parts[-1]] = source[parts[-1]]
+    return res
+
+
+def get_instance_of_ids(doc: typing.Dict[str, object]) -> typing.List[int]:
+    """:return: numeric ids of all P31 (instance of) values of an item (list of int)"""
+    ids = []
+    for claim in doc.get("claims", {}).get("P31", []):
+        if "datavalue" in claim["mainsnak"]:
+            ids.append(claim["mainsnak"]["datavalue"]["value"]["numeric-id"])
+    return ids
+
+
+def partition_class_ids(class_ids: typing.Iterable[int], chunk_size: int = IN_CHUNK_SIZE) \
+        -> typing.List[typing.List[int]]:
+    """Splits a selection of classes into ranges of at most chunk_size sorted ids
+
+    :return: list of lists of int
+    """
+    ids = sorted(set(class_ids))
+    return [ids[start:start + chunk_size] for start in range(0, len(ids), chunk_size)]
+
+
+def first_selected(item: typing.Dict[str, object], selected: typing.Set[int]) -> int:
+    """:return: smallest P31 value of an item that is one of the selected classes <class 'int'>; a selection that is
+        split into id ranges (or joined per class) returns an item only for this class, so each item once"""
+    return min(class_id for class_id in get_instance_of_ids(item) if class_id in selected)
+
+
+def instance_projection(projection: typing.Optional[typing.Dict[str, int]]) -> typing.Optional[typing.Dict[str, int]]:
+    """:return: inclusion projection that also includes the P31 values needed by first_selected <class 'dict'> | None
+    """
+    if not projection or not any(value for path, value in projection.items() if path != "_id"):
+        return projection
+    return dict(projection, **{P31_PATH: 1})
+
+
+def join_pipeline(dump_name: str, class_root: int, projection=None) -> typing.List[typing.Dict[str, object]]:
+    """Aggregation on a membership collection (see NECKAr_membership): every class materialized under the root is
+    joined with the items of the dump collection that are an instance of it. The joined items are unwound one by
+    one, so no document gets near the BSON size limit.
+
+    :param dump_name: name of the dump collection (same database) <class 'string'>
+    :param class_root: root of the selection <class 'int'>
+    :param projection: projection of the items <class 'dict'> | None
+    :return: pipeline, the documents are {"q_id": class id, "item": item} <class 'list'>
+    """
+    pipeline = [{"$match": {"class_root": class_root}},
+                {"$lookup": {"from": dump_name, "localField": "q_id", "foreignField": P31_PATH, "as": "item"}},
+                {"$unwind": "$item"},
+                {"$match": {"item.type": "item"}}]
+    projection = instance_projection(projection)
+    if projection:
+        pipeline.append({"$project": dict({"_id": 0, "q_id": 1}, **{"item." + path: value
+                                                                    for path, value in projection.items()})})
+    return pipeline
+
+
+# error code of a duplicate key (MongoDB)
+DUPLICATE_KEY = 11000
+
+
+def is_transient(error: Exception) -> bool:
+    """:return: True if a failed write can be repeated: connection problems, timeouts, a locked SQLite database
+        <class 'bool'>"""
+    if isinstance(error, sqlite3.OperationalError):
+        return "locked" in str(error) or "busy" in str(error)
+    if isinstance(error, errors.PyMongoError) and hasattr(error, "has_error_label") and \
+            error.has_error_label("RetryableWriteError"):
+        return True
+    return isinstance(error, (errors.ConnectionFailure, errors.ExecutionTimeout, errors.WTimeoutError))
+
+
+def get_write_errors(error: Exception) -> typing.Optional[typing.Dict[int, typing.Tuple[int, str]]]:
+    """Reads the entries a store rejected from the error of a bulk write. Only an unordered MongoDB bulk write tells
+    them, and it wrote all other entries.
+
+    :return: dictionary index in the batch -> (error code, message) <class 'dict'> | None (unknown)
+    """
+    if not isinstance(error, errors.BulkWriteError):
+        return None
+    return {write_error["index"]: (write_error.get("code"), write_error.get("errmsg", ""))
+            for write_error in error.details.get("writeErrors", [])}
+
+
+######################################################################################################
+# MongoDB
+######################################################################################################
+
+class MongoStore(object):
+    """Store backed by a MongoDB collection
+
+    :param collection: pymongo collection
+    :param key: field identifying an entry <class 'string'>
+    """
+
+    def __init__(self, collection, key: str = "id"):
+        self.collection = collection
+        self.key = key
+        self.name = collection.name
+        self.database_name = collection.database.name
+
+    @staticmethod
+    def _query(where=None, exists=None, exists_any=None):
+        query = dict(where or {})
+        for field in exists or []:
+            query[field] = {"$exists": True}
+        if exists_any:
+            query["$or"] = [{field: {"$exists": True}} for field in exists_any]
+        return query
+
+    def scan_pages(self, where=None, exists=None, exists_any=None, projection=None, page_size=1000, limit=0):
+        """Streams all matching documents in pages ordered by _id (keyset pagination)
+
+        :param where: equality conditions on fields <class 'dict'> | None
+        :param exists: fields that have to exist <class 'list'> | None
+        :param exists_any: at least one of these fields has to exist <class 'list'> | None
+        :param projection: projection <class 'dict'> | None
+        :param page_size: number of documents per page <class 'int'>
+        :param limit: maximum number of documents (0: all) <class 'int'>
+        :return: generator of lists of documents
+        """
+        drop_id = projection is not None and not projection.get("_id", 1)
+        if drop_id:
+            projection = dict(projection)
+            del projection["_id"]
+        last_id = None
+        count = 0
+        while not limit or count < limit:
+            size = min(page_size, limit - count) if limit else page_size
+            query = self._query(where, exists, exists_any)
+            if last_id is not None:
+                query["_id"] = {"$gt": last_id}
+            start = time.perf_counter()
+            page = list(self.collection.find(query, projection).sort("_id", pymongo.ASCENDING).limit(size))
+            # the driver decodes while it fetches, both are counted as fetch time
+            record_fetch(self.name, time.perf_counter() - start, None, None, len(page))
+            if not page:
+                return
+            count += len(page)
+            last_id = page[-1]["_id"]
+            if drop_id:
+                for doc in page:
+                    del doc["_id"]
+            yield page
+
+    def scan(self, where=None, exists=None, exists_any=None, projection=None, page_size=1000, limit=0):
+        """Streams all matching documents ordered by _id (see scan_pages)"""
+        for page in self.scan_pages(where, exists, exists_any, projection, page_size, limit):
+            yield from page
+
+    def find_instances(self, class_ids: typing.List[int], projection=None, chunk_size: int = IN_CHUNK_SIZE,
+                       class_root: typing.Optional[int] = None,
+                       related: typing.Optional[typing.Dict[int, typing.List[int]]] = None):
+        """Streams all items that are an instance (P31) of one of the given classes. Selections of more than
+        chunk_size classes are queried in id ranges of chunk_size classes, each item is returned by the range of its
+        first selected class (see first_selected).
+
+        :param class_ids: numeric ids of the classes (list of int)
+        :param projection: projection <class 'dict'> | None
+        :param chunk_size: maximum number of classes of one $in query <class 'int'>
+        :param class_root: root class of the selection, only used by NECKAr_membership.MembershipStore <class 'int'> |
+            None
+        :param related: subclass sets of other roots the extraction of the items depends on (e.g. the location
+            types), root -> numeric class ids, only used by NECKAr_membership.MembershipStore <class 'dict'> | None
+        :return: generator of items
+        """
+        ranges = partition_class_ids(class_ids, chunk_size)
+        if len(ranges) <= 1:
+            yield from self._find_instances(class_ids, projection)
+            return
+        selected = set(class_ids)
+        for ids in ranges:
+            for item in self._find_instances(ids, instance_projection(projection)):
+                if first_selected(item, selected) >= ids[0]:
+                    yield item
+
+    def _find_instances(self, class_ids: typing.List[int], projection=None):
+        if len(class_ids) == 1:
+            condition = class_ids[0]
+        else:
+            condition = {"$in": list(class_ids)}
+        # raw batches, so fetching (query, network) and BSON decoding can be measured separately
+        cursor = self.collection.find_raw_batches({"$and": [{"type": "item"}, {P31_PATH: condition}]}, projection,
+                                                  no_cursor_timeout=True)
+        try:
+            while True:
+                start = time.perf_counter()
+                batch = next(cursor, None)
+                if batch is None:
+                    return
+                fetched = time.perf_counter()
+                docs = bson.decode_all(batch)
+                record_fetch(self.name, fetched - start, time.perf_counter() - fetched, len(batch), len(docs))
+                yield from docs
+        finally:
+            cursor.close()
+
+    def join_instances(self, membership: "MongoStore", class_root: int, class_ids: typing.List[int],
+                       projection=None, page_size: int = 1000):
+        """Streams the items that are an instance (P31) of one of the classes materialized under class_root in the
+        membership store (aggregation, see join_pipeline), each item once
+
+        :param membership: membership store of the same database <class 'MongoStore'>
+        :param class_root: root of the selection <class 'int'>
+        :param class_ids: numeric ids of the materialized classes (list of int)
+        :param projection: projection <class 'dict'> | None
+        :param page_size: number of joined items per fetch measurement <class 'int'>
+        :return: generator of items
+        """
+        if not isinstance(membership, MongoStore) or membership.database_name != self.database_name:
+            raise ValueError("join needs both collections in the same MongoDB database")
+        selected = set(class_ids)
+        cursor = membership.collection.aggregate(join_pipeline(self.name, class_root, projection), allowDiskUse=True,
+                                                 batchSize=page_size)
+        try:
+            while True:
+                start = time.perf_counter()
+                page = list(itertools.islice(cursor, page_size))
+                record_fetch(self.name, time.perf_counter() - start, None, None, len(page))
+                if not page:
+                    return
+                for doc in page:
+                    if first_selected(doc["item"], selected) == doc["q_id"]:
+                        yield doc["item"]
+        finally:
+            cursor.close()
+
+    def lookup_pages(self, other: "MongoStore", as_field: str, exists=None, projection=None, page_size=1000,
+                     limit=0):
+        """Streams the matching documents in pages ordered by _id, each joined ($lookup on the key) with the
+        documents of another store of the same database
+
+        :param other: store joined in <class 'MongoStore'>
+        :param as_field: field the joined documents are written to <class 'string'>
+        :param exists: fields that have to exist <class 'list'> | None
+        :param projection: projection applied after the join, _id is always kept <class 'dict'> | None
+        :param page_size: number of documents per page <class 'int'>
+        :param limit: maximum number of documents (0: all) <class 'int'>
+        :return: generator of lists of documents
+        """
+        if not isinstance(other, MongoStore) or other.database_name != self.database_name:
+            raise ValueError("lookup needs both collections in the same MongoDB database")
+        last_id = None
+        count = 0
+        while not limit or count < limit:
+            size = min(page_size, limit - count) if limit else page_size
+            query = self._query(None, exists)
+            if last_id is not None:
+                query["_id"] = {"$gt": last_id}
+            pipeline = [{"$match": query}, {"$sort": {"_id": 1}}, {"$limit": size},
+                        {"$lookup": {"from": other.name, "localField": self.key, "foreignField": other.key,
+                                     "as": as_field}}]
+            if projection:
+                pipeline.append({"$project": projection})
+            page = list(self.collection.aggregate(pipeline, allowDiskUse=True))
+            if not page:
+                return
+            count += len(page)
+            last_id = page[-1]["_id"]
+            yield page
+
+    def get(self, value, projection=None):
+        """:return: the first document with the given key value | None"""
+        return self.collection.find_one({self.key: value}, projection)
+
+    def get_many(self, values: typing.List[object], projection=None) -> typing.Dict[object, typing.Dict[str, object]]:
+        """Batch lookup with a single $in query
+
+        :return: dictionary key value -> document <class 'dict'>
+        """
+        if projection is not None and not projection.get(self.key):
+            projection = dict(projection, **{self.key: 1})
+        return {doc[self.key]: doc for doc in self.collection.find({self.key: {"$in": list(values)}}, projection)}
+
+    def insert_many(self, docs: typing.List[typing.Dict[str, object]]):
+        if docs:
+            with METRICS.timer("bulk_write_seconds", store=self.name, op="insert"):
+                self.collection.bulk_write([InsertOne(doc) for doc in docs], ordered=False)
+            METRICS.inc("bulk_docs_total", len(docs), store=self.name, op="insert")
+
+    def replace_many(self, docs: typing.List[typing.Dict[str, object]]):
+        """Replaces the documents with the same key or inserts them (upsert)"""
+        if docs:
+            with METRICS.timer("bulk_write_seconds", store=self.name, op="replace"):
+                self.collection.bulk_write([ReplaceOne({self.key: doc[self.key]}, doc, upsert=True) for doc in docs],
+                                           ordered=False)
+            METRICS.inc("bulk_docs_total", len(docs), store=self.name, op="replace")
+
+    def update_many(self, updates: typing.Dict[object, typing.Dict[str, object]]):
+        """Sets fields of the documents with the given key values
+
+        :param updates: dictionary key value -> fields to set <class 'dict'>
+        """
+        if updates:
+            self.collection.bulk_write([UpdateMany({self.key: value}, {"$set": fields})
+                                        for value, fields in updates.items()], ordered=False)
+
+    def delete(self, where=None) -> int:
+        """Removes all documents matching the equality conditions (all documents if where is None)"""
+        return self.collection.delete_many(where or {}).deleted_count
+
+    def delete_many(self, values: typing.List[object], where=None) -> int:
+        """Removes the documents with the given key values that match the equality conditions
+
+        :return: number of removed documents <class 'int'>
+        """
+        values = list(values)
+        deleted = 0
+        for start in range(0, len(values), IN_CHUNK_SIZE):
+            query = dict(where or {}, **{self.key: {"$in": values[start:start + IN_CHUNK_SIZE]}})
+            deleted += self.collection.delete_many(query).deleted_count
+        return deleted
+
+    def count(self, where=None) -> int:
+        return self.collection.count_documents(where or {})
+
+    def ensure_index(self, fields: typing.List[str], partial_exists: typing.Optional[str] = None,
+                     name: typing.Optional[str] = None):
+        """Creates an ascending index (only documents having the field partial_exists, if given)"""
+        options = {}
+        if partial_exists:
+            options["partialFilterExpression"] = {partial_exists: {"$exists": True}}
+        if name:
+            options["name"] = name
+        self.collection.create_index([(field, pymongo.ASCENDING) for field in fields], **options)
+
+
+class MongoStorage(object):
+    """MongoDB server
+
+    :param host: host <class 'string'>
+    :param port: port <class 'int'>
+    :param user: user, the client authenticates at connection <class 'string'> | None
+    :param password: password <class 'string'> | None
+    :param auth_source: database the user is defined in (see read_credentials) <class 'string'> | None (admin)
+    """
+    name = "mongo"
+
+    def __init__(self, host: str = "localhost", port: int = 27017, user: typing.Optional[str] = None,
+                 password: typing.Optional[str] = None, auth_source: typing.Optional[str] = None):
+        credentials = {}
+        if user:
+            credentials = {"username": user, "password": password}
+            if auth_source:
+                credentials["authSource"] = auth_source
+        try:
+            self.client = pymongo.MongoClient(host, port, **credentials)
+        except errors.ConnectionFailure:
+            print("Connection to the database cannot be made. Please check the config file")
+            raise
+
+    def store(self, db_name: str, collection_name: str, key: str = "id", authenticate: bool = False) -> MongoStore:
+        # authenticate is kept for the callers: the client authenticates at connection, pymongo 4 has no
+        # Database.authenticate
+        return MongoStore(self.client[db_name][collection_name], key)
+
+    def drop(self, db_name: str, collection_name: str):
+        self.client[db_name].drop_collection(collection_name)
+
+
+######################################################################################################
+# SQLite (embedded)
+######################################################################################################
+
+class SQLiteStore(object):
+    """Store backed by a table of a SQLite database file. Documents are stored as json, the key and neClass are
+    columns; for items the P31 values are kept in a side table, so find_instances is an indexed join.
+
+    :param storage: storage the database file belongs to <class 'SQLiteStorage'>
+    :param db_name: name of the database (file) <class 'string'>
+    :param name: name of the collection (table) <class 'string'>
+    :param key: field identifying an entry <class 'string'>
+    """
+
+    def __init__(self, storage: "SQLiteStorage", db_name: str, name: str, key: str = "id"):
+        self.storage = storage
+        self.database_name = db_name
+        self.name = name
+        self.key = key
+        self.table = '"' + name + '"'
+        self.p31_table = '"' + name + '__p31"'
+        connection = self._connection()
+        connection.execute("CREATE TABLE IF NOT EXISTS " + self.table +
+                           " (rowid INTEGER PRIMARY KEY, key TEXT, neClass TEXT, doc TEXT NOT NULL)")
+        connection.execute("CREATE INDEX IF NOT EXISTS " + '"' + name + '__key"' + " ON " + self.table + " (key)")
+        connection.execute("CREATE TABLE IF NOT EXISTS " + self.p31_table +
+                           " (class_id INTEGER NOT NULL, entity INTEGER NOT NULL)")
+        connection.execute("CREATE INDEX IF NOT EXISTS " + '"' + name + '__p31_class"' + " ON " + self.p31_table +
+                           " (class_id, entity)")
+        connection.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        return self.storage.connection(self.database_name)
+
+    @staticmethod
+    def _field(field: str) -> str:
+        return "json_extract(doc, '$." + field.replace("'", "''") + "')"
+
+    def _where(self, where=None, exists=None, exists_any=None) -> typing.Tuple[typing.List[str], typing.List[object]]:
+        conditions = []
+        params = []
+        for field, value in (where or {}).items():
+            if field == "neClass":
+                conditions.append("neClass = ?")
+            elif field == self.key:
+                conditions.append("key = ?")
+            else:
+                conditions.append(self._field(field) + " = ?")
+            params.append(value)
+        for field in exists or []:
+            conditions.append(self._field(field) + " IS NOT NULL")
+        if exists_any:
+            conditions.append("(" + " OR ".join(self._field(field) + " IS NOT NULL" for field in exists_any) + ")")
+        return conditions, params
+
+    @staticmethod
+    def _load(doc: str, projection) -> typing.Dict[str, object]:
+        return project(json.loads(doc), projection)
+
+    def scan_pages(self, where=None, exists=None, exists_any=None, projection=None, page_size=1000, limit=0):
+        """Streams all matching documents in pages ordered by insertion (keyset pagination on rowid)"""
+        conditions, params = self._where(where, exists, exists_any)
+        last_rowid = 0
+        count = 0
+        while not limit or count < limit:
+            size = min(page_size, limit - count) if limit else page_size
+            query = "SELECT rowid, doc FROM " + self.table + " WHERE " + " AND ".join(conditions + ["rowid > ?"]) + \
+                    " ORDER BY rowid LIMIT ?"
+            start = time.perf_counter()
+            rows = self._connection().execute(query, params + [last_rowid, size]).fetchall()
+            if not rows:
+                return
+            fetched = time.perf_counter()
+            count += len(rows)
+            last_rowid = rows[-1][0]
+            page = [self._load(doc, projection) for rowid, doc in rows]
+            record_fetch(self.name, fetched - start, time.perf_counter() - fetched,
+                         sum(len(doc) for rowid, doc in rows), len(rows))
+            yield page
+
+    def scan(self, where=None, exists=None, exists_any=None, projection=None, page_size=1000, limit=0):
+        for page in self.scan_pages(where, exists, exists_any, projection, page_size, limit):
+            yield from page
+
+    def find_instances(self, class_ids: typing.List[int], projection=None, chunk_size: int = IN_CHUNK_SIZE,
+                       class_root: typing.Optional[int] = None,
+                       related: typing.Optional[typing.Dict[int, typing.List[int]]] = None):
+        """Streams all items that are an instance (P31) of one of the given classes (a join with the P31 side table,
+        chunk_size is not needed)"""
+        connection = self._connection()
+        ids_table = "temp.\"ids_" + uuid.uuid4().hex + '"'
+        connection.execute("CREATE TABLE " + ids_table + " (id INTEGER PRIMARY KEY)")
+        connection.executemany("INSERT OR IGNORE INTO " + ids_table + " VALUES (?)", ((i,) for i in class_ids))
+        try:
+            cursor = connection.execute("SELECT doc FROM " + self.table + " WHERE rowid IN (SELECT p.entity FROM " +
+                                        self.p31_table + " p JOIN " + ids_table + " c ON p.class_id = c.id)" +
+                                        " ORDER BY rowid")
+            while True:
+                start = time.perf_counter()
+                rows = cursor.fetchmany(1000)
+                if not rows:
+                    return
+                fetched = time.perf_counter()
+                docs = [self._load(doc, projection) for (doc,) in rows]
+                record_fetch(self.name, fetched - start, time.perf_counter() - fetched,
+                             sum(len(doc) for (doc,) in rows), len(rows))
+                yield from docs
+        finally:
+            connection.execute("DROP TABLE " + ids_table)
+
+    def lookup_pages(self, other, as_field, exists=None, projection=None, page_size=1000, limit=0):
+        raise ValueError("lookup is only available for the MongoDB backend")
+
+    def get(self, value, projection=None):
+        row = self._connection().execute("SELECT doc FROM " + self.table + " WHERE key = ? ORDER BY rowid LIMIT 1",
+                                          (value,)).fetchone()
+        return self._load(row[0], projection) if row else None
+
+    def get_many(self, values: typing.List[object], projection=None) -> typing.Dict[object, typing.Dict[str, object]]:
+        if projection is not None and not projection.get(self.key):
+            projection = dict(projection, **{self.key: 1})
+        values = list(values)
+        res = {}
+        for i in range(0, len(values), 500):
+            chunk = values[i:i + 500]
+            query = "SELECT key, doc FROM " + self.table + " WHERE key IN (" + ",".join("?" * len(chunk)) + ")"
+            for key, doc in self._connection().execute(query, chunk):
+                res.setdefault(key, self._load(doc, projection))
+        return res
+
+    def _insert(self, connection: sqlite3.Connection, doc: typing.Dict[str, object]):
+        cursor = connection.execute("INSERT INTO " + self.table + " (key, neClass, doc) VALUES (?, ?, ?)",
+                                    (doc.get(self.key), doc.get("neClass"), json.dumps(doc, default=str)))
+        if doc.get("type") == "item":
+            connection.executemany("INSERT INTO " + self.p31_table + " VALUES (?, ?)",
+                                   ((class_id, cursor.lastrowid) for class_id in get_instance_of_ids(doc)))
+
+    def insert_many(self, docs: typing.List[typing.Dict[str, object]]):
+        connection = self._connection()
+        with METRICS.timer("bulk_write_seconds", store=self.name, op="insert"), connection:
+            for doc in docs:
+                self._insert(connection, doc)
+        METRICS.inc("bulk_docs_total", len(docs), store=self.name, op="insert")
+
+    def replace_many(self, docs: typing.List[typing.Dict[str, object]]):
+        connection = self._connection()
+        with METRICS.timer("bulk_write_seconds", store=self.name, op="replace"), connection:
+            for doc in docs:
+                self._delete(connection, ["key = ?"], [doc[self.key]])
+                self._insert(connection, doc)
+        METRICS.inc("bulk_docs_total", len(docs), store=self.name, op="replace")
+
+    def update_many(self, updates: typing.Dict[object, typing.Dict[str, object]]):
+        connection = self._connection()
+        with connection:
+            for value, fields in updates.items():
+                for rowid, doc in connection.execute("SELECT rowid, doc FROM " + self.table + " WHERE key = ?",
+                                                     (value,)).fetchall():
+                    doc = json.loads(doc)
+                    doc.update(fields)
+                    connection.execute("UPDATE " + self.table + " SET doc = ? WHERE rowid = ?",
+                                       (json.dumps(doc, default=str), rowid))
+
+    def _delete(self, connection, conditions, params) -> int:
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        connection.execute("DELETE FROM " + self.p31_table + " WHERE entity IN (SELECT rowid FROM " + self.table +
+                           where + ")", params)
+        return connection.execute("DELETE FROM " + self.table + where, params).rowcount
+
+    def delete(self, where=None) -> int:
+        connection = self._connection()
+        conditions, params = self._where(where)
+        with connection:
+            return self._delete(connection, conditions, params)
+
+    def delete_many(self, values: typing.List[object], where=None) -> int:
+        conditions, params = self._where(where)
+        values = list(values)
+        deleted = 0
+        connection = self._connection()
+        with connection:
+            for i in range(0, len(values), 500):
+                chunk = values[i:i + 500]
+                deleted += self._delete(connection, conditions + ["key IN (" + ",".join("?" * len(chunk)) + ")"],
+                                        params + chunk)
+        return deleted
+
+    def count(self, where=None) -> int:
+        conditions, params = self._where(where)
+        query = "SELECT COUNT(*) FROM " + self.table
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        return self._connection().execute(query, params).fetchone()[0]
+
+    def ensure_index(self, fields: typing.List[str], partial_exists: typing.Optional[str] = None,
+                     name: typing.Optional[str] = None):
+        columns = []
+        for field in fields:
+            if field == "_id":
+                continue  # documents are ordered by rowid
+            columns.append("key" if field == self.key else "neClass" if field == "neClass" else self._field(field))
+        if not columns:
+            return
+        name = name or "_".join(fields)
+        query = "CREATE INDEX IF NOT EXISTS " + '"' + self.name + "__" + name + '"' + " ON " + self.table + \
+                " (" + ", ".join(columns) + ")"
+        if partial_exists:
+            query += " WHERE " + self._field(partial_exists) + " IS NOT NULL"
+        connection = self._connection()
+        with connection:
+            connection.execute(query)
+
+
+class SQLiteStorage(object):
+    """Embedded storage, one SQLite file per database in the given directory. Each thread uses its own connection.
+
+    :param directory: directory of the database files <class 'string'>
+    """
+    name = "sqlite"
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+
+    def connection(self, db_name: str) -> sqlite3.Connection:
+        connections = self._local.__dict__.setdefault("connections", {})
+        if db_name not in connections:
+            connection = sqlite3.connect(os.path.join(self.directory, db_name + ".sqlite"), timeout=600,
+                                         check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connections[db_name] = connection
+        return connections[db_name]
+
+    def store(self, db_name: str, collection_name: str, key: str = "id", authenticate: bool = False) -> SQLiteStore:
+        return SQLiteStore(self, db_name, collection_name, key)
+
+    def drop(self, db_name: str, collection_name: str):
+        connection = self.connection(db_name)
+        with connection:
+            connection.execute('DROP TABLE IF EXISTS "' + collection_name + '"')
+            connection.execute('DROP TABLE IF EXISTS "' + collection_name + '__p31"')
+
+
+def read_credentials(config: configparser.ConfigParser) -> typing.Dict[str, str]:
+    """Reads the credentials of the MongoDB client from the section Database of NECKAr.cfg; the user is defined in
+    the database auth_source (default: the write database db_write)
+
+    :param config: ConfigParser Object
+    :return: keyword arguments of pymongo.MongoClient (username, password, authSource) | {} (auth = False)
+    """
+    if not config.getboolean('Database', 'auth'):
+        return {}
+    return {"username": config.get('Database', 'user'),
+            "password": config.get('Database', 'password'),
+            "authSource": config.get('Database', 'auth_source', fallback='') or config.get('Database', 'db_write')}
+
+
+def from_config(config: configparser.ConfigParser):
+    """Creates the storage selected in the configuration file NECKAr.cfg ([Database] backend)
+
+    :param config: ConfigParser Object
+    :return: storage <class 'MongoStorage'> | <class 'SQLiteStorage'>
+    """
+    backend = config.get('Database', 'backend', fallback='mongo')
+    if backend == "sqlite":
+        return SQLiteStorage(config.get('Database', 'sqlite_directory', fallback='../wikidata_sqlite'))
+    if backend != "mongo":
+        raise ValueError("unknown storage backend: " + backend)
+    credentials = read_credentials(config)
+    return MongoStorage(config.get('Database', 'host'), config.getint('Database', 'port'), credentials.get("username"),
+                        credentials.get("password"), credentials.get("authSource"))
+
+
+######################################################################################################
+# Benchmark
+######################################################################################################
+
+def benchmark_item(i: int) -> typing.Dict[str, object]:
+    """:return: small Wikidata-like item used by the benchmark <class 'dict'>"""
+    return {"id": "Q" + str(i), "type": "item",
+            "labels": {"en": {"language": "en", "value": "item " + str(i)}},
+            "claims": {"P31": [{"mainsnak": {"snaktype": "value", "property": "P31",
+                                             "datavalue": {"value": {"numeric-id": i % 100, "id": "Q" + str(i % 100)},
+                                                           "type": "wikibase-entityid"}}}]}}
+
+
+def benchmark(storage, n: int = 100000, batch_size: int = 1000, db_name: str = "neckar_benchmark") \
+        -> typing.Dict[str, float]:
+    """Measures bulk insert, point lookup, batch lookup, class scan and full scan of a storage (operations per second)
+
+    :param storage: storage <class 'MongoStorage'> | <class 'SQLiteStorage'>
+    :param n: number of items <class 'int'>
+    :param batch_size: number of items per bulk write / batch lookup <class 'int'>
+    :param db_name: database used for the benchmark (the collection is dropped afterwards)
+    :return: dictionary operation -> items per second <class 'dict'>
+    """
+    storage.drop(db_name, "benchmark")
+    store = storage.store(db_name, "benchmark")
+    store.ensure_index(["id"])
+    if isinstance(store, MongoStore):
+        store.ensure_index([P31_PATH])
+    rates = {}
+
+    def measure(name, function, items):
+        start = time.perf_counter()
+        function()
+        duration = time.perf_counter() - start
+        rates[name] = items / duration if duration > 0 else 0.0
+        print_info("BENCHMARK " + storage.name + " " + name + ": " + "%.0f" % rates[name] + " items/s")
+
+    def insert():
+        for start in range(0, n, batch_size):
+            store.insert_many([benchmark_item(i) for i in range(start, min(start + batch_size, n))])
+
+    ids = ["Q" + str(i) for i in range(0, n, max(1, n // 10000))]
+    measure("bulk insert", insert, n)
+    measure("point lookup", lambda: [store.get(wdid) for wdid in ids], len(ids))
+    measure("batch lookup", lambda: [store.get_many(ids[i:i + batch_size]) for i in range(0, len(ids), batch_size)],
+            len(ids))
+    measure("class scan", lambda: sum(1 for _ in store.find_instances(list(range(10)))), n // 10)
+    measure("full scan", lambda: sum(1 for _ in store.scan(projection={"id": 1})), n)
+    storage.drop(db_name, "benchmark")
+    return rates
+
+
+if __name__ == "__main__":
+    """compares the MongoDB server of NECKAr.cfg with the embedded SQLite backend"""
+
+    config = configparser.ConfigParser()
+    config.read('../NECKAr.cfg')
+    n = config.getint('Database', 'benchmark_items', fallback=100000)
+
+    results = {"sqlite": benchmark(SQLiteStorage(config.get('Database', 'sqlite_directory',
+                                                            fallback='../wikidata_sqlite')), n)}
+    try:
+        config.set('Database', 'backend', 'mongo')
+        results["mongo"] = benchmark(from_config(config), n)
+    except errors.PyMongoError as e:
+        print_info("BENCHMARK mongo skipped: " + str(e))
+    for operation in results["sqlite"]:
+        print_info("BENCHMARK " + operation + ": " + ", ".join(backend + " " + "%.0f" % rates[operation] + " items/s"
+                                                              for backend, rates in results.items()))
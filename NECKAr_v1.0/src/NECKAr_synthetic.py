@@ -0,0 +1,525 @@
+#! /usr/bin/env python3
+# This Python file uses the following encoding: utf-8
+
+#############################################################################
+#  NECKAr: synthetic Wikidata dumps                                         #
+#    writes a synthetic dump in the line format of latest-all.json.bz2     #
+#    ("[", one entity per line followed by a comma, "]"), so WD2DB, the     #
+#    classifier and the LOD lists can be run at any scale without the      #
+#    real dump:                                                             #
+#      - class items for all root classes of NECKAr_main plus a synthetic   #
+#        subclass graph (P279) below them, so the offline taxonomy          #
+#        ([Taxonomy] source = dump) finds the subclass trees                #
+#      - entities with a configurable P31 class distribution, label and     #
+#        alias language fan-out, class specific claims (dates, gender,      #
+#        coordinates, population, ...) and heavy tailed (Pareto) numbers   #
+#        of additional claims, up to multi-MB entities                     #
+#    the entities are generated in chunks by several processes (each chunk  #
+#    is a bz2 stream with its own seed, so the dump only depends on the     #
+#    seed), the streams are concatenated to one multi-stream bz2 file      #
+#                                                                           #
+#    python3 NECKAr_synthetic.py [--entities 1000000] [--output file]      #
+#############################################################################
+
+import argparse
+import bz2
+import concurrent.futures
+import configparser
+import json
+import os
+import random
+import shutil
+import sys
+import time
+import typing
+import NECKAr_taxonomy as taxonomy
+
+PERSON = 5
+LANGUAGE = 315
+BRAND = 431289
+WORK = 38672
+CONTINENT = 5107
+
+# classes of the remaining entities (scholarly article, Wikimedia category, taxon, ...), not classified by NECKAr
+OTHER_CLASSES = [13442814, 4167836, 16521, 4167410, 11424, 482994, 7187]
+
+# kind -> root classes the P31 values are drawn from (root or synthetic subclass)
+KIND_ROOTS = {"PER": [PERSON],
+              "LOC": [taxonomy.CITY, taxonomy.SETTLEMENT, taxonomy.COUNTRY, taxonomy.SOVEREIGN_STATE, taxonomy.STATE,
+                      taxonomy.SEA, taxonomy.RIVER, taxonomy.MOUNTAIN, taxonomy.MOUNTAIN_RANGE, taxonomy.HGTE,
+                      taxonomy.GEOLOCATION, CONTINENT],
+              "ORG": [taxonomy.ORGANIZATION],
+              "EVE": [taxonomy.EVENT],
+              "ANG": [LANGUAGE],
+              "DUC": [BRAND],
+              "FAC": [taxonomy.FACILITY],
+              "TIMEX": [taxonomy.TIME],
+              "TTL": [taxonomy.TITLE],
+              "WOA": [WORK],
+              "OTHER": OTHER_CLASSES}
+
+# classes NECKAr only finds by the root itself (find_instances([id])), they get no synthetic subclasses
+LEAF_ROOTS = {PERSON, LANGUAGE, BRAND, WORK, CONTINENT} | set(OTHER_CLASSES)
+
+# parent (P279) of the root classes, e.g. city -> settlement -> geographic location
+ROOT_PARENTS = {taxonomy.CITY: taxonomy.SETTLEMENT,
+                taxonomy.SETTLEMENT: taxonomy.GEOLOCATION,
+                taxonomy.COUNTRY: taxonomy.GEOLOCATION,
+                taxonomy.SOVEREIGN_STATE: taxonomy.COUNTRY,
+                taxonomy.CONSTITUENT_COUNTRY: taxonomy.COUNTRY,
+                taxonomy.STATE: taxonomy.GEOLOCATION,
+                taxonomy.SEA: taxonomy.GEOLOCATION,
+                taxonomy.RIVER: taxonomy.GEOLOCATION,
+                taxonomy.MOUNTAIN: taxonomy.GEOLOCATION,
+                taxonomy.MOUNTAIN_RANGE: taxonomy.GEOLOCATION,
+                taxonomy.HGTE: taxonomy.GEOLOCATION,
+                CONTINENT: taxonomy.GEOLOCATION}
+
+DEFAULT_CLASS_WEIGHTS = {"PER": 0.3, "LOC": 0.15, "ORG": 0.08, "EVE": 0.03, "ANG": 0.005, "DUC": 0.005, "FAC": 0.03,
+                         "TIMEX": 0.01, "TTL": 0.01, "WOA": 0.1, "OTHER": 0.28}
+
+DEFAULT_LANGUAGES = ["en", "de", "fr", "es", "it", "nl", "ru", "ja", "zh", "pl", "sv", "pt", "ar", "uk", "cs"]
+
+GENDERS = [6581097, 6581072, 1052281]
+LOD_FORMATS = {"P345": "nm%07d", "P434": "%08x-0000-4000-8000-000000000000", "P227": "%d-X", "P1566": "%d",
+               "P402": "%d"}
+# properties of the additional claims: external ids (strings) and items
+FILLER_STRING_PROPERTIES = list(range(2000, 2400))
+FILLER_ITEM_PROPERTIES = list(range(1400, 1450))
+
+GREGORIAN = "http://www.wikidata.org/entity/Q1985727"
+SYLLABLES = ["ka", "ri", "to", "mo", "ne", "sa", "lu", "vi", "an", "el", "or", "is", "un", "be", "da", "go", "he",
+             "ja", "ki", "le", "mi", "no", "pe", "ra", "si", "te", "wa", "zu"]
+
+
+def print_info(info):
+    print("INFO\tNECKAr:\t", info)
+
+
+class Profile(object):
+    """Parameters of a synthetic dump (section Synthetic of NECKAr.cfg)
+
+    :param entities: number of entities (ids 1..entities, ids of root classes are class items) <class 'int'>
+    :param seed: random seed <class 'int'>
+    :param class_weights: kind (PER, LOC, ..., OTHER) -> share of the entities <class 'dict'>
+    :param languages: label languages, the first ones are the most frequent <class 'list'>
+    :param label_languages: mean number of label languages per entity <class 'float'>
+    :param aliases: mean number of aliases per label language <class 'float'>
+    :param claims: scale of the additional claims per entity (Pareto distributed) <class 'float'>
+    :param heavy_tail: Pareto shape of the additional claims, smaller values give heavier tails <class 'float'>
+    :param max_claims: maximum number of additional claims per entity <class 'int'>
+    :param sitelinks: share of the entities with an English Wikipedia article <class 'float'>
+    :param subclass_depth: depth of the synthetic subclass tree below each root class <class 'int'>
+    :param subclass_branching: subclasses per class in the synthetic subclass tree <class 'int'>
+    :param wide_subclasses: additional direct subclasses of organization (Q43229), e.g. 50000 to get the huge
+        $in queries of the real dump <class 'int'>
+    """
+
+    def __init__(self, entities: int = 1000000, seed: int = 42,
+                 class_weights: typing.Optional[typing.Dict[str, float]] = None,
+                 languages: typing.Optional[typing.List[str]] = None, label_languages: float = 3.0,
+                 aliases: float = 0.8, claims: float = 4.0, heavy_tail: float = 1.3, max_claims: int = 40000,
+                 sitelinks: float = 0.4, subclass_depth: int = 3, subclass_branching: int = 3,
+                 wide_subclasses: int = 0):
+        self.entities = entities
+        self.seed = seed
+        self.class_weights = dict(class_weights or DEFAULT_CLASS_WEIGHTS)
+        unknown = set(self.class_weights) - set(KIND_ROOTS)
+        if unknown:
+            raise ValueError("unknown classes in class_weights: " + ", ".join(sorted(unknown)))
+        self.languages = list(languages or DEFAULT_LANGUAGES)
+        self.label_languages = label_languages
+        self.aliases = aliases
+        self.claims = claims
+        self.heavy_tail = heavy_tail
+        self.max_claims = max_claims
+        self.sitelinks = sitelinks
+        self.subclass_depth = subclass_depth
+        self.subclass_branching = subclass_branching
+        self.wide_subclasses = wide_subclasses
+
+
+def read_profile(config: configparser.ConfigParser) -> Profile:
+    """Reads the section Synthetic of the configuration file NECKAr.cfg
+
+    :param config: ConfigParser Object
+    :return: profile <class 'Profile'>
+    """
+    section = 'Synthetic'
+    weights = config.get(section, 'class_weights', fallback='')
+    languages = config.get(section, 'languages', fallback='')
+    return Profile(entities=config.getint(section, 'entities', fallback=1000000),
+                   seed=config.getint(section, 'seed', fallback=42),
+                   class_weights={kind.strip(): float(weight) for kind, weight in
+                                  (pair.split(":") for pair in weights.split(",") if pair.strip())} or None,
+                   languages=[lang.strip() for lang in languages.split(",") if lang.strip()] or None,
+                   label_languages=config.getfloat(section, 'label_languages', fallback=3.0),
+                   aliases=config.getfloat(section, 'aliases', fallback=0.8),
+                   claims=config.getfloat(section, 'claims', fallback=4.0),
+                   heavy_tail=config.getfloat(section, 'heavy_tail', fallback=1.3),
+                   max_claims=config.getint(section, 'max_claims', fallback=40000),
+                   sitelinks=config.getfloat(section, 'sitelinks', fallback=0.4),
+                   subclass_depth=config.getint(section, 'subclass_depth', fallback=3),
+                   subclass_branching=config.getint(section, 'subclass_branching', fallback=3),
+                   wide_subclasses=config.getint(section, 'wide_subclasses', fallback=0))
+
+
+######################################################################################################
+# class graph
+######################################################################################################
+
+def get_root_classes() -> typing.List[int]:
+    """:return: all root classes of the synthetic class graph (list of int)"""
+    roots = set(taxonomy.LOCATION_ROOTS) | {taxonomy.ORGANIZATION, taxonomy.EVENT, taxonomy.FACILITY, taxonomy.TIME,
+                                            taxonomy.TITLE, taxonomy.CONSTITUENT_COUNTRY}
+    for kind_roots in KIND_ROOTS.values():
+        roots.update(kind_roots)
+    return sorted(roots)
+
+
+def build_class_graph(profile: Profile) -> typing.Dict[int, typing.List[int]]:
+    """Builds the synthetic subclass graph: a tree of subclass_depth levels with subclass_branching subclasses per
+    class below every root class (except LEAF_ROOTS) plus wide_subclasses direct subclasses of organization. The
+    synthetic classes get the ids after the entities (entities + 1, ...).
+
+    :param profile: profile <class 'Profile'>
+    :return: dictionary class id -> parent class ids (P279), root classes without parent have an empty list
+    """
+    parents = {root: [ROOT_PARENTS[root]] if root in ROOT_PARENTS else [] for root in get_root_classes()}
+    next_id = profile.entities + 1
+    for root in get_root_classes():
+        if root in LEAF_ROOTS:
+            continue
+        level = [root]
+        for depth in range(profile.subclass_depth):
+            next_level = []
+            for parent in level:
+                for i in range(profile.subclass_branching):
+                    parents[next_id] = [parent]
+                    next_level.append(next_id)
+                    next_id += 1
+            level = next_level
+    for i in range(profile.wide_subclasses):
+        parents[next_id] = [taxonomy.ORGANIZATION]
+        next_id += 1
+    return parents
+
+
+def get_subclasses(parents: typing.Dict[int, typing.List[int]], root: int) -> typing.List[int]:
+    """:return: root class and all its (transitive) subclasses in the class graph, as the taxonomy finds them in the
+    dump (list of int)"""
+    children = {}
+    for class_id, class_parents in parents.items():
+        for parent in class_parents:
+            children.setdefault(parent, []).append(class_id)
+    ids = [root]
+    seen = {root}
+    for class_id in ids:
+        for child in children.get(class_id, []):
+            if child not in seen:
+                seen.add(child)
+                ids.append(child)
+    return ids
+
+
+def get_kind_classes(parents: typing.Dict[int, typing.List[int]]) -> typing.Dict[str, typing.List[int]]:
+    """:return: dictionary kind -> classes the P31 values of the kind are drawn from (roots and their subclasses)"""
+    children = {}
+    for class_id, class_parents in parents.items():
+        for parent in class_parents:
+            children.setdefault(parent, []).append(class_id)
+    roots = set(get_root_classes())
+    res = {}
+    for kind, kind_roots in KIND_ROOTS.items():
+        classes = []
+        queue = list(kind_roots)
+        while queue:
+            class_id = queue.pop()
+            classes.append(class_id)
+            # root classes below a root (e.g. city below settlement) are only added by their own kind
+            queue.extend(child for child in children.get(class_id, []) if child not in roots)
+        res[kind] = sorted(classes)
+    return res
+
+
+######################################################################################################
+# entities
+######################################################################################################
+
+def statement(rng: random.Random, wdid: str, prop: str, value, value_type: str, datatype: str) \
+        -> typing.Dict[str, object]:
+    return {"mainsnak": {"snaktype": "value", "property": prop,
+                         "datavalue": {"value": value, "type": value_type}, "datatype": datatype},
+            "type": "statement", "id": wdid + "$" + "%032x" % rng.getrandbits(128), "rank": "normal"}
+
+
+def item_statement(rng: random.Random, wdid: str, prop: str, numeric_id: int) -> typing.Dict[str, object]:
+    return statement(rng, wdid, prop, {"entity-type": "item", "numeric-id": numeric_id, "id": "Q" + str(numeric_id)},
+                     "wikibase-entityid", "wikibase-item")
+
+
+def time_statement(rng: random.Random, wdid: str, prop: str, year: int) -> typing.Dict[str, object]:
+    time_value = {"time": "%+05d-%02d-%02dT00:00:00Z" % (year, rng.randint(1, 12), rng.randint(1, 28)),
+                  "timezone": 0, "before": 0, "after": 0, "precision": 11, "calendarmodel": GREGORIAN}
+    return statement(rng, wdid, prop, time_value, "time", "time")
+
+
+def string_statement(rng: random.Random, wdid: str, prop: str, value: str, datatype: str = "external-id") \
+        -> typing.Dict[str, object]:
+    return statement(rng, wdid, prop, value, "string", datatype)
+
+
+def make_name(rng: random.Random) -> str:
+    return " ".join("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+                    for _ in range(rng.randint(1, 3)))
+
+
+def geometric(rng: random.Random, mean: float) -> int:
+    """:return: geometrically distributed count with the given mean <class 'int'>"""
+    if mean <= 0:
+        return 0
+    p = 1.0 / (1.0 + mean)
+    count = 0
+    while rng.random() > p:
+        count += 1
+    return count
+
+
+class EntityGenerator(object):
+    """Generates the entities of a profile
+
+    :param profile: profile <class 'Profile'>
+    :param parents: class graph (see build_class_graph) <class 'dict'>
+    """
+
+    def __init__(self, profile: Profile, parents: typing.Dict[int, typing.List[int]]):
+        self.profile = profile
+        self.parents = parents
+        self.kind_classes = get_kind_classes(parents)
+        self.kinds = list(profile.class_weights)
+        self.cumulative_weights = []
+        total = 0.0
+        for kind in self.kinds:
+            total += profile.class_weights[kind]
+            self.cumulative_weights.append(total)
+
+    def labels(self, rng: random.Random, wdid: str, name: str) -> typing.Tuple[dict, dict, dict]:
+        languages = self.profile.languages
+        count = max(1, min(len(languages), 1 + geometric(rng, self.profile.label_languages - 1)))
+        # the first languages are the most frequent ones
+        chosen = sorted(set(int(len(languages) * rng.random() ** 2) for _ in range(count)))
+        if rng.random() < 0.8:
+            chosen = sorted(set(chosen) | {0})
+        labels = {}
+        descriptions = {}
+        aliases = {}
+        for index in chosen:
+            lang = languages[index]
+            value = name if index == 0 else name + " (" + lang + ")"
+            labels[lang] = {"language": lang, "value": value}
+            if rng.random() < 0.6:
+                descriptions[lang] = {"language": lang, "value": "synthetic entity " + wdid}
+            alias_count = geometric(rng, self.profile.aliases)
+            if alias_count:
+                aliases[lang] = [{"language": lang, "value": make_name(rng)} for _ in range(alias_count)]
+        return labels, descriptions, aliases
+
+    def random_item(self, rng: random.Random) -> int:
+        return rng.randint(1, self.profile.entities)
+
+    def class_claims(self, rng: random.Random, wdid: str, kind: str) -> typing.Dict[str, list]:
+        claims = {}
+        if kind == "PER":
+            claims["P21"] = [item_statement(rng, wdid, "P21", rng.choice(GENDERS))]
+            birth = rng.randint(1500, 2005)
+            claims["P569"] = [time_statement(rng, wdid, "P569", birth)]
+            if rng.random() < 0.4:
+                claims["P570"] = [time_statement(rng, wdid, "P570", birth + rng.randint(1, 100))]
+            claims["P106"] = [item_statement(rng, wdid, "P106", self.random_item(rng))
+                              for _ in range(geometric(rng, 1.2))]
+        elif kind == "LOC":
+            claims["P17"] = [item_statement(rng, wdid, "P17", self.random_item(rng))]
+            if rng.random() < 0.3:
+                claims["P30"] = [item_statement(rng, wdid, "P30", self.random_item(rng))]
+            if rng.random() < 0.7:
+                coordinate = {"latitude": round(rng.uniform(-90, 90), 6), "longitude": round(rng.uniform(-180, 180), 6),
+                              "altitude": None, "precision": 0.0001, "globe": "http://www.wikidata.org/entity/Q2"}
+                claims["P625"] = [statement(rng, wdid, "P625", coordinate, "globecoordinate", "globe-coordinate")]
+            if rng.random() < 0.4:
+                amount = {"amount": "+" + str(int(rng.paretovariate(1.2) * 100)), "unit": "1"}
+                claims["P1082"] = [statement(rng, wdid, "P1082", amount, "quantity", "quantity")]
+        elif kind == "ORG":
+            claims["P571"] = [time_statement(rng, wdid, "P571", rng.randint(1600, 2020))]
+            claims["P159"] = [item_statement(rng, wdid, "P159", self.random_item(rng))]
+            claims["P17"] = [item_statement(rng, wdid, "P17", self.random_item(rng))]
+            if rng.random() < 0.5:
+                claims["P856"] = [string_statement(rng, wdid, "P856", "https://example.org/" + wdid, "url")]
+            claims["P112"] = [item_statement(rng, wdid, "P112", self.random_item(rng))
+                              for _ in range(geometric(rng, 0.8))]
+            claims["P169"] = [item_statement(rng, wdid, "P169", self.random_item(rng))
+                              for _ in range(geometric(rng, 0.3))]
+            if rng.random() < 0.1:
+                claims["P37"] = [item_statement(rng, wdid, "P37", self.random_item(rng))]
+        elif kind == "EVE":
+            claims["P276"] = [item_statement(rng, wdid, "P276", self.random_item(rng))]
+        return {prop: values for prop, values in claims.items() if values}
+
+    def entity(self, rng: random.Random, number: int) -> typing.Dict[str, object]:
+        """:return: synthetic entity with the id Q<number> <class 'dict'>"""
+        wdid = "Q" + str(number)
+        position = rng.random() * self.cumulative_weights[-1]
+        kind = next(kind for kind, weight in zip(self.kinds, self.cumulative_weights) if position < weight)
+        classes = self.kind_classes[kind]
+        instance_of = [rng.choice(classes)]
+        if rng.random() < 0.1:
+            instance_of.append(rng.choice(classes))
+        name = make_name(rng)
+        labels, descriptions, aliases = self.labels(rng, wdid, name)
+        claims = {"P31": [item_statement(rng, wdid, "P31", class_id) for class_id in dict.fromkeys(instance_of)]}
+        claims.update(self.class_claims(rng, wdid, kind))
+        for prop, id_format in LOD_FORMATS.items():
+            if rng.random() < 0.1:
+                claims[prop] = [string_statement(rng, wdid, prop, id_format % number)]
+        filler = min(self.profile.max_claims,
+                     int(self.profile.claims * (rng.paretovariate(self.profile.heavy_tail) - 1)))
+        for i in range(filler):
+            if rng.random() < 0.8:
+                prop = "P" + str(rng.choice(FILLER_STRING_PROPERTIES))
+                claims.setdefault(prop, []).append(string_statement(rng, wdid, prop, "%x" % rng.getrandbits(64)))
+            else:
+                prop = "P" + str(rng.choice(FILLER_ITEM_PROPERTIES))
+                claims.setdefault(prop, []).append(item_statement(rng, wdid, prop, self.random_item(rng)))
+        sitelinks = {}
+        if rng.random() < self.profile.sitelinks:
+            sitelinks["enwiki"] = {"site": "enwiki", "title": name + " " + wdid, "badges": []}
+        if rng.random() < self.profile.sitelinks / 2:
+            sitelinks["dewiki"] = {"site": "dewiki", "title": name + " " + wdid, "badges": []}
+        return {"type": "item", "id": wdid, "labels": labels, "descriptions": descriptions, "aliases": aliases,
+                "claims": claims, "sitelinks": sitelinks, "lastrevid": number}
+
+    def class_item(self, rng: random.Random, class_id: int) -> typing.Dict[str, object]:
+        """:return: item of a class with its P279 (subclass of) claims <class 'dict'>"""
+        wdid = "Q" + str(class_id)
+        name = "class " + wdid
+        claims = {}
+        if self.parents[class_id]:
+            claims["P279"] = [item_statement(rng, wdid, "P279", parent) for parent in self.parents[class_id]]
+        return {"type": "item", "id": wdid, "labels": {"en": {"language": "en", "value": name}},
+                "descriptions": {}, "aliases": {}, "claims": claims,
+                "sitelinks": {"enwiki": {"site": "enwiki", "title": name, "badges": []}}, "lastrevid": class_id}
+
+
+######################################################################################################
+# dump
+######################################################################################################
+
+def write_part(profile: Profile, parents: typing.Dict[int, typing.List[int]], path: str, first: int, last: int,
+               classes: bool, final: bool, compresslevel: int = 9) -> typing.Dict[str, int]:
+    """Writes one part of the dump (one bz2 stream): the entities first..last (ids of classes are skipped) or, if
+    classes is True, all class items
+
+    :param final: if True the part ends the dump (no comma after the last entity, closing bracket)
+    :return: statistics (entities, bytes, largest entity, entities over 1 MB) <class 'dict'>
+    """
+    generator = EntityGenerator(profile, parents)
+    stats = {"entities": 0, "bytes": 0, "max_entity_bytes": 0, "large_entities": 0}
+    previous = None
+    with bz2.open(path, "wt", encoding="utf-8", compresslevel=compresslevel) as part_file:
+        if classes:
+            rng = random.Random(profile.seed * 1000003 - 1)
+            entities = (generator.class_item(rng, class_id) for class_id in sorted(parents))
+        else:
+            # every part has its own seed, so the dump does not depend on the number of processes
+            rng = random.Random(profile.seed * 1000003 + first)
+            entities = (generator.entity(rng, number) for number in range(first, last + 1) if number not in parents)
+        for entity in entities:
+            if previous is not None:
+                part_file.write(previous + ",\n")
+            previous = json.dumps(entity, ensure_ascii=False, separators=(",", ":"))
+            size = len(previous.encode("utf-8"))
+            stats["entities"] += 1
+            stats["bytes"] += size
+            stats["max_entity_bytes"] = max(stats["max_entity_bytes"], size)
+            if size > 1 << 20:
+                stats["large_entities"] += 1
+        if previous is not None:
+            part_file.write(previous + ("\n]\n" if final else ",\n"))
+        elif final:
+            part_file.write("]\n")
+    return stats
+
+
+def generate_dump(profile: Profile, output: str, workers: typing.Optional[int] = None, chunk_size: int = 100000,
+                  compresslevel: int = 9) -> typing.Dict[str, int]:
+    """Writes a synthetic dump
+
+    :param profile: profile <class 'Profile'>
+    :param output: path of the dump (.json.bz2) <class 'string'>
+    :param workers: number of processes <class 'int'> | None (number of CPUs)
+    :param chunk_size: number of entities per part <class 'int'>
+    :param compresslevel: bz2 compression level <class 'int'>
+    :return: statistics <class 'dict'>
+    """
+    start = time.perf_counter()
+    parents = build_class_graph(profile)
+    print_info("SYNTHETIC " + str(len(parents)) + " classes, " + str(profile.entities) + " entity ids")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    parts = [(first, min(first + chunk_size - 1, profile.entities), False, False)
+             for first in range(1, profile.entities + 1, chunk_size)]
+    # the class items come last, so the graph is complete once the entities are loaded
+    parts.append((0, 0, True, True))
+    paths = [output + ".part%05d" % i for i in range(len(parts))]
+    stats = {"entities": 0, "bytes": 0, "max_entity_bytes": 0, "large_entities": 0}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(write_part, profile, parents, path, first, last, classes, final, compresslevel)
+                   for path, (first, last, classes, final) in zip(paths, parts)]
+        for i, future in enumerate(futures):
+            part_stats = future.result()
+            stats["entities"] += part_stats["entities"]
+            stats["bytes"] += part_stats["bytes"]
+            stats["max_entity_bytes"] = max(stats["max_entity_bytes"], part_stats["max_entity_bytes"])
+            stats["large_entities"] += part_stats["large_entities"]
+            print_info("SYNTHETIC part " + str(i + 1) + "/" + str(len(parts)) + " written, " + str(stats["entities"]) +
+                       " entities")
+            sys.stdout.flush()
+    # bz2 streams can be concatenated, bzcat and bz2.open read all of them
+    with open(output + ".tmp", "wb") as dump_file:
+        dump_file.write(bz2.compress(b"[\n", compresslevel))
+        for path in paths:
+            with open(path, "rb") as part_file:
+                shutil.copyfileobj(part_file, dump_file, 1 << 20)
+            os.remove(path)
+    os.replace(output + ".tmp", output)
+    stats["seconds"] = round(time.perf_counter() - start, 3)
+    print_info("SYNTHETIC " + str(stats["entities"]) + " entities, " + "%.1f" % (stats["bytes"] / 1e6) +
+               " MB uncompressed (largest entity " + "%.1f" % (stats["max_entity_bytes"] / 1e6) + " MB, " +
+               str(stats["large_entities"]) + " over 1 MB) written to " + output + " in " + "%.1f" % stats["seconds"] +
+               "s")
+    return stats
+
+
+if __name__ == "__main__":
+    """writes a synthetic dump, the parameters are set in NECKAr.cfg (section Synthetic) and can be overridden"""
+
+    parser = argparse.ArgumentParser(description="synthetic Wikidata dump generator")
+    parser.add_argument("--config", default="../NECKAr.cfg", help="configuration file")
+    parser.add_argument("--entities", type=int, help="number of entities")
+    parser.add_argument("--seed", type=int, help="random seed")
+    parser.add_argument("--output", help="path of the dump (.json.bz2)")
+    parser.add_argument("--workers", type=int, help="number of processes")
+    parser.add_argument("--wide-subclasses", type=int, help="additional direct subclasses of organization")
+    args = parser.parse_args()
+
+    config = configparser.ConfigParser()
+    config.read(args.config)
+    profile = read_profile(config)
+    if args.entities is not None:
+        profile.entities = args.entities
+    if args.seed is not None:
+        profile.seed = args.seed
+    if args.wide_subclasses is not None:
+        profile.wide_subclasses = args.wide_subclasses
+    generate_dump(profile, args.output or config.get('Synthetic', 'output', fallback='../wikidata_dump/synthetic.json.bz2'),
+                  args.workers or config.getint('Synthetic', 'workers', fallback=0) or None,
+                  config.getint('Synthetic', 'chunk_size', fallback=100000),
+                  config.getint('Synthetic', 'compresslevel', fallback=9))
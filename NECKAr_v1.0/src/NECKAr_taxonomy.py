@@ -0,0 +1,192 @@
+#! /usr/bin/env python3
+# This Python file uses the following encoding: utf-8
+
+#############################################################################
+#  NECKAr: taxonomy                                                         #
+#    subclass trees (P279) of the classes NECKAr searches for. The trees    #
+#    are fetched once per root class and kept as json artifacts, e.g.       #
+#    ../taxonomy/sparql_Q43229.json, so reruns do not query Wikidata again  #
+#    sources:                                                               #
+#      sparql: Wikidata query service (get_wikidata_item_tree_item_idsSPARQL)#
+#      dump:   P279 claims of the items in the dump store (offline, e.g.    #
+#              for synthetic dumps, see NECKAr_synthetic)                   #
+#############################################################################
+
+import collections
+import configparser
+import hashlib
+import json
+import os
+import threading
+import typing
+from NECKAr_WikidataAPI import get_wikidata_item_tree_item_idsSPARQL
+
+# root classes of the subclass trees used by NECKAr_main
+ORGANIZATION = 43229
+EVENT = 1656682
+FACILITY = 13226383
+TIME = 11471
+TITLE = 214339
+GEOLOCATION = 2221906
+FOOD = 2095
+SETTLEMENT = 486972
+COUNTRY = 6256
+SOVEREIGN_STATE = 3624078
+CONSTITUENT_COUNTRY = 1763527
+SEA = 165
+STATE = 7275
+CITY = 515
+RIVER = 4022
+MOUNTAIN = 8502
+MOUNTAIN_RANGE = 1437459
+HGTE = 15642541
+
+LOCATION_ROOTS = [GEOLOCATION, FOOD, SETTLEMENT, COUNTRY, SOVEREIGN_STATE, CONSTITUENT_COUNTRY, SEA, STATE, CITY, RIVER,
+                  MOUNTAIN, MOUNTAIN_RANGE, HGTE]
+
+SOURCES = ["sparql", "dump"]
+
+
+def print_info(info):
+    print("INFO\tNECKAr:\t", info)
+
+
+class Taxonomy(object):
+    """Subclass trees of root classes, fetched from the source on first use and cached (in memory and, if a directory
+    is given, as json artifacts)
+
+    :param directory: directory of the artifacts <class 'string'> | None (no artifacts)
+    :param source: source of the trees, see SOURCES <class 'string'>
+    :param refresh: if True existing artifacts are ignored and overwritten <class 'bool'>
+    :param input_collection: store of the dump (source dump) | None
+    :param exclude: ids of classes removed from the trees (not their subclasses), e.g. classes whose instances are
+        false positives <class 'list'> | None
+    """
+
+    def __init__(self, directory: typing.Optional[str] = None, source: str = "sparql", refresh: bool = False,
+                 input_collection=None, exclude: typing.Optional[typing.Iterable[int]] = None):
+        if source not in SOURCES:
+            raise ValueError("unknown taxonomy source: " + str(source))
+        if source == "dump" and input_collection is None:
+            raise ValueError("taxonomy source dump needs the dump store")
+        self.directory = directory
+        self.source = source
+        self.refresh = refresh
+        self.input_collection = input_collection
+        self.exclude = set(exclude or ())
+        self.trees = {}
+        self._children = None
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def path(self, root: int) -> str:
+        return os.path.join(self.directory, self.source + "_Q" + str(root) + ".json")
+
+    def fetch(self, root: int) -> typing.List[int]:
+        """Gets the subclass tree of a root class from the source, without any caching"""
+        if self.source == "sparql":
+            return get_wikidata_item_tree_item_idsSPARQL([root], backward_properties=[279])
+        children = self.get_subclass_graph()
+        ids = [root]
+        seen = {root}
+        queue = collections.deque([root])
+        while queue:
+            for child in children.get(queue.popleft(), ()):
+                if child not in seen:
+                    seen.add(child)
+                    ids.append(child)
+                    queue.append(child)
+        return ids
+
+    def get_subclass_graph(self) -> typing.Dict[int, typing.List[int]]:
+        """Reads the P279 (subclass of) claims of all items of the dump store once
+
+        :return: dictionary class id -> ids of its direct subclasses <class 'dict'>
+        """
+        if self._children is None:
+            children = collections.defaultdict(list)
+            count = 0
+            for item in self.input_collection.scan(exists=["claims.P279"], projection={"id": 1, "claims.P279": 1},
+                                                   page_size=10000):
+                subclass = int(item["id"][1:])
+                for claim in item["claims"]["P279"]:
+                    if "datavalue" in claim["mainsnak"]:
+                        children[claim["mainsnak"]["datavalue"]["value"]["numeric-id"]].append(subclass)
+                count += 1
+            print_info("TAXONOMY " + str(count) + " classes with P279 claims read from the dump")
+            self._children = children
+        return self._children
+
+    def cached(self, root: int) -> bool:
+        """:return: True if the tree of the root class is in memory or (unless refresh) in an artifact"""
+        return root in self.trees or bool(self.directory and not self.refresh and os.path.exists(self.path(root)))
+
+    def add(self, root: int, ids: typing.List[int]) -> typing.List[int]:
+        """Caches the tree of a root class fetched from the source (in memory and as artifact); empty trees are not
+        cached, so the next run tries again
+
+        :return: ids <class 'list'>
+        """
+        if not ids:
+            # the query failed or the class is unknown
+            print_info("TAXONOMY Q" + str(root) + ": no subclasses found")
+            return ids
+        if self.directory:
+            with open(self.path(root) + ".tmp", "w", encoding="utf-8") as tree_file:
+                json.dump(ids, tree_file)
+            os.replace(self.path(root) + ".tmp", self.path(root))
+        self.trees[root] = ids
+        return ids
+
+    def subclasses(self, root: int) -> typing.List[int]:
+        """:return: ids of the root class and all its (transitive) subclasses without the excluded classes (list of
+            int)"""
+        ids = self.tree(root)
+        if not self.exclude:
+            return ids
+        return [class_id for class_id in ids if class_id == root or class_id not in self.exclude]
+
+    def tree(self, root: int) -> typing.List[int]:
+        """:return: ids of the root class and all its (transitive) subclasses, as fetched (list of int)"""
+        with self._lock:
+            if root in self.trees:
+                return self.trees[root]
+            if not self.cached(root):
+                return self.add(root, self.fetch(root))
+            with open(self.path(root), encoding="utf-8") as tree_file:
+                ids = json.load(tree_file)
+            self.trees[root] = ids
+            return ids
+
+    def fetch_all(self, roots: typing.Iterable[int]) -> str:
+        """Gets the subclass trees of all given root classes
+
+        :param roots: ids of the root classes
+        :return: sha256 digest of the trees <class 'string'>
+        """
+        digest = hashlib.sha256()
+        for root in sorted(set(roots)):
+            ids = self.subclasses(root)
+            print_info("TAXONOMY Q" + str(root) + ": " + str(len(ids)) + " classes")
+            digest.update(("Q" + str(root) + ":" + ",".join(map(str, sorted(ids))) + "\n").encode("utf-8"))
+        return digest.hexdigest()
+
+
+def from_config(config: configparser.ConfigParser, refresh: bool = False) -> Taxonomy:
+    """Creates the taxonomy of the configuration file NECKAr.cfg (section Taxonomy)
+
+    :param config: ConfigParser Object
+    :param refresh: if True existing artifacts are ignored and overwritten <class 'bool'>
+    :return: taxonomy <class 'Taxonomy'>
+    """
+    source = config.get('Taxonomy', 'source', fallback='sparql')
+    exclude = [int(class_id.strip().lstrip("Q")) for class_id in
+               config.get('Taxonomy', 'exclude', fallback='').split(",") if class_id.strip()]
+    input_collection = None
+    if source == "dump":
+        import NECKAr_storage as storage
+        input_collection = storage.from_config(config).store(config.get('Database', 'db_dump'),
+                                                             config.get('Database', 'collection_dump'))
+    return Taxonomy(config.get('Taxonomy', 'directory', fallback='../taxonomy') or None, source, refresh,
+                    input_collection, exclude)
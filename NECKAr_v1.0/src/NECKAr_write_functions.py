@@ -34,12 +34,15 @@ import typing
 ######################################################################################################
 # Common Entries
 ######################################################################################################
-def write_common_fields(item: typing.Dict[str, str]) -> typing.Dict[str, str]:
+def write_common_fields(item: typing.Dict[str, str], lod_ids: bool = False) -> typing.Dict[str, str]:
     """
     All entities have a set of common information: id, label, description, en_sitelink and de_sitelink.
     This function extracts that information from the dump and stores it in a dictionary.
+    Optionally the ids of the entity in other databases (see get_functions.LOD_properties) are added, so the LOD
+    lists can be created from the output without reading the dump again.
 
     :param item: entity object <class 'dict'>
+    :param lod_ids: if True the ids in other databases are added <class 'bool'>
     :return: entry: dictionary with information about the entry <class 'dict'>
     """
     entry={}
@@ -63,6 +66,9 @@ def write_common_fields(item: typing.Dict[str, str]) -> typing.Dict[str, str]:
     if delink:
         entry["de_sitelink"]=delink
 
+    if lod_ids:
+        entry.update(get_functions.get_LOD_ids(item))
+
     return entry
 
 
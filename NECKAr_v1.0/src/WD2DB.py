@@ -3,10 +3,15 @@
 from datetime import datetime
 import bz2
 import json
-import pymongo
-from pymongo import errors
 import configparser
-import sys
+import time
+import NECKAr_bulk as bulk
+import NECKAr_classindex as classindex
+import NECKAr_metrics as metrics
+import NECKAr_profiling as profiling
+import NECKAr_storage as storage
+from NECKAr_bulk import BulkWriter
+from NECKAr_metrics import METRICS
 
 '''
 TODO
@@ -31,46 +36,95 @@ ll
 
 
 
-###read configuration file
-config = configparser.ConfigParser()
-config.read('../NECKAr.cfg')
-host = config.get('Database', 'host') # -> "Python is fun!"
-port = config.getint('Database', 'port') # -> "%(bar)s is %(baz)s!"
-db = config.get('Database', 'db_dump')
-collection = config.get('Database', 'collection_dump')
-# json_file = config.get('Dump', 'json_file')
-archive_file = config.get('Dump', 'sample_archive_file_100')
-
-#connection to db
-print(datetime.now(), "NECKAR: WD2DB: connecting to MongoDB")
-try:
-    client = pymongo.MongoClient(host,port)
-except errors.ConnectionFailure:
-        print(datetime.now(), "Connection to the database cannot be made. Please check the config file")
-
-db = client[db]
-collection = db[collection]
-
-
-print(datetime.now(), "NECKAR: WD2DB: inserting WD items")
-# with open(json_file) as input_file:
-with bz2.open(archive_file, 'rt') as gf:
-     for i, line in enumerate(gf):
-         if len(line) > 2 and not line.startswith("["):
-             line = line.strip(",\n")
-         else:
-             continue
-
-         json_data = json.loads(line)
-         collection.insert_one(json_data)
-         if i % 10**4 == 0:
-             print(datetime.now(), i)
-
-print(datetime.now(), "NECKAR: WD2DB: creating indices")
-collection.create_index([('claims.P31.mainsnak.datavalue.value.numeric-id', pymongo.ASCENDING)])
-collection.create_index([('en_sitelink', pymongo.ASCENDING)])
-collection.create_index([('de_sitelink', pymongo.ASCENDING)])
-collection.create_index([('type', pymongo.ASCENDING)])
-collection.create_index([('id', pymongo.ASCENDING)])
-
-print(datetime.now(), "NECKAR: WD2DB: DONE")
\ No newline at end of file
+INDEX_FIELDS = [storage.P31_PATH, 'en_sitelink', 'de_sitelink', 'type', 'id']
+
+
+def iter_items(archive_file, report_every=1000):
+    """Streams the entities of a bz2 compressed Wikidata json dump (one entity per line), the read characters and
+    the json decoding time are added to the metrics every report_every entities"""
+    items = 0
+    size = 0
+    decode = 0.0
+    with bz2.open(archive_file, 'rt') as gf:
+        for line in gf:
+            if len(line) > 2 and not line.startswith("["):
+                start = time.perf_counter()
+                item = json.loads(line.strip(",\n"))
+                decode += time.perf_counter() - start
+                size += len(line)
+                items += 1
+                if items == report_every:
+                    METRICS.inc("dump_items_total", items)
+                    METRICS.inc("dump_chars_total", size)
+                    METRICS.inc("dump_decode_seconds_total", decode)
+                    items, size, decode = 0, 0, 0.0
+                yield item
+    METRICS.inc("dump_items_total", items)
+    METRICS.inc("dump_chars_total", size)
+    if items:
+        METRICS.inc("dump_decode_seconds_total", decode)
+
+
+def get_archive_file(config):
+    """:return: path of the dump archive that is loaded (section Dump of NECKAr.cfg)"""
+    # json_file = config.get('Dump', 'json_file')
+    return config.get('Dump', 'sample_archive_file_100')
+
+
+def import_dump(collection, archive_file, batch_size=1000, builder=None):
+    """Inserts all entities of the dump into the store with bulk writes (initial batch size batch_size, see
+    NECKAr_bulk.BulkWriter)
+
+    :param builder: collects the P31 values of the items for the class index <class 'NECKAr_classindex.IndexBuilder'>
+        | None
+    :return: number of inserted entities
+    """
+    writer = BulkWriter(collection, "WD2DB", batch_size)
+    for item in profiling.profile_items(iter_items(archive_file)):
+        if builder is not None:
+            builder.add(item)
+        writer.write(item)
+    return writer.close()
+
+
+def ingest(config, drop=False):
+    """Loads the dump of NECKAr.cfg into the dump store and creates the indices
+
+    :param config: ConfigParser Object
+    :param drop: if True the dump store is emptied first (reruns do not duplicate the items)
+    :return: number of inserted entities
+    """
+    archive_file = get_archive_file(config)
+    batch_size = config.getint('Dump', 'insert_batch_size', fallback=1000)
+
+    #connection to db
+    print(datetime.now(), "NECKAR: WD2DB: connecting to the " + config.get('Database', 'backend', fallback='mongo') +
+          " storage")
+    db = storage.from_config(config)
+    if drop:
+        db.drop(config.get('Database', 'db_dump'), config.get('Database', 'collection_dump'))
+    collection = db.store(config.get('Database', 'db_dump'), config.get('Database', 'collection_dump'))
+
+    print(datetime.now(), "NECKAR: WD2DB: inserting WD items")
+    builder = classindex.IndexBuilder() if classindex.read_class_index_options(config)["enabled"] else None
+    count = import_dump(collection, archive_file, batch_size, builder)
+    print(datetime.now(), "NECKAR: WD2DB:", count, "items inserted")
+    if builder is not None:
+        print(datetime.now(), "NECKAR: WD2DB: writing the class index")
+        classindex.ClassIndex(classindex.index_store(config)).write(builder)
+
+    print(datetime.now(), "NECKAR: WD2DB: creating indices")
+    for field in INDEX_FIELDS:
+        collection.ensure_index([field])
+    return count
+
+
+if __name__ == "__main__":
+    ###read configuration file
+    config = configparser.ConfigParser()
+    config.read('../NECKAr.cfg')
+    metrics.start(config)
+    profiling.start(config)
+    bulk.configure(config)
+    ingest(config)
+    print(datetime.now(), "NECKAR: WD2DB: DONE")
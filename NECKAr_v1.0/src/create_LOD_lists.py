@@ -24,43 +24,37 @@ __author__ = 'jgeiss'
 #############################################################################
 # last updated 21.3.2017 by Johanna Geiß
 
-from pymongo import *
-from pymongo import errors
 import configparser
+import sys
+from concurrent.futures import ThreadPoolExecutor
+import time
+import typing
+import NECKAr_get_functions as get_functions
+import NECKAr_bulk as bulk
+import NECKAr_metrics as metrics
+import NECKAr_profiling as profiling
+import NECKAr_storage as storage
+from NECKAr_bulk import BulkWriter
+from NECKAr_metrics import METRICS
 
 def read_config(config):
     """Reads the configuration file NECKAr.cfg
 
     :param config: ConfigParser Object
-    :return: input collection, list of output collections  and the dump collection
+    :return: input store, dictionary language -> output store and the dump store
     """
-    host = config.get('Database', 'host')
-    port=config.getint('Database','port')
-
-    auth = config.getboolean('Database','auth')
-    user=config.get('Database','user')
-    password=config.get('Database','password')
-
-    try:
-        client=MongoClient(host,port)
-    except errors.ConnectionFailure:
-        print("Connection to the database cannot be made. Plase check the config file")
-
+    db = storage.from_config(config)
 
     db_read_name=config.get('Database','db_write') # where info was writtenn to in the first step
-    db_in=client[db_read_name]               #Database from where information is extracted
-    db_all_name=config.get('Database','db_dump') # where info was writtenn to in the first step
-    db_all=client[db_all_name]
+    db_all_name=config.get('Database','db_dump')
 
-    input_collection_name=config.get('Database','collection_write')
-    input_collection=db_in[input_collection_name]
-    all_collection_name = config.get('Database','collection_dump')
-    all_collection=db_all[all_collection_name]
+    input_collection=db.store(db_read_name, config.get('Database','collection_write'), authenticate=True)
+    all_collection=db.store(db_all_name, config.get('Database','collection_dump'))
 
     languages = config.items( "LODLinks" )
     output_coll_list={}
     for lang, coll_name in languages:
-        output_coll_list[lang]=db_in[coll_name]
+        output_coll_list[lang]=db.store(db_read_name, coll_name, key="WD_id", authenticate=True)
     print("Config File read in")
 
 
@@ -68,61 +62,79 @@ def read_config(config):
 
 
 
+def print_info(info):
+    print("INFO\tNECKAr LOD:\t", info)
+
+
+def read_LOD_options(config):
+    """Reads the options of create_LODlist (section LOD) of the configuration file NECKAr.cfg
+
+    :param config: ConfigParser Object
+    :return: keyword arguments for create_LODlist <class 'dict'>
+    """
+    return {"lookup_mode": config.get('LOD', 'lookup_mode', fallback='batch'),
+            "batch_size": config.getint('LOD', 'batch_size', fallback=1000),
+            "write_mode": config.get('LOD', 'write_mode', fallback='insert'),
+            "write_batch_size": config.getint('LOD', 'write_batch_size', fallback=1000)}
+
+
 def get_linksfromWikidata(WD_id, entry,collection):
     """ get links to other Databases from dumo
 
     :param WD_id: Wikidata id of enity <class 'string'>
     :param entry: entity object <class 'dict'>
-    :param collection: collection to search in
+    :param collection: store to search in
     :return: entry <class 'dict'>
     """
-    entry_org = collection.find_one({"id":WD_id})
+    entry_org = collection.get(WD_id, get_LOD_projection())
     if entry_org:
-        if "P345" in entry_org["claims"]:
-            mainsnak=entry_org["claims"]["P345"][0]["mainsnak"]
-            if mainsnak["snaktype"] == "value":
-                entry["IMDB_id"] = mainsnak["datavalue"]["value"]
-            else:
-                print(entry["WD_id"], "P345 value missing")
-        if "P434" in entry_org["claims"]:
-            mainsnak=entry_org["claims"]["P434"][0]["mainsnak"]
-            if mainsnak["snaktype"] == "value":
-                entry["MusicBrainzArtist_id"] = mainsnak["datavalue"]["value"]
-            else:
-                print(entry["WD_id"], "P434 value missing")
-        if "P227" in entry_org["claims"]:
-            mainsnak=entry_org["claims"]["P227"][0]["mainsnak"]
-            if mainsnak["snaktype"] == "value":
-                entry["GND_id"] = mainsnak["datavalue"]["value"]
-            else:
-                print( entry["WD_id"], "P227 value missing")
-        if "P1566" in entry_org["claims"]:
-            mainsnak=entry_org["claims"]["P1566"][0]["mainsnak"]
-            if mainsnak["snaktype"] == "value":
-                entry["geonames_id"]= mainsnak["datavalue"]["value"]
-            else:
-                print(entry["WD_id"], "P1566 value missing")
-        if "P402" in entry_org["claims"]:
-            mainsnak=entry_org["claims"]["P402"][0]["mainsnak"]
-            if mainsnak["snaktype"] == "value":
-                entry["OSM_id"] = mainsnak["datavalue"]["value"]
-            else:
-                print(entry["WD_id"], "P402 value missing")
+        entry.update(get_functions.get_LOD_ids(entry_org))
     return entry
 
-def create_LODdictionary(entry,myclient,lang="en",):
+
+def get_LOD_projection(prefix: str = "") -> typing.Dict[str, int]:
+    """ projection that only returns the id and the claims needed for the links to other databases
+
+    :param prefix: prefix of the fields, e.g. 'wikidata.' if the dump entity is embedded <class 'string'>
+    :return: projection <class 'dict'>
+    """
+    projection = {prefix + "id": 1}
+    if not prefix:
+        projection["_id"] = 0
+    for prop, field in get_functions.LOD_properties:
+        projection[prefix + "claims." + prop] = 1
+    return projection
+
+
+def get_linksfromWikidata_batch(WD_ids: typing.List[str], collection) -> typing.Dict[str, typing.Dict[str, str]]:
+    """ get links to other Databases from dump for a chunk of entities with a single projected $in query
+
+    :param WD_ids: Wikidata ids of the entities <class 'list'>
+    :param collection: store to search in
+    :return: dictionary Wikidata id -> links <class 'dict'>
+    """
+    return {WD_id: get_functions.get_LOD_ids(entry_org)
+            for WD_id, entry_org in collection.get_many(WD_ids, get_LOD_projection()).items()}
+
+
+def create_LODdictionary(entry,myclient,lang="en",links=None):
     """ creates url to Wikidata, Wikipedia and dbpedia (the last depends on langauge) and gets links to LOD
-    calls function 'get_linksfromWikidata'
+    calls function 'get_linksfromWikidata' if the links are not given
 
 
     :param entry: entity object <class 'dict'>
     :param myclient: connection to db
     :param lang: language <class 'string'>
+    :param links: links to other databases already fetched for this entity (see get_linksfromWikidata_batch)
+        <class 'dict'> | None
     :return: nothing but adds information to entry
     """
     entry["WD_id_URL"] = "http://www.wikidata.org/wiki/"+entry["WD_id"]
     entry["WP_id_URL"] = "http://"+lang+".wikipedia.org/wiki/"+entry["WP_id"].replace(" ","_")
-    entry = get_linksfromWikidata(entry["WD_id"], entry, myclient)
+    if links is None:
+        entry = get_linksfromWikidata(entry["WD_id"], entry, myclient)
+    else:
+        entry.update(links)
     if lang == "en":
         entry["dbpedia_URL"] = "http://dbpedia.org/resource/"+entry["WP_id"].replace(" ","_")
     else:
@@ -131,37 +143,206 @@ def create_LODdictionary(entry,myclient,lang="en",):
         entry["dbpedia_URL"] = "http://"+lang+".dbpedia.org/resource/"+entry["WP_id"].replace(" ","_")
 
 
-if __name__ == "__main__":
-    """NECKAr: Named Entity Classifier for Wikidata
+def create_entry(entity, lang):
+    """ creates the LOD entry of a classified entity (without the links)
 
-    this tool categorizes Wikidata items into 6 categories
-    the parameters are set in NECKAr.cfg """
+    :param entity: entity of the NECKAr output <class 'dict'>
+    :param lang: language <class 'string'>
+    :return: entry <class 'dict'>
+    """
+    entry={}
+    entry["label"] = entity["norm_name"]
+    entry["neClass"] = entity["neClass"]
+    entry["WD_id"] = entity["id"]
+    entry["WP_id"] = entity[lang+"_sitelink"]
+
+    if lang!= "en" and "en_sitelink" in entity:
+        entry["WP_id_en_URL"] = "http://en.wikipedia.org/wiki/"+entity["en_sitelink"].replace(" ","_")
+    return entry
 
-    config = configparser.ConfigParser()
-    config.read('../NECKAr.cfg')
 
-    input_collection, output_list, all_coll = read_config(config)
-    print(type(output_list))
+def ensure_LODindex(input_collection, lang="en"):
+    """ creates the index used to stream the entities with a sitelink in the given language ordered by _id
+        (partial index, only entities with the sitelink are indexed)
 
-    for lang, output_coll in output_list.items():
-        #print(lang)
-        #print(output_coll)
-        for entity in input_collection.find({lang+"_sitelink":{"$exists":True}}).sort("id",1):
-            entry={}
-            entry["label"] = entity["norm_name"]
-            entry["neClass"] = entity["neClass"]
-            entry["WD_id"] = entity["id"]
-            entry["WP_id"] = entity[lang+"_sitelink"]
+    :param input_collection: store with the classified entities
+    :param lang: language <class 'string'>
+    """
+    input_collection.ensure_index(["_id", lang+"_sitelink"], partial_exists=lang+"_sitelink",
+                                  name="LOD_"+lang+"_sitelink")
 
-            if lang!= "en" and "en_sitelink" in entity:
-                entry["WP_id_en_URL"] = "http://en.wikipedia.org/wiki/"+entity["en_sitelink"].replace(" ","_")
 
-            create_LODdictionary(entry, all_coll, lang)
+def iter_LODpages(input_collection, lang="en", projection=None, page_size=1000, limit=0, lookup=None):
+    """ streams the entities with a sitelink in the given language in pages ordered by _id
+        (keyset pagination: each page is a short query starting after the last _id of the previous page, so no
+        large in-memory sort is needed)
+
+    :param input_collection: store with the classified entities
+    :param lang: language <class 'string'>
+    :param projection: projection <class 'dict'> | None
+    :param page_size: number of entities per page <class 'int'>
+    :param limit: maximum number of entities (0: all) <class 'int'>
+    :param lookup: store of the Wikidata dump joined in as field 'wikidata' (see MongoStore.lookup_pages)
+        <class 'MongoStore'> | None
+    :return: generator of lists of entities
+    """
+    if lookup is None:
+        return input_collection.scan_pages(exists=[lang+"_sitelink"], projection=projection, page_size=page_size,
+                                           limit=limit)
+    return input_collection.lookup_pages(lookup, "wikidata", exists=[lang+"_sitelink"], projection=projection,
+                                         page_size=page_size, limit=limit)
+
+
+def iter_LODentries(input_collection, all_collection, lang="en", lookup_mode="batch", batch_size=1000, limit=0):
+    """ generates the LOD entries of all classified entities with a sitelink in the given language
+
+    lookup modes for the links to other databases:
+        single: one find_one on the dump per entity
+        batch: one projected $in query on the dump per chunk of batch_size entities
+        lookup: aggregation with $lookup join of the dump (MongoDB only, both collections have to be in the same
+            database)
+        output: the links were already captured by NECKAr_main (write_common_fields with lod_ids), the dump is not
+            read at all
+
+    :param input_collection: store with the classified entities
+    :param all_collection: store of the Wikidata dump
+    :param lang: language <class 'string'>
+    :param lookup_mode: 'single', 'batch', 'lookup' or 'output' <class 'string'>
+    :param batch_size: number of entities read (and looked up with one query in mode batch) per page <class 'int'>
+    :param limit: maximum number of entities (0: all) <class 'int'>
+    :return: generator of entries <class 'dict'>
+    """
+    projection = {"norm_name": 1, "neClass": 1, "id": 1, lang+"_sitelink": 1, "en_sitelink": 1}
+    if lookup_mode == "lookup":
+        projection.update(get_LOD_projection("wikidata."))
+        for page in iter_LODpages(input_collection, lang, projection, batch_size, limit, all_collection):
+            for entity in page:
+                entry = create_entry(entity, lang)
+                links = get_functions.get_LOD_ids(entity["wikidata"][0]) if entity["wikidata"] else {}
+                create_LODdictionary(entry, all_collection, lang, links)
+                yield entry
+        return
+
+    if lookup_mode == "output":
+        for prop, field in get_functions.LOD_properties:
+            projection[field] = 1
+    for page in iter_LODpages(input_collection, lang, projection, batch_size, limit):
+        if lookup_mode == "output":
+            for entity in page:
+                entry = create_entry(entity, lang)
+                links = {field: entity[field] for prop, field in get_functions.LOD_properties if field in entity}
+                create_LODdictionary(entry, all_collection, lang, links)
+                yield entry
+        elif lookup_mode == "single":
+            for entity in page:
+                entry = create_entry(entity, lang)
+                create_LODdictionary(entry, all_collection, lang)
+                yield entry
+        else:
+            yield from complete_batch([create_entry(entity, lang) for entity in page], all_collection, lang)
+
+
+def create_LODlist(input_collection, output_coll, all_collection, lang="en", lookup_mode="batch", batch_size=1000,
+                   write_mode="insert", write_batch_size=1000):
+    """ creates the LOD list of one language
+
+    :param input_collection: store with the classified entities
+    :param output_coll: LOD store of the language
+    :param all_collection: store of the Wikidata dump
+    :param lang: language <class 'string'>
+    :param lookup_mode: 'single', 'batch', 'lookup' or 'output' (see iter_LODentries) <class 'string'>
+    :param batch_size: number of entities read per page <class 'int'>
+    :param write_mode: 'insert' or 'replace' (see NECKAr_bulk.BulkWriter) <class 'string'>
+    :param write_batch_size: number of entries written with one bulk request <class 'int'>
+    :return: statistics (entities, seconds, entities per second) <class 'dict'>
+    """
+    start = time.perf_counter()
+    ensure_LODindex(input_collection, lang)
+    writer = BulkWriter(output_coll, lang, write_batch_size, write_mode)
+    writer.prepare()
+    for entry in profiling.profile_items(iter_LODentries(input_collection, all_collection, lang, lookup_mode,
+                                                         batch_size), lang):
+        writer.write(entry)
+    count = writer.close()
+    duration = time.perf_counter() - start
+    stats = {"entities": count, "seconds": duration, "rate": count / duration if duration > 0 else 0.0}
+    print_info(lang + " " + str(count) + " entities written in " + "%.2f" % duration + "s (" + "%.1f" % stats["rate"] +
+               " entities/s, lookup mode " + lookup_mode + ")")
+    sys.stdout.flush()
+    return stats
+
+
+def complete_batch(batch, all_collection, lang):
+    """ adds the links to a chunk of LOD entries (see get_linksfromWikidata_batch)
+
+    :param batch: list of entries <class 'list'>
+    :param all_collection: store of the Wikidata dump
+    :param lang: language <class 'string'>
+    :return: the completed entries <class 'list'>
+    """
+    with METRICS.timer("lod_lookup_seconds", lang=lang):
+        links = get_linksfromWikidata_batch([entry["WD_id"] for entry in batch], all_collection)
+    for entry in batch:
+        create_LODdictionary(entry, all_collection, lang, links.get(entry["WD_id"], {}))
+    return batch
+
 
-            output_coll.insert_one(entry)
+def benchmark_lookup_modes(input_collection, all_collection, lang="en", batch_size=1000, sample_size=10000):
+    """ measures the throughput of the lookup modes on the first sample_size entities, nothing is written
+        (mode output only yields links if they were captured by NECKAr_main)
 
+    :param input_collection: store with the classified entities
+    :param all_collection: store of the Wikidata dump
+    :param lang: language <class 'string'>
+    :param batch_size: number of entities looked up with one query (mode batch) <class 'int'>
+    :param sample_size: number of entities <class 'int'>
+    :return: dictionary mode -> entities per second <class 'dict'>
+    """
+    rates = {}
+    for mode in ["single", "batch", "lookup", "output"]:
+        start = time.perf_counter()
+        try:
+            count = sum(1 for _ in iter_LODentries(input_collection, all_collection, lang, mode, batch_size,
+                                                   sample_size))
+        except ValueError as e:
+            print_info("BENCHMARK " + mode + " skipped: " + str(e))
+            continue
+        duration = time.perf_counter() - start
+        rates[mode] = count / duration if duration > 0 else 0.0
+        print_info("BENCHMARK " + lang + " " + mode + ": " + str(count) + " entities in " +
+                   "%.2f" % duration + "s (" + "%.1f" % rates[mode] + " entities/s)")
+    if rates.get("single"):
+        for mode, rate in rates.items():
+            print_info("BENCHMARK " + lang + " " + mode + " speedup: " + "%.1f" % (rate / rates["single"]) + "x")
+    sys.stdout.flush()
+    return rates
 
 
+if __name__ == "__main__":
+    """NECKAr: Named Entity Classifier for Wikidata
 
+    this tool categorizes Wikidata items into 6 categories
+    the parameters are set in NECKAr.cfg """
 
+    config = configparser.ConfigParser()
+    config.read('../NECKAr.cfg')
+    metrics.start(config)
+    profiling.start(config)
+    bulk.configure(config)
 
+    input_collection, output_list, all_coll = read_config(config)
+    options = read_LOD_options(config)
+
+    if config.getboolean('LOD', 'benchmark', fallback=False):
+        for lang in output_list:
+            benchmark_lookup_modes(input_collection, all_coll, lang, options["batch_size"],
+                                   config.getint('LOD', 'benchmark_sample_size', fallback=10000))
+
+    workers = config.getint('LOD', 'workers', fallback=len(output_list)) or 1
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {lang: executor.submit(create_LODlist, input_collection, output_coll, all_coll, lang, **options)
+                   for lang, output_coll in output_list.items()}
+        for lang, future in futures.items():
+            stats = future.result()
+            print_info("STATS " + lang + ": " + str(stats["entities"]) + " entities, " + "%.2f" % stats["seconds"] +
+                       "s, " + "%.1f" % stats["rate"] + " entities/s")
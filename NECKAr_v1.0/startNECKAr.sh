@@ -1,11 +1,5 @@
 #!/usr/bin/env bash
 cd src/
-echo NECKAR loading dump to MongoDB
-python3 WD2DB.py
-echo -----------------------------
-echo NECKAR extracting NEs from dump
-python3 NECKAr_main.py
-echo -----------------------------
-echo NECKAR extracting links to LOD
-python3 create_LOD_lists.py
-echo NECKAR: DONE
\ No newline at end of file
+echo NECKAR running all stages: ingest, taxonomy, classification, LOD
+python3 NECKAr_runner.py "$@"
+echo NECKAR: DONE
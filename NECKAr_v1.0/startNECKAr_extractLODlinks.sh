@@ -1,5 +1,5 @@
 #!/usr/bin/env bash
 cd src/
 echo NECKAR extracting links to LOD
-python3 create_LOD_lists.py
-echo NECKAR link extraction: DONE
\ No newline at end of file
+python3 NECKAr_runner.py --only lod "$@"
+echo NECKAR link extraction: DONE
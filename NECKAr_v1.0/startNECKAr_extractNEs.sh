@@ -1,5 +1,5 @@
 #!/usr/bin/env bash
 cd src/
 echo NECKAR: extracting NEs from dump
-python3 NECKAr_main.py
-echo NECKAR NE extraction: DONE
\ No newline at end of file
+python3 NECKAr_runner.py --only taxonomy classify finish "$@"
+echo NECKAR NE extraction: DONE
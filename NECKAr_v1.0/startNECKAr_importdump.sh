@@ -1,5 +1,5 @@
 #!/usr/bin/env bash
 cd src/
-echo NECKAR loading dump to MongoDB
-python3 WD2DB.py
-echo NECKAR: loading dump: DONE
\ No newline at end of file
+echo NECKAR loading dump to the database
+python3 NECKAr_runner.py --only ingest "$@"
+echo NECKAR: loading dump: DONE
@@ -0,0 +1,129 @@
+#! /usr/bin/env python3
+# This Python file uses the following encoding: utf-8
+
+#############################################################################
+#  NECKAr: tests of the bulk writer on the store facade of the asyncio     #
+#  driver mode (NECKAr_async.BlockingStore)                                 #
+#    python3 -m pytest tests                                                #
+#############################################################################
+
+import asyncio
+import configparser
+import os
+import sys
+import threading
+import unittest
+from pymongo import errors
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import NECKAr_bulk as bulk
+from NECKAr_async import BlockingStore
+
+
+class FlakyStore(object):
+    """Async store writing to a dictionary: the first write calls fail with AutoReconnect, a batch with a poison
+    entry is rejected"""
+
+    def __init__(self, failures: int = 0, poison=()):
+        self.key = "id"
+        self.name = "test"
+        self.database_name = "test"
+        self.failures = failures
+        self.poison = set(poison)
+        self.calls = 0
+        self.entries = {}
+
+    async def insert_many(self, docs):
+        self.calls += 1
+        await asyncio.sleep(0)
+        if self.calls <= self.failures:
+            raise errors.AutoReconnect("connection reset")
+        if any(doc["id"] in self.poison for doc in docs):
+            raise ValueError("poison entry")
+        for doc in docs:
+            self.entries[doc["id"]] = doc
+
+    async def replace_many(self, docs):
+        await self.insert_many(docs)
+
+
+class ListStore(object):
+    """Quarantine store"""
+
+    def __init__(self):
+        self.key = "id"
+        self.entries = []
+
+    def insert_many(self, docs):
+        self.entries.extend(docs)
+
+
+class BlockingStoreBulkTest(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    def write(self, store, count: int, **options) -> bulk.BulkWriter:
+        writer = bulk.BulkWriter(BlockingStore(store, self.loop, write_concurrency=2), "TEST", 10, backoff=0.001,
+                                 adaptive=False, **options)
+        for i in range(count):
+            writer.write({"id": "Q" + str(i)})
+        writer.close()
+        return writer
+
+    def test_transient_error_is_retried(self):
+        store = FlakyStore(failures=1)
+        writer = self.write(store, 35)
+        self.assertEqual(writer.written, 35)
+        self.assertEqual(len(store.entries), 35)
+        self.assertEqual(store.calls, 5)
+
+    def test_transient_error_after_retries_is_raised(self):
+        store = FlakyStore(failures=100)
+        with self.assertRaises(errors.AutoReconnect):
+            self.write(store, 5, retries=2)
+        self.assertEqual(store.calls, 3)
+
+    def test_poison_entry_is_quarantined(self):
+        store = FlakyStore(poison=["Q13"])
+        quarantine = ListStore()
+        writer = self.write(store, 35, quarantine=quarantine)
+        self.assertEqual(writer.written, 34)
+        self.assertEqual(writer.quarantined, 1)
+        self.assertEqual(sorted(store.entries), sorted("Q" + str(i) for i in range(35) if i != 13))
+        self.assertEqual([entry["id"] for entry in quarantine.entries], ["Q13"])
+
+    def test_poison_entry_without_quarantine_is_raised(self):
+        store = FlakyStore(poison=["Q13"])
+        with self.assertRaises(ValueError):
+            self.write(store, 35)
+        # writes of later batches are not refused because of an earlier error
+        store.poison = set()
+        self.assertEqual(self.write(store, 5).written, 5)
+
+    def test_no_quarantine_by_default(self):
+        config = configparser.ConfigParser()
+        config.read(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "NECKAr.cfg"))
+        try:
+            self.assertIsNone(bulk.configure(config).get("quarantine"))
+            with self.assertRaises(ValueError):
+                self.write(FlakyStore(poison=["Q13"]), 35)
+        finally:
+            bulk._OPTIONS = {}
+
+    def test_concurrency_of_the_store(self):
+        writer = bulk.BulkWriter(BlockingStore(FlakyStore(), self.loop, write_concurrency=3), "TEST")
+        self.assertEqual(writer.concurrency, 3)
+        writer.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
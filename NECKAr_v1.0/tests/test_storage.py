@@ -0,0 +1,165 @@
+#! /usr/bin/env python3
+# This Python file uses the following encoding: utf-8
+
+#############################################################################
+#  NECKAr: tests of the store contract (NECKAr_storage) on the embedded     #
+#  SQLite backend, and of the id range split of the MongoDB selections      #
+#    python3 -m pytest tests                                                #
+#############################################################################
+
+import configparser
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import NECKAr_storage as storage
+
+
+def item(q_id: int, classes, **fields) -> dict:
+    """Wikidata-like item that is an instance (P31) of the given classes"""
+    claims = [{"mainsnak": {"snaktype": "value", "datavalue": {"value": {"numeric-id": class_id}}}}
+              for class_id in classes]
+    return dict({"id": "Q" + str(q_id), "type": "item", "claims": {"P31": claims}}, **fields)
+
+
+class SQLiteStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.storage = storage.SQLiteStorage(self.directory.name)
+        self.store = self.storage.store("test_db", "items")
+        self.store.insert_many([item(1, [5]), item(2, [5, 7]), item(3, [7], label="c"), item(4, [9]),
+                                {"id": "P31", "type": "property", "claims": {}}])
+
+    def tearDown(self):
+        for connection in self.storage._local.__dict__.get("connections", {}).values():
+            connection.close()
+        self.directory.cleanup()
+
+    def ids(self, docs):
+        return [doc["id"] for doc in docs]
+
+    def test_get(self):
+        self.assertEqual(self.store.get("Q3")["label"], "c")
+        self.assertEqual(self.store.get("Q3", {"label": 1}), {"label": "c"})
+        self.assertIsNone(self.store.get("Q99"))
+
+    def test_get_many_keeps_the_key(self):
+        docs = self.store.get_many(["Q1", "Q3", "Q99"], {"label": 1})
+        self.assertEqual(sorted(docs), ["Q1", "Q3"])
+        self.assertEqual(docs["Q3"], {"id": "Q3", "label": "c"})
+
+    def test_scan_pages(self):
+        pages = list(self.store.scan_pages(page_size=2))
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        self.assertEqual(self.ids(self.store.scan(where={"type": "item"}, exists=["label"])), ["Q3"])
+        self.assertEqual(self.ids(self.store.scan(limit=3, page_size=2)), ["Q1", "Q2", "Q3"])
+
+    def test_find_instances_returns_each_item_once(self):
+        self.assertEqual(self.ids(self.store.find_instances([5, 7])), ["Q1", "Q2", "Q3"])
+        # a selection split into ranges of one class, the root and related sets are only used by other stores
+        self.assertEqual(self.ids(self.store.find_instances([7, 5, 9], chunk_size=1, class_root=5,
+                                                            related={9: [9]})), ["Q1", "Q2", "Q3", "Q4"])
+        self.assertEqual(list(self.store.find_instances([7], {"label": 1})), [{}, {"label": "c"}])
+        self.assertEqual(list(self.store.find_instances([31])), [])
+
+    def test_replace_many_replaces_the_classes(self):
+        self.store.replace_many([item(1, [7]), item(5, [5])])
+        self.assertEqual(self.store.count(), 6)
+        self.assertEqual(self.ids(self.store.find_instances([5])), ["Q2", "Q5"])
+        self.assertEqual(self.ids(self.store.find_instances([7])), ["Q2", "Q3", "Q1"])
+
+    def test_update_many(self):
+        self.store.update_many({"Q1": {"label": "a"}, "Q99": {"label": "x"}})
+        self.assertEqual(self.store.get("Q1")["label"], "a")
+        self.assertEqual(self.store.count(), 5)
+
+    def test_delete(self):
+        self.assertEqual(self.store.delete({"type": "property"}), 1)
+        self.assertEqual(self.store.count(), 4)
+        self.assertEqual(self.store.delete(), 4)
+        self.assertEqual(list(self.store.find_instances([5, 7, 9])), [])
+
+    def test_delete_many_with_conditions(self):
+        output = self.storage.store("test_db", "output")
+        output.insert_many([{"id": "Q" + str(i), "neClass": "PER" if i % 2 else "LOC"} for i in range(1200)])
+        # more values than one IN query takes
+        deleted = output.delete_many(["Q" + str(i) for i in range(1100)], {"neClass": "PER"})
+        self.assertEqual(deleted, 550)
+        self.assertEqual(output.count({"neClass": "PER"}), 50)
+        self.assertEqual(output.count({"neClass": "LOC"}), 600)
+
+    def test_delete_many_removes_the_instances(self):
+        self.assertEqual(self.store.delete_many(["Q2", "Q99"]), 1)
+        self.assertEqual(self.ids(self.store.find_instances([5, 7])), ["Q1", "Q3"])
+
+    def test_count(self):
+        self.assertEqual(self.store.count(), 5)
+        self.assertEqual(self.store.count({"type": "item"}), 4)
+        self.assertEqual(self.store.count({"id": "Q2"}), 1)
+
+    def test_lookup_pages_needs_mongo(self):
+        with self.assertRaises(ValueError):
+            next(self.store.lookup_pages(self.storage.store("test_db", "other"), "links"))
+
+    def test_ensure_index(self):
+        self.store.ensure_index(["label"], partial_exists="label", name="label")
+        self.store.ensure_index(["label"], partial_exists="label", name="label")
+        self.store.ensure_index(["_id"])
+        indexes = [row[0] for row in self.storage.connection("test_db").execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'items'")]
+        self.assertIn("items__label", indexes)
+        self.assertEqual(self.ids(self.store.scan(exists=["label"])), ["Q3"])
+
+    def test_drop(self):
+        self.storage.drop("test_db", "items")
+        self.assertEqual(self.storage.store("test_db", "items").count(), 0)
+
+
+class RangeSplitTest(unittest.TestCase):
+
+    def test_partition_class_ids(self):
+        self.assertEqual(storage.partition_class_ids([9, 1, 5, 5, 3], 2), [[1, 3], [5, 9]])
+        self.assertEqual(storage.partition_class_ids([], 2), [])
+
+    def test_each_item_in_the_range_of_its_first_selected_class(self):
+        items = [item(1, [1, 9]), item(2, [9, 5]), item(3, [4, 5, 3])]
+        selected = {1, 3, 5, 9}
+        returned = []
+        for ids in storage.partition_class_ids(selected, 2):
+            returned += [doc["id"] for doc in items
+                         if set(storage.get_instance_of_ids(doc)) & set(ids) and
+                         storage.first_selected(doc, selected) >= ids[0]]
+        self.assertEqual(sorted(returned), ["Q1", "Q2", "Q3"])
+
+    def test_instance_projection_keeps_the_classes(self):
+        self.assertEqual(storage.instance_projection({"labels": 1}), {"labels": 1, storage.P31_PATH: 1})
+        self.assertEqual(storage.instance_projection({"_id": 0}), {"_id": 0})
+        self.assertIsNone(storage.instance_projection(None))
+
+
+class CredentialsTest(unittest.TestCase):
+
+    def config(self, **options) -> configparser.ConfigParser:
+        config = configparser.ConfigParser()
+        config.read_dict({"Database": dict({"db_write": "write_db", "auth": "True", "user": "neckar",
+                                            "password": "secret"}, **options)})
+        return config
+
+    def test_no_credentials_without_auth(self):
+        self.assertEqual(storage.read_credentials(self.config(auth="False")), {})
+
+    def test_user_of_the_write_database(self):
+        self.assertEqual(storage.read_credentials(self.config()),
+                         {"username": "neckar", "password": "secret", "authSource": "write_db"})
+        self.assertEqual(storage.read_credentials(self.config(auth_source=""))["authSource"], "write_db")
+
+    def test_auth_source(self):
+        self.assertEqual(storage.read_credentials(self.config(auth_source="admin"))["authSource"], "admin")
+
+
+if __name__ == "__main__":
+    unittest.main()
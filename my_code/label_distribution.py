@@ -0,0 +1,122 @@
+"""
+Streams one or more NECKAr JSONL outputs and prints the distribution of neClass, location_type and gender, plus the
+overlap with a given set of Q-ids. Each input file is processed by its own worker process, the per-file counters are
+merged afterwards. Memory only depends on the number of distinct values (and the size of the Q-id set).
+
+Example:
+    python label_distribution.py WikidataNE_20170320_NECKAR_1_0.json --q-ids our_q_ids_to_labels.json
+"""
+from datetime import datetime
+from pathlib import Path
+import argparse
+import bz2
+import gzip
+import json
+import lzma
+import sys
+import typing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+
+class Distribution:
+    def __init__(self):
+        self.records = 0
+        self.ne_class = Counter()
+        self.location_type = Counter()
+        self.gender = Counter()
+        self.overlap_ne_class = Counter()
+        self.overlap_q_ids = set()
+
+    def add(self, item: typing.Dict[str, object], q_ids: typing.Optional[typing.Set[str]] = None):
+        self.records += 1
+        self.ne_class[item.get("neClass")] += 1
+        for location_type in item.get("location_type", []):
+            self.location_type[location_type] += 1
+        if "gender" in item:
+            self.gender[item["gender"]] += 1
+        if q_ids is not None and item["id"] in q_ids:
+            self.overlap_ne_class[item.get("neClass")] += 1
+            self.overlap_q_ids.add(item["id"])
+
+    def merge(self, other: "Distribution") -> "Distribution":
+        self.records += other.records
+        self.ne_class += other.ne_class
+        self.location_type += other.location_type
+        self.gender += other.gender
+        self.overlap_ne_class += other.overlap_ne_class
+        self.overlap_q_ids |= other.overlap_q_ids
+        return self
+
+
+def open_jsonl(path: Path) -> typing.TextIO:
+    """Opens a (optionally gzip, bz2 or xz compressed) JSONL file for reading"""
+    openers = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}
+    return openers.get(Path(path).suffix, open)(path, 'rt', encoding="utf8")
+
+
+def count_file(path: Path, q_ids: typing.Optional[typing.Set[str]] = None) -> Distribution:
+    distribution = Distribution()
+    with open_jsonl(path) as file:
+        for line in file:
+            if line.strip():
+                distribution.add(json.loads(line), q_ids)
+    return distribution
+
+
+def count_files(paths: typing.List[Path], q_ids: typing.Optional[typing.Set[str]] = None,
+                workers: typing.Optional[int] = None) -> Distribution:
+    distribution = Distribution()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for file_distribution in executor.map(count_file, paths, [q_ids] * len(paths)):
+            distribution.merge(file_distribution)
+    return distribution
+
+
+def read_q_ids(path: Path) -> typing.Set[str]:
+    """Reads a Q-id set from a json list, the keys of a json object (e.g. our_q_ids_to_labels.json) or a text file
+    with one Q-id per line"""
+    with open(path, encoding="utf8") as file:
+        if Path(path).suffix == ".json":
+            return set(json.load(file))
+        return {line.strip() for line in file if line.strip()}
+
+
+def main(args: typing.Optional[typing.List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="+", type=Path, help="NECKAr JSONL output files (.gz, .bz2, .xz allowed)")
+    parser.add_argument("--q-ids", type=Path, help="Q-id set to compute the overlap with (.json list/object or text)")
+    parser.add_argument("--wiki-suggestions", action="store_true",
+                        help="compute the overlap with the Q-ids of the wiki suggestion files (see mapping.py)")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--json", action="store_true", help="print the result as json")
+    args = parser.parse_args(args)
+
+    q_ids = None
+    if args.q_ids:
+        q_ids = read_q_ids(args.q_ids)
+    elif args.wiki_suggestions:
+        from mapping import get_our_q_ids
+        q_ids = get_our_q_ids(args.workers)
+
+    # with --json stdout is the json document only
+    log = sys.stderr if args.json else sys.stdout
+    print(f"{datetime.now()} Start", file=log)
+    distribution = count_files(args.inputs, q_ids, args.workers)
+    result = {"records": distribution.records,
+              "neClass": dict(distribution.ne_class.most_common()),
+              "location_type": dict(distribution.location_type.most_common()),
+              "gender": dict(distribution.gender.most_common())}
+    if q_ids is not None:
+        result["overlap"] = {"q_ids": len(q_ids), "found": len(distribution.overlap_q_ids),
+                             "neClass": dict(distribution.overlap_ne_class.most_common())}
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        for key, value in result.items():
+            print(f"{key}: {value}")
+    print(f"{datetime.now()} FIN", file=log)
+
+
+if __name__ == "__main__":
+    main()
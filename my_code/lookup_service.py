@@ -0,0 +1,239 @@
+"""
+Local Q-id lookup service on top of the NECKAr output index (see mapping.create_index_file).
+
+Endpoints (HTTP/1.1, connections are kept alive):
+    POST /lookup        body {"ids": ["Q42", ...], "fields": ["neClass", ...]} (fields optional)
+                        -> {"found": {"Q42": {...}}, "missing": [...]}
+    GET  /lookup/Q42    -> record of Q42 (404 if missing)
+    GET  /stats         -> request counts, cache hits/misses and latency histograms per endpoint
+
+Example:
+    python lookup_service.py --index q_id_to_data.sqlite --port 8765
+"""
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import argparse
+import bisect
+import http.client
+import json
+import threading
+import time
+import typing
+from collections import OrderedDict
+
+from mapping import QIdIndex, Q_ID_INDEX_PATH
+
+LATENCY_BUCKETS_MS = [0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, float("inf")]
+
+
+class LRUCache:
+    """Thread-safe bounded LRU cache Q-id -> record (None for Q-ids that are not in the index)"""
+
+    def __init__(self, maxsize: int = 100000):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, q_ids: typing.Iterable[str]) -> typing.Tuple[typing.Dict[str, object], typing.List[str]]:
+        """Returns the cached records and the Q-ids that are not cached"""
+        found = {}
+        missing = []
+        with self._lock:
+            for q_id in q_ids:
+                if q_id in self._data:
+                    self._data.move_to_end(q_id)
+                    found[q_id] = self._data[q_id]
+                else:
+                    missing.append(q_id)
+            self.hits += len(found)
+            self.misses += len(missing)
+        return found, missing
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def put_many(self, records: typing.Dict[str, object]):
+        with self._lock:
+            for q_id, record in records.items():
+                self._data[q_id] = record
+                self._data.move_to_end(q_id)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = [0] * len(LATENCY_BUCKETS_MS)
+        self.total_ms = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, latency_ms: float):
+        with self._lock:
+            self.counts[bisect.bisect_left(LATENCY_BUCKETS_MS, latency_ms)] += 1
+            self.total_ms += latency_ms
+
+    def to_dict(self) -> typing.Dict[str, object]:
+        with self._lock:
+            requests = sum(self.counts)
+            return {"requests": requests,
+                    "mean_ms": self.total_ms / requests if requests else 0.0,
+                    "buckets_ms": {f"le_{bound}": count for bound, count in zip(LATENCY_BUCKETS_MS, self.counts)}}
+
+
+class LookupService:
+    def __init__(self, index_path: Path = Q_ID_INDEX_PATH, cache_size: int = 100000):
+        self.index = QIdIndex(index_path)
+        self.cache = LRUCache(cache_size)
+        self.latency = {"batch": LatencyHistogram(), "single": LatencyHistogram()}
+
+    def lookup(self, q_ids: typing.List[str]) -> typing.Dict[str, object]:
+        records, missing = self.cache.get_many(q_ids)
+        if missing:
+            fetched = self.index.get_many(missing)
+            fetched.update({q_id: None for q_id in missing if q_id not in fetched})
+            self.cache.put_many(fetched)
+            records.update(fetched)
+        return records
+
+    def stats(self) -> typing.Dict[str, object]:
+        return {"cache": {"size": len(self.cache), "hits": self.cache.hits, "misses": self.cache.misses},
+                "latency": {endpoint: histogram.to_dict() for endpoint, histogram in self.latency.items()}}
+
+
+def _is_str_list(value: object) -> bool:
+    return isinstance(value, list) and all(isinstance(item, str) for item in value)
+
+
+class LookupHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    service: LookupService = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: object):
+        data = json.dumps(body).encode("utf8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        start = time.perf_counter()
+        if self.path == "/stats":
+            self._send_json(200, self.service.stats())
+            return
+        if not self.path.startswith("/lookup/"):
+            self._send_json(404, {"error": "unknown endpoint"})
+            return
+        q_id = self.path[len("/lookup/"):]
+        record = self.service.lookup([q_id])[q_id]
+        if record is None:
+            self._send_json(404, {"error": f"{q_id} not found"})
+        else:
+            self._send_json(200, record)
+        self.service.latency["single"].observe((time.perf_counter() - start) * 1000)
+
+    def do_POST(self):
+        start = time.perf_counter()
+        if self.path != "/lookup":
+            self._send_json(404, {"error": "unknown endpoint"})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            q_ids = request["ids"]
+            fields = request.get("fields")
+        except (ValueError, KeyError, TypeError, AttributeError):
+            q_ids = fields = None
+        if not _is_str_list(q_ids) or (fields is not None and not _is_str_list(fields)):
+            self._send_json(400, {"error": "expected a json body {\"ids\": [str, ...], \"fields\": [str, ...]} "
+                                           "(fields optional)"})
+            return
+        records = self.service.lookup(q_ids)
+        found = {}
+        for q_id, record in records.items():
+            if record is not None:
+                found[q_id] = {f: record[f] for f in fields if f in record} if fields else record
+        self._send_json(200, {"found": found, "missing": [q_id for q_id in q_ids if q_id not in found]})
+        self.service.latency["batch"].observe((time.perf_counter() - start) * 1000)
+
+
+def create_server(index_path: Path = Q_ID_INDEX_PATH, host: str = "127.0.0.1", port: int = 0,
+                  cache_size: int = 100000) -> ThreadingHTTPServer:
+    handler = type("BoundLookupHandler", (LookupHandler,), {"service": LookupService(index_path, cache_size)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_service(index_path: Path = Q_ID_INDEX_PATH, host: str = "127.0.0.1", port: int = 0,
+                  cache_size: int = 100000) -> ThreadingHTTPServer:
+    """Starts the service in a background thread (port 0: any free port, see server.server_address).
+    Stop it with server.shutdown()."""
+    server = create_server(index_path, host, port, cache_size)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class LookupClient:
+    """Client of the lookup service, reuses one keep-alive connection"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8765, batch_size: int = 5000):
+        self.connection = http.client.HTTPConnection(host, port)
+        self.batch_size = batch_size
+
+    def _request(self, method: str, path: str, body: typing.Optional[object] = None) -> typing.Tuple[int, object]:
+        data = json.dumps(body).encode("utf8") if body is not None else None
+        headers = {"Content-Type": "application/json"} if data is not None else {}
+        self.connection.request(method, path, body=data, headers=headers)
+        response = self.connection.getresponse()
+        return response.status, json.loads(response.read())
+
+    def lookup(self, q_ids: typing.Iterable[str],
+               fields: typing.Optional[typing.List[str]] = None) -> typing.Dict[str, typing.Dict[str, object]]:
+        """Returns the records of all given Q-ids that are known to the service"""
+        q_ids = list(q_ids)
+        res = {}
+        for i in range(0, len(q_ids), self.batch_size):
+            body = {"ids": q_ids[i:i + self.batch_size]}
+            if fields:
+                body["fields"] = fields
+            _, response = self._request("POST", "/lookup", body)
+            res.update(response["found"])
+        return res
+
+    def get(self, q_id: str) -> typing.Optional[typing.Dict[str, object]]:
+        status, response = self._request("GET", f"/lookup/{q_id}")
+        return response if status == 200 else None
+
+    def stats(self) -> typing.Dict[str, object]:
+        return self._request("GET", "/stats")[1]
+
+    def close(self):
+        self.connection.close()
+
+
+def main(args: typing.Optional[typing.List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index", type=Path, default=Q_ID_INDEX_PATH, help="index created by create_index_file")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--cache-size", type=int, default=100000, help="maximum number of cached records")
+    args = parser.parse_args(args)
+
+    server = create_server(args.index, args.host, args.port, args.cache_size)
+    print(f"{datetime.now()} Serving {args.index} on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    print(f"{datetime.now()} FIN")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,96 @@
 from datetime import datetime
 from pathlib import Path
 import json
+import os
+import sqlite3
+import threading
 import typing
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 
 ENTITIES_TASK_DIR = r"C:\job\iahlt\tasks\wikidata_entities"
 ONTOLOGY_TASK_DIR = Path(ENTITIES_TASK_DIR, "ontology_mapping")
 WIKI_SUGGESTIONS_DIR = Path(ENTITIES_TASK_DIR, "entities_to_wiki_suggestions")
-def create_mapping_file():
-    json_path = Path(ONTOLOGY_TASK_DIR, "WikidataNE_20170320_NECKAR_1_0.json")
-    data = []
-    with open(json_path, 'r', encoding="utf8") as file:  # 'r'
+NECKAR_OUTPUT_PATH = Path(ONTOLOGY_TASK_DIR, "WikidataNE_20170320_NECKAR_1_0.json")
+Q_ID_INDEX_PATH = Path(ONTOLOGY_TASK_DIR, "q_id_to_data.sqlite")
+WIKI_SUGGESTIONS_CACHE_PATH = Path(WIKI_SUGGESTIONS_DIR, "q_ids_cache.json")
+
+
+def create_index_file(json_path: Path = NECKAR_OUTPUT_PATH, index_path: Path = Q_ID_INDEX_PATH,
+                      batch_size: int = 10000) -> int:
+    """
+    Streams the NECKAr output (one json object per line) into an on-disk key-value index (SQLite) keyed by Q-id.
+    Only batch_size records are held in memory. If a Q-id occurs more than once, the first record is kept.
+    Returns the number of indexed Q-ids.
+    """
+    tmp_path = Path(str(index_path) + ".tmp")
+    if tmp_path.exists():
+        tmp_path.unlink()
+    connection = sqlite3.connect(str(tmp_path))
+    connection.execute("PRAGMA journal_mode=OFF")
+    connection.execute("PRAGMA synchronous=OFF")
+    connection.execute("CREATE TABLE q_id_to_data (q_id TEXT PRIMARY KEY, data TEXT NOT NULL) WITHOUT ROWID")
+    rows = []
+    with open(json_path, 'r', encoding="utf8") as file:
         for line in file:
-            data.append(json.loads(line))
-    print(data)
+            line = line.strip()
+            if not line:
+                continue
+            rows.append((json.loads(line)['id'], line))
+            if len(rows) == batch_size:
+                connection.executemany("INSERT OR IGNORE INTO q_id_to_data VALUES (?, ?)", rows)
+                rows = []
+    connection.executemany("INSERT OR IGNORE INTO q_id_to_data VALUES (?, ?)", rows)
+    connection.commit()
+    count = connection.execute("SELECT COUNT(*) FROM q_id_to_data").fetchone()[0]
+    connection.close()
+    os.replace(tmp_path, index_path)
+    return count
+
+
+class QIdIndex:
+    """
+    Lookup API for the index created by create_index_file. The index file is opened lazily on the first lookup,
+    each thread gets its own read-only connection.
+    """
+    MAX_VARIABLES = 500  # Q-ids per query in get_many
+
+    def __init__(self, index_path: Path = Q_ID_INDEX_PATH):
+        self.index_path = Path(index_path)
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(f"{self.index_path.resolve().as_uri()}?mode=ro", uri=True,
+                                         check_same_thread=False)
+            self._local.connection = connection
+        return connection
+
+    def get(self, q_id: str) -> typing.Optional[typing.Dict[str, object]]:
+        row = self._connection().execute("SELECT data FROM q_id_to_data WHERE q_id = ?", (q_id,)).fetchone()
+        return json.loads(row[0]) if row else None
 
-    q_id_to_data = {}
-    while len(data) > 0:
-        cur_item = data.pop()
-        q_id_to_data[cur_item['id']] = cur_item
+    def get_many(self, q_ids: typing.Iterable[str]) -> typing.Dict[str, typing.Dict[str, object]]:
+        """Returns the records of all given Q-ids that are in the index"""
+        q_ids = list(q_ids)
+        res = {}
+        for i in range(0, len(q_ids), self.MAX_VARIABLES):
+            chunk = q_ids[i:i + self.MAX_VARIABLES]
+            query = f"SELECT q_id, data FROM q_id_to_data WHERE q_id IN ({','.join('?' * len(chunk))})"
+            for q_id, data in self._connection().execute(query, chunk):
+                res[q_id] = json.loads(data)
+        return res
 
-    with open('q_id_to_data.json', 'w') as fp:
-        json.dump(q_id_to_data, fp)
+    def __contains__(self, q_id: str) -> bool:
+        return self._connection().execute("SELECT 1 FROM q_id_to_data WHERE q_id = ?", (q_id,)).fetchone() is not None
+
+    def close(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
 
-def read_mapping_file() -> typing.Dict[str, object]:
-    q_id_to_data_path = Path(ONTOLOGY_TASK_DIR, "q_id_to_data.json")
-    with open(q_id_to_data_path) as json_file:
-        q_id_to_data = json.load(json_file)
-    return q_id_to_data
 
 def read_ids_to_labels_file() -> typing.Dict[str, str]:
     res = {}
@@ -35,35 +98,75 @@ def read_ids_to_labels_file() -> typing.Dict[str, str]:
         res = json.load(json_file)
     return res
 
-def get_our_q_ids() -> typing.Set[str]:
+def read_wiki_suggestions_file(path: Path) -> typing.List[str]:
+    with open(path) as json_file:
+        wiki_suggestions = json.load(json_file)
+    q_ids = set()
+    for v in wiki_suggestions.values():
+        q_ids.update([i["id"] for i in v])
+    return sorted(q_ids)
+
+def get_our_q_ids(workers: typing.Optional[int] = None,
+                  cache_path: Path = WIKI_SUGGESTIONS_CACHE_PATH) -> typing.Set[str]:
+    """
+    Returns the Q-ids of all wiki suggestion files. The Q-ids of each file are cached on disk, keyed by path, size
+    and mtime, so only new or changed files are parsed (by a pool of worker processes).
+    """
+    cache = {}
+    if Path(cache_path).exists():
+        with open(cache_path) as json_file:
+            cache = json.load(json_file)
+
     q_ids = set()
-    for f in WIKI_SUGGESTIONS_DIR.glob("entities_to_wiki_suggestions_*.json"):
-        with open(f) as json_file:
-            wiki_suggestions = json.load(json_file)
-        for v in wiki_suggestions.values():
-            q_ids.update([i["id"] for i in v])
+    new_cache = {}
+    to_parse = []
+    for f in sorted(WIKI_SUGGESTIONS_DIR.glob("entities_to_wiki_suggestions_*.json")):
+        stat = f.stat()
+        key = str(f)
+        cached = cache.get(key)
+        if cached and cached["size"] == stat.st_size and cached["mtime"] == stat.st_mtime_ns:
+            new_cache[key] = cached
+            q_ids.update(cached["q_ids"])
+        else:
+            to_parse.append((key, stat))
+
+    if to_parse:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(read_wiki_suggestions_file, [key for key, _ in to_parse])
+            for (key, stat), file_q_ids in zip(to_parse, results):
+                new_cache[key] = {"size": stat.st_size, "mtime": stat.st_mtime_ns, "q_ids": file_q_ids}
+                q_ids.update(file_q_ids)
+
+    if new_cache != cache:
+        tmp_path = Path(str(cache_path) + ".tmp")
+        with open(tmp_path, 'w') as fp:
+            json.dump(new_cache, fp)
+        os.replace(tmp_path, cache_path)
+    print(f"Wiki suggestion files: {len(new_cache) - len(to_parse)} cache hits, {len(to_parse)} cache misses")
     return q_ids
 
-print(f"{datetime.now()} Start")
 
-should_create_mapping_file = False
-if should_create_mapping_file:
-    create_mapping_file()
+if __name__ == "__main__":
+    print(f"{datetime.now()} Start")
+
+    should_create_index_file = False
+    if should_create_index_file:
+        print(f"{datetime.now()} Indexed {create_index_file()} Q-ids")
 
-our_q_ids = get_our_q_ids()
+    our_q_ids = get_our_q_ids()
 
-should_create_ids_to_labels_file = False
-if should_create_ids_to_labels_file:
-    q_id_to_data = read_mapping_file()
-    our_q_ids_to_labels = {q_id: q_id_to_data[q_id]["neClass"] for q_id in our_q_ids if q_id in q_id_to_data}
-    with open('our_q_ids_to_labels.json', 'w') as fp:
-        json.dump(our_q_ids_to_labels, fp, indent=2)
+    should_create_ids_to_labels_file = False
+    if should_create_ids_to_labels_file:
+        q_id_to_data = QIdIndex().get_many(our_q_ids)
+        our_q_ids_to_labels = {q_id: data["neClass"] for q_id, data in q_id_to_data.items()}
+        with open('our_q_ids_to_labels.json', 'w') as fp:
+            json.dump(our_q_ids_to_labels, fp, indent=2)
 
-our_q_ids_to_labels = read_ids_to_labels_file()
-print(f"Labels count: {Counter(our_q_ids_to_labels.values())}")
-print(f"len(our_q_ids_to_labels): {len(our_q_ids_to_labels)} len(our_q_ids) {len(our_q_ids)}")
+    our_q_ids_to_labels = read_ids_to_labels_file()
+    print(f"Labels count: {Counter(our_q_ids_to_labels.values())}")
+    print(f"len(our_q_ids_to_labels): {len(our_q_ids_to_labels)} len(our_q_ids) {len(our_q_ids)}")
 
 
 
 
-print(f"{datetime.now()} FIN")
+    print(f"{datetime.now()} FIN")
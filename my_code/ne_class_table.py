@@ -0,0 +1,94 @@
+from array import array
+from pathlib import Path
+import json
+import typing
+
+import numpy as np
+
+from mapping import NECKAR_OUTPUT_PATH, ONTOLOGY_TASK_DIR
+
+NE_CLASS_TABLE_PATH = Path(ONTOLOGY_TASK_DIR, "q_id_to_ne_class.npy")
+UNKNOWN_CODE = 0  # Q-ids that are not in the NECKAr output
+
+
+def labels_path(table_path: Path) -> Path:
+    return Path(table_path).with_suffix(".labels.json")
+
+
+def create_ne_class_table(json_path: Path = NECKAR_OUTPUT_PATH, table_path: Path = NE_CLASS_TABLE_PATH) -> int:
+    """
+    Streams the NECKAr output and writes a dense uint8 array indexed by the numeric part of the Q-id
+    (Q42 -> 42) that holds a neClass code, plus a small json file with the code -> neClass table
+    (code 0 is unknown). If a Q-id occurs more than once, the first neClass is kept.
+    Returns the number of Q-ids in the table.
+    """
+    label_to_code = {}
+    numeric_ids = array('Q')
+    codes = array('B')
+    with open(json_path, 'r', encoding="utf8") as file:
+        for line in file:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if not item['id'].startswith("Q"):
+                continue
+            label = item['neClass']
+            if label not in label_to_code:
+                if len(label_to_code) == 255:
+                    raise ValueError(f"Too many neClasses for a uint8 table, {label} can't be added")
+                label_to_code[label] = len(label_to_code) + 1
+            numeric_ids.append(int(item['id'][1:]))
+            codes.append(label_to_code[label])
+
+    numeric_ids = np.frombuffer(numeric_ids, dtype=np.uint64)
+    codes = np.frombuffer(codes, dtype=np.uint8)
+    unique_ids, first_index = np.unique(numeric_ids, return_index=True)
+    size = int(unique_ids[-1]) + 1 if len(unique_ids) else 0
+    table = np.lib.format.open_memmap(table_path, mode='w+', dtype=np.uint8, shape=(size,))
+    table[unique_ids] = codes[first_index]
+    table.flush()
+    del table
+
+    labels = [None] * (len(label_to_code) + 1)
+    for label, code in label_to_code.items():
+        labels[code] = label
+    with open(labels_path(table_path), 'w') as fp:
+        json.dump(labels, fp)
+    return len(unique_ids)
+
+
+class NeClassTable:
+    """
+    Read-only, memory-mapped Q-id -> neClass lookup table created by create_ne_class_table. Opening only maps the
+    file, pages are loaded on demand and shared between processes.
+    """
+
+    def __init__(self, table_path: Path = NE_CLASS_TABLE_PATH):
+        self.codes = np.load(table_path, mmap_mode='r')
+        with open(labels_path(table_path)) as json_file:
+            self.labels = json.load(json_file)
+        self._labels = np.array(self.labels, dtype=object)
+
+    def lookup_codes(self, numeric_ids: np.ndarray) -> np.ndarray:
+        """Vectorized lookup of the codes of numeric Q-ids, ids outside of the table get UNKNOWN_CODE"""
+        numeric_ids = np.asarray(numeric_ids, dtype=np.int64)
+        res = np.full(numeric_ids.shape, UNKNOWN_CODE, dtype=np.uint8)
+        valid = (numeric_ids >= 0) & (numeric_ids < len(self.codes))
+        res[valid] = self.codes[numeric_ids[valid]]
+        return res
+
+    def lookup_many(self, q_ids: typing.Iterable[str]) -> typing.List[typing.Optional[str]]:
+        """Returns the neClass (or None) of each Q-id (e.g. 'Q42')"""
+        numeric_ids = np.fromiter((int(q_id[1:]) for q_id in q_ids), dtype=np.int64)
+        return self._labels[self.lookup_codes(numeric_ids)].tolist()
+
+    def lookup(self, q_id: str) -> typing.Optional[str]:
+        numeric_id = int(q_id[1:])
+        if numeric_id >= len(self.codes):
+            return None
+        return self.labels[self.codes[numeric_id]]
+
+    def counts(self) -> typing.Dict[str, int]:
+        """Number of Q-ids per neClass"""
+        counts = np.bincount(self.codes, minlength=len(self.labels))
+        return {label: int(counts[code]) for code, label in enumerate(self.labels) if label is not None}